@@ -0,0 +1,140 @@
+"""Compact store of the anime information used by the ranking scripts.
+
+The exporters only need a handful of fields per anime, so instead of unpickling
+the full API payload they read a projection table from data/anime.sqlite."""
+
+import pickle
+import sqlite3
+from pathlib import Path
+from typing import Iterable
+
+from models import Anime, AnimeSummary
+
+ANIME_PICKLE = "data/anime"
+ANIME_STORE = "data/anime.sqlite"
+SCHEMA = Path(__file__).resolve().parent / "src" / "queries" / "anime_info_schema.sql"
+MMAP_SIZE = 1 << 28
+
+COLUMNS = ("title", "title_en", "picture", "mean", "rank", "popularity")
+
+
+def summarise_anime(
+    entry: Anime,
+) -> tuple[str, str | None, str | None, float | None, int | None, int | None]:
+    """Return the fields of an anime entry kept in the store."""
+    alt_titles = entry.get("alternative_titles", None)
+    main_picture = entry.get("main_picture", None)
+    return (
+        entry["title"],
+        alt_titles.get("en", None) if alt_titles else None,
+        main_picture["medium"] if main_picture else None,
+        entry.get("mean", None),
+        entry.get("rank", None),
+        entry.get("popularity", None),
+    )
+
+
+def create_store(store_path: str = ANIME_STORE) -> sqlite3.Connection:
+    """Open the store for writing, creating the projection table if needed."""
+    conn = sqlite3.connect(store_path)
+    with SCHEMA.open(encoding="utf-8") as f:
+        conn.executescript(f.read())
+    return conn
+
+
+def save_anime_store(anime: dict[int, Anime], store_path: str = ANIME_STORE) -> None:
+    """Replace the content of the store with the given anime data."""
+    conn = create_store(store_path)
+    with conn:
+        conn.execute("DELETE FROM anime_info")
+        conn.executemany(
+            f"""INSERT INTO anime_info (anime_id, {", ".join(COLUMNS)})
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (
+                (int(anime_id), *summarise_anime(entry))
+                for anime_id, entry in anime.items()
+            ),
+        )
+    conn.close()
+
+
+def build_anime_store(
+    source_path: str = ANIME_PICKLE, store_path: str = ANIME_STORE
+) -> None:
+    """Convert the pickled anime database into the store."""
+    with open(source_path, "rb") as f:
+        anime = pickle.load(f)
+    save_anime_store(anime, store_path)
+
+
+def refresh_anime_store(store_path: str = ANIME_STORE) -> None:
+    """Rebuild the store from the full anime tables of the same database."""
+    conn = create_store(store_path)
+    with conn:
+        conn.execute("DELETE FROM anime_info")
+        conn.execute(
+            f"""INSERT INTO anime_info (anime_id, {", ".join(COLUMNS)})
+            SELECT a.anime_id, a.title, a.title_en, mp.medium, a.mean, a.rank, a.popularity
+            FROM anime a
+            LEFT JOIN main_picture mp ON a.anime_id = mp.anime_id"""
+        )
+    conn.close()
+
+
+def get_store_connection(store_path: str = ANIME_STORE) -> sqlite3.Connection:
+    """Open the store read-only, memory-mapping the database file."""
+    conn = sqlite3.connect(f"file:{store_path}?mode=ro", uri=True)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return conn
+
+
+def load_anime_info(
+    anime_ids: Iterable[int] | None = None, store_path: str = ANIME_STORE
+) -> dict[int, AnimeSummary]:
+    """Return the stored information of the given anime, or of all of them."""
+    conn = get_store_connection(store_path)
+    query = f"SELECT anime_id, {', '.join(COLUMNS)} FROM anime_info"
+    if anime_ids is None:
+        rows = conn.execute(query).fetchall()
+    else:
+        conn.execute("CREATE TEMP TABLE ids (anime_id INTEGER PRIMARY KEY)")
+        conn.executemany(
+            "INSERT OR IGNORE INTO ids VALUES (?)", ((int(i),) for i in anime_ids)
+        )
+        rows = conn.execute(
+            f"{query} WHERE anime_id IN (SELECT anime_id FROM ids)"
+        ).fetchall()
+    conn.close()
+    return {
+        anime_id: AnimeSummary(
+            title=title,
+            title_en=title_en,
+            picture=picture,
+            mean=mean,
+            rank=rank,
+            popularity=popularity,
+        )
+        for anime_id, title, title_en, picture, mean, rank, popularity in rows
+    }
+
+
+def load_titles(
+    anime_ids: Iterable[int] | None = None, store_path: str = ANIME_STORE
+) -> dict[int, str]:
+    """Return the titles of the given anime, or of all of them."""
+    return {
+        anime_id: info["title"]
+        for anime_id, info in load_anime_info(anime_ids, store_path).items()
+    }
+
+
+def load_anime_ids(store_path: str = ANIME_STORE) -> set[int]:
+    """Return the IDs of all the anime in the store."""
+    conn = get_store_connection(store_path)
+    ids = {row[0] for row in conn.execute("SELECT anime_id FROM anime_info")}
+    conn.close()
+    return ids
+
+
+if __name__ == "__main__":
+    build_anime_store()
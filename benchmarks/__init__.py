@@ -0,0 +1 @@
+"""Benchmarks of the ranking pipeline on synthetic MAL-shaped samples."""
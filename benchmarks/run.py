@@ -0,0 +1,270 @@
+"""Time the stages of the ranking pipeline on synthetic samples.
+
+Each stage is run once to measure time and, unless disabled, once more under
+tracemalloc to measure its peak memory. Results are appended to a JSON history,
+and compared with the previous record at the same scale.
+
+Run from the root of the repository:
+    python -m benchmarks.run --scales 200x500 1000x2000"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, TypedDict
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+# pylint: disable=wrong-import-position
+import numpy as np
+
+from benchmarks.synthetic import generate_sample
+from bootstrap import build_table, compact_users, restrict_sample
+from mal_rankings import convert_parameter_for_website
+from models import AnimeSummary
+from utils import (
+    build_id_lookup,
+    create_table,
+    get_anime_ids_from_sample,
+    iterate_parameter,
+    load_samples,
+    setup_bradley_terry,
+    yield_samples,
+)
+
+HISTORY_PATH = "data/benchmarks.json"
+SCALES = ("200x500", "1000x2000")
+NUM_ITERATIONS = 5
+NUM_FILES = 4
+
+
+class Measurement(TypedDict):
+    seconds: float
+    peak_bytes: int | None
+    items: int
+    throughput: float
+
+
+def measure(
+    func: Callable[[], Any], items: int, memory: bool = True
+) -> tuple[Any, Measurement]:
+    """Run func, returning its result with its duration and peak memory.
+
+    Throughput is the number of items processed per second."""
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, Measurement(
+        seconds=seconds,
+        peak_bytes=peak,
+        items=items,
+        throughput=items / seconds if seconds else float("inf"),
+    )
+
+
+def write_sample_files(sample: dict[int, Any], directory: str) -> list[str]:
+    """Split a sample into JSON files, as saved by the scraper."""
+    users = list(sample)
+    filenames = []
+    for i in range(NUM_FILES):
+        filename = f"{directory}/sample_{i}.json"
+        with open(filename, "w", encoding="utf8") as f:
+            json.dump({u: sample[u] for u in users[i::NUM_FILES]}, f)
+        filenames.append(filename)
+    return filenames
+
+
+def run_scale(
+    num_users: int,
+    num_anime: int,
+    num_iter: int = NUM_ITERATIONS,
+    memory: bool = True,
+    seed: int = 0,
+) -> dict[str, Measurement]:
+    """Benchmark every stage of the pipeline on one synthetic sample."""
+    stages: dict[str, Measurement] = {}
+    generated = generate_sample(num_users, num_anime, seed=seed)
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = write_sample_files(generated, directory)
+        sample, stages["load_samples"] = measure(
+            lambda: load_samples(*filenames), num_users, memory
+        )
+        anime_ids = get_anime_ids_from_sample(sample)
+        id_to_order = {j: i for i, j in enumerate(sorted(anime_ids))}
+        _, stages["stream_table"] = measure(
+            lambda: build_table(
+                restrict_sample(
+                    compact_users(yield_samples(*filenames)),
+                    build_id_lookup(np.array(sorted(anime_ids))),
+                ),
+                len(id_to_order),
+            ),
+            num_users,
+            memory,
+        )
+    order_to_id = dict(enumerate(sorted(anime_ids)))
+    table, stages["create_table"] = measure(
+        lambda: create_table(
+            size=len(id_to_order), id_to_order=id_to_order, sample=sample, save=False
+        ),
+        num_users,
+        memory,
+    )
+    (p, mt, w, _, new_to_old), stages["setup_bradley_terry"] = measure(
+        lambda: setup_bradley_terry(matrix=table, sample=sample, io_map=id_to_order),
+        len(id_to_order),
+        memory,
+    )
+
+    def iterate() -> Any:
+        q = p
+        for _ in range(num_iter):
+            q = iterate_parameter(p=q, mt=mt, w=w)
+        return q
+
+    p_fit, stages["iterate_parameter"] = measure(iterate, num_iter, memory)
+    f = {i: order_to_id[j] for i, j in new_to_old.items()}
+    mal = {
+        anime_id: AnimeSummary(
+            title=str(anime_id),
+            title_en=None,
+            picture=None,
+            mean=None,
+            rank=None,
+            popularity=None,
+        )
+        for anime_id in anime_ids
+    }
+    e = np.zeros_like(p_fit)
+    _, stages["convert_parameter_for_website"] = measure(
+        lambda: convert_parameter_for_website(
+            p=p_fit, mt=mt, f=f, mal=mal, sample=sample, e=e
+        ),
+        p_fit.shape[0],
+        memory,
+    )
+    return stages
+
+
+def get_commit() -> str:
+    """Return the current git commit, if available."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(path: str) -> list[dict[str, Any]]:
+    """Return the previous benchmark records."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf8") as f:
+        return json.load(f)
+
+
+def compare(
+    stages: dict[str, Measurement], previous: dict[str, Measurement] | None
+) -> None:
+    """Display the measurements, relative to the previous ones if any."""
+    for name, measurement in stages.items():
+        line = f"{name:32} {measurement['seconds']:10.3f}s"
+        if measurement["peak_bytes"] is not None:
+            line += f" {measurement['peak_bytes'] / 2**20:10.1f}MiB"
+        if previous and name in previous and previous[name]["seconds"]:
+            ratio = measurement["seconds"] / previous[name]["seconds"]
+            line += f"  x{ratio:.2f} vs previous"
+        print(line)
+
+
+def main(
+    scales: list[str],
+    num_iter: int = NUM_ITERATIONS,
+    memory: bool = True,
+    history_path: str = HISTORY_PATH,
+) -> None:
+    """Benchmark all the given scales and update the history."""
+    history = load_history(history_path)
+    for scale in scales:
+        num_users, num_anime = map(int, scale.split("x"))
+        print(f"Scale: {num_users} users, {num_anime} anime")
+        stages = run_scale(num_users, num_anime, num_iter=num_iter, memory=memory)
+        previous = next(
+            (
+                record["stages"]
+                for record in reversed(history)
+                if record["scale"] == scale
+            ),
+            None,
+        )
+        compare(stages, previous)
+        history.append(
+            {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "commit": get_commit(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "scale": scale,
+                "stages": stages,
+            }
+        )
+    Path(history_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "w", encoding="utf8") as f:
+        json.dump(history, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--scales",
+        metavar="S",
+        type=str,
+        nargs="+",
+        default=list(SCALES),
+        help=f"scales as USERSxANIME, default={' '.join(SCALES)}",
+    )
+    parser.add_argument(
+        "-n",
+        "--number",
+        metavar="N",
+        type=int,
+        default=NUM_ITERATIONS,
+        help=f"number of iterations of the parameters, default={NUM_ITERATIONS}",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="skip the measurement of peak memory",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="O",
+        type=str,
+        default=HISTORY_PATH,
+        help=f"JSON history of the results, default={HISTORY_PATH}",
+    )
+    args = parser.parse_args()
+    main(
+        scales=args.scales,
+        num_iter=args.number,
+        memory=not args.no_memory,
+        history_path=args.output,
+    )
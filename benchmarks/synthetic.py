@@ -0,0 +1,72 @@
+"""Generate synthetic samples shaped like MAL users' lists.
+
+Anime popularity follows a Zipf-like law and list sizes a log-normal distribution,
+both roughly matching the scraped samples. Scores depend on a hidden quality of each
+anime plus a per-user bias, so that the resulting ranking is not random."""
+
+from datetime import UTC, datetime
+
+import numpy as np
+
+from models import ListNode, ListStatus, UserList, UserListEntry
+from utils import MIN_LIST_SIZE
+
+POPULARITY_EXPONENT = 1.1
+LIST_SIZE_MEDIAN = 120
+LIST_SIZE_SIGMA = 1.0
+STATUS_WEIGHTS = {
+    "completed": 0.7,
+    "dropped": 0.06,
+    "watching": 0.06,
+    "on_hold": 0.04,
+    "plan_to_watch": 0.14,
+}
+UNSCORED_PCT = 0.1
+FIRST_UPDATE = datetime(2008, 1, 1, tzinfo=UTC).timestamp()
+LAST_UPDATE = datetime(2024, 1, 1, tzinfo=UTC).timestamp()
+
+
+def generate_sample(
+    num_users: int, num_anime: int, seed: int = 0
+) -> dict[int, UserList]:
+    """Return a synthetic sample of num_users lists over num_anime anime."""
+    rng = np.random.default_rng(seed)
+    anime_ids = np.sort(rng.choice(num_anime * 2, size=num_anime, replace=False)) + 1
+    popularity = 1 / np.arange(1, num_anime + 1) ** POPULARITY_EXPONENT
+    popularity = rng.permutation(popularity / popularity.sum())
+    quality = rng.normal(7, 1, num_anime)
+    sizes = np.clip(
+        rng.lognormal(np.log(LIST_SIZE_MEDIAN), LIST_SIZE_SIGMA, num_users).astype(int),
+        MIN_LIST_SIZE,
+        num_anime,
+    )
+    statuses = list(STATUS_WEIGHTS)
+    status_p = np.array(list(STATUS_WEIGHTS.values()))
+    sample: dict[int, UserList] = {}
+    for user, size in enumerate(sizes.tolist(), start=1):
+        chosen = rng.choice(num_anime, size=size, replace=False, p=popularity)
+        bias = rng.normal(0, 1)
+        scores = np.clip(
+            np.rint(quality[chosen] + bias + rng.normal(0, 1, size)), 1, 10
+        ).astype(int)
+        scores[rng.random(size) < UNSCORED_PCT] = 0
+        status = rng.choice(len(statuses), size=size, p=status_p)
+        updated = rng.uniform(FIRST_UPDATE, LAST_UPDATE, size)
+        sample[user] = [
+            UserListEntry(
+                node=ListNode(
+                    id=int(anime_ids[a]), title="", main_picture={"medium": ""}
+                ),
+                list_status=ListStatus(
+                    status=statuses[s],
+                    score=int(r) if statuses[s] != "plan_to_watch" else 0,
+                    num_watched_episodes=0,
+                    is_rewatching=False,
+                    updated_at=datetime.fromtimestamp(t, UTC).isoformat(),
+                ),
+            )
+            for a, s, r, t in zip(
+                chosen.tolist(), status.tolist(), scores.tolist(), updated.tolist()
+            )
+        ]
+    return sample
@@ -0,0 +1,327 @@
+"""Bootstrap confidence intervals for the parameters of the Bradley-Terry model.
+
+Users are resampled with replacement. The table of each replicate is assembled from a
+cached compact copy of the relevant entries of every user, and the parameters are
+refitted starting from those of the full sample."""
+
+import glob
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+from tqdm import tqdm
+
+from models import UserList
+from utils import (
+    Counts,
+    count_dtype,
+    get_last_checkpoint,
+    iterate_parameter,
+    load_id_maps,
+    translate_ids,
+    yield_samples,
+)
+
+USERS_FILE = "users.npz"
+BOOTSTRAP_DIR = "bootstrap"
+NUM_REPLICATES = 100
+NUM_ITERATIONS = 50
+CONFIDENCE = 0.95
+STATUS_CODES = {"completed": 1, "dropped": 2}
+
+
+class CompactSample(NamedTuple):
+    """Relevant entries of every user, stored contiguously.
+
+    The entries of user u are those between offsets[u] and offsets[u + 1],
+    updated[u] is the time of the latest update of their list, in seconds."""
+
+    offsets: NDArray[np.int64]
+    anime: NDArray[np.int32]
+    score: NDArray[np.int8]
+    status: NDArray[np.int8]
+    updated: NDArray[np.int64]
+
+
+def compact_users(users: Iterable[tuple[int, UserList]]) -> CompactSample:
+    """Return the entries of the given users, with their anime IDs.
+
+    Plan to watch entries are skipped, and entries neither completed nor dropped
+    have status 0. Users are consumed one at a time, so they can be streamed from
+    the sample files; if a user appears more than once, only its last list is kept,
+    as in utils.load_samples."""
+    # Typed buffers hold the entries as machine integers, not Python objects.
+    offsets = array("q", [0])
+    user_ids = array("q")
+    updated = array("q")
+    anime = array("i")
+    score = array("b")
+    status = array("b")
+    for user_id, user_list in users:
+        seen: set[int] = set()
+        # Timestamps have the same ISO format, so the latest is the largest string.
+        latest = max((e["list_status"]["updated_at"] for e in user_list), default="")
+        updated.append(int(datetime.fromisoformat(latest).timestamp()) if latest else 0)
+        for entry in user_list:
+            anime_id = entry["node"]["id"]
+            if entry["list_status"]["status"] == "plan_to_watch" or anime_id in seen:
+                continue
+            seen.add(anime_id)
+            anime.append(anime_id)
+            score.append(entry["list_status"]["score"])
+            status.append(STATUS_CODES.get(entry["list_status"]["status"], 0))
+        offsets.append(len(anime))
+        user_ids.append(int(user_id))
+    compact = CompactSample(
+        offsets=np.frombuffer(offsets, dtype=np.int64),
+        anime=np.frombuffer(anime, dtype=np.int32),
+        score=np.frombuffer(score, dtype=np.int8),
+        status=np.frombuffer(status, dtype=np.int8),
+        updated=np.frombuffer(updated, dtype=np.int64),
+    )
+    ids = np.frombuffer(user_ids, dtype=np.int64)
+    # Index of the last occurrence of each user.
+    last = ids.shape[0] - 1 - np.unique(ids[::-1], return_index=True)[1]
+    if last.shape[0] == ids.shape[0]:
+        return compact
+    keep = np.zeros(ids.shape[0], dtype=np.bool_)
+    keep[last] = True
+    return select_users(compact, keep)
+
+
+def select_entries(compact: CompactSample, mask: NDArray[np.bool_]) -> CompactSample:
+    """Return the compact sample with only the entries in mask."""
+    counts = np.concatenate(([0], np.cumsum(mask)))
+    return CompactSample(
+        offsets=counts[compact.offsets],
+        anime=compact.anime[mask],
+        score=compact.score[mask],
+        status=compact.status[mask],
+        updated=compact.updated,
+    )
+
+
+def select_users(compact: CompactSample, keep: NDArray[np.bool_]) -> CompactSample:
+    """Return the compact sample with only the users in keep."""
+    compact = select_entries(compact, np.repeat(keep, np.diff(compact.offsets)))
+    return compact._replace(
+        offsets=compact.offsets[np.concatenate(([True], keep))],
+        updated=compact.updated[keep],
+    )
+
+
+def restrict_sample(
+    compact: CompactSample, id_to_order: NDArray[np.int32]
+) -> CompactSample:
+    """Return the completed and dropped entries of the anime in id_to_order.
+
+    compact has anime IDs, as returned by compact_users, and id_to_order is a dense
+    lookup as returned by utils.build_id_lookup; the result has indices instead.
+    Users without entries left are kept, with no entries."""
+    orders = translate_ids(id_to_order, compact.anime)
+    mask = (compact.status > 0) & (orders >= 0)
+    return select_entries(compact, mask)._replace(anime=orders[mask])
+
+
+def compact_sample(
+    sample: dict[int, UserList], id_to_order: dict[int, int]
+) -> CompactSample:
+    """Return the completed and dropped entries of the anime in id_to_order."""
+    lookup = np.full(max(id_to_order, default=0) + 1, -1, dtype=np.int32)
+    lookup[list(id_to_order)] = list(id_to_order.values())
+    return restrict_sample(compact_users(sample.items()), lookup)
+
+
+def save_compact_sample(compact: CompactSample, path: str) -> None:
+    """Save a compact sample to disk."""
+    with open(path, "wb") as f:
+        np.savez(f, **compact._asdict())
+
+
+def load_compact_sample(path: str) -> CompactSample:
+    """Load a compact sample from disk.
+
+    Samples saved without update times have all of them set to 0."""
+    with np.load(path) as data:
+        arrays = {k: data[k] for k in CompactSample._fields if k in data}
+    arrays.setdefault("updated", np.zeros(arrays["offsets"].shape[0] - 1, np.int64))
+    return CompactSample(**arrays)
+
+
+def compare_entries(
+    score: NDArray[np.int8], status: NDArray[np.int8]
+) -> NDArray[np.bool_]:
+    """Return the matrix of wins among the entries of a single user.
+
+    Same criteria as utils.compare_filtered_entries:
+    a higher score wins, otherwise completed beats dropped."""
+    higher = (score[:, np.newaxis] > score) & (score > 0)
+    completed_over_dropped = (status[:, np.newaxis] == 1) & (status == 2)
+    return higher | (~higher.T & completed_over_dropped)
+
+
+def build_table(
+    compact: CompactSample,
+    size: int,
+    counts: NDArray[np.uint32] | None = None,
+) -> NDArray[np.uint]:
+    """Return the table of the sample where user u is counted counts[u] times."""
+    num_users = compact.offsets.shape[0] - 1
+    if counts is None:
+        counts = np.ones(num_users, dtype=np.uint32)
+    # Each user compares a pair at most once, so table + table.T fits too.
+    table = np.zeros((size, size), dtype=count_dtype(int(np.sum(counts))))
+    for user in np.flatnonzero(counts):
+        entries = slice(compact.offsets[user], compact.offsets[user + 1])
+        anime = compact.anime[entries]
+        rows, cols = np.nonzero(
+            compare_entries(compact.score[entries], compact.status[entries])
+        )
+        # Entries of a user are distinct, so the pairs have no repetitions.
+        table[anime[rows], anime[cols]] += counts[user].astype(table.dtype)
+    return table
+
+
+def user_periods(compact: CompactSample) -> NDArray[np.int64]:
+    """Return the year of the latest update of each user."""
+    years = compact.updated.astype("datetime64[s]").astype("datetime64[Y]")
+    return years.astype(np.int64) + 1970
+
+
+# Table of a sample where user u is counted counts[u] times, as build_table.
+TableBuilder = Callable[[CompactSample, int, NDArray[np.uint32]], Counts]
+
+_shared: tuple[CompactSample, NDArray[np.floating[Any]], int, TableBuilder]
+
+
+def _init_worker(
+    compact: CompactSample,
+    p: NDArray[np.floating[Any]],
+    num_iter: int,
+    build: TableBuilder,
+) -> None:
+    """Share the compact sample and the starting parameters with a worker."""
+    global _shared  # pylint: disable=global-statement
+    _shared = (compact, p, num_iter, build)
+
+
+def fit_replicate(seed: int) -> NDArray[np.floating[Any]]:
+    """Return the parameters fitted on the users resampled with the given seed."""
+    compact, p, num_iter, build = _shared
+    num_users = compact.offsets.shape[0] - 1
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(
+        rng.integers(0, num_users, num_users), minlength=num_users
+    ).astype(np.uint32)
+    table = build(compact, p.shape[0], counts)
+    mt = table + table.T
+    w = np.sum(table, axis=1)
+    for _ in range(num_iter):
+        p = iterate_parameter(p=p, mt=mt, w=w)
+    return p
+
+
+def get_compact_sample(path: str, sample_path: str) -> CompactSample:
+    """Return the compact sample of a run, creating the cache if needed."""
+    users_path = f"{path}/{USERS_FILE}"
+    if os.path.exists(users_path):
+        return load_compact_sample(users_path)
+    _, id_to_order = load_id_maps(path, "reduced_")
+    compact = restrict_sample(
+        compact_users(yield_samples(*glob.glob(sample_path))), id_to_order
+    )
+    save_compact_sample(compact, users_path)
+    return compact
+
+
+def run_bootstrap(
+    path: str,
+    sample_path: str,
+    num_replicates: int = NUM_REPLICATES,
+    num_iter: int = NUM_ITERATIONS,
+    num_workers: int = 1,
+    window: tuple[int, int] | None = None,
+    build: TableBuilder = build_table,
+) -> None:
+    """Fit the missing replicates of a run, saving each as soon as it is done.
+
+    Replicate k uses seed k, so an interrupted run can be resumed.
+    If the run has a window of years, only its users are resampled.
+    The tables of the replicates are built by build, which must match the table
+    of the run (e.g. its comparison rule)."""
+    compact = get_compact_sample(path, sample_path)
+    if window is not None:
+        years = user_periods(compact)
+        compact = select_users(compact, (years >= window[0]) & (years <= window[1]))
+    checkpoint = get_last_checkpoint(path)
+    if checkpoint is None:
+        raise FileNotFoundError(f"{path} has no checkpoints, iterate it first")
+    with open(checkpoint[1], "rb") as f:
+        p = np.load(f)
+    Path(f"{path}/{BOOTSTRAP_DIR}").mkdir(exist_ok=True)
+    seeds = [
+        seed
+        for seed in range(num_replicates)
+        if not os.path.exists(f"{path}/{BOOTSTRAP_DIR}/replicate_{seed}.npy")
+    ]
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(compact, p, num_iter, build),
+    ) as executor:
+        for seed, p_replicate in tqdm(
+            zip(seeds, executor.map(fit_replicate, seeds)), total=len(seeds)
+        ):
+            with open(f"{path}/{BOOTSTRAP_DIR}/replicate_{seed}.npy", "wb") as f:
+                np.save(f, p_replicate)
+
+
+def load_replicates(path: str) -> NDArray[np.floating[Any]] | None:
+    """Return the parameters of all the replicates of a run, one per row."""
+    filenames = glob.glob(f"{path}/{BOOTSTRAP_DIR}/replicate_*.npy")
+    if not filenames:
+        return None
+    return np.stack([np.load(filename) for filename in filenames])
+
+
+def compute_ranks(parameters: NDArray[np.floating[Any]]) -> NDArray[np.int_]:
+    """Return the rank (starting from 1) of each entry in each row."""
+    order = np.argsort(-parameters, axis=1, kind="stable")
+    ranks = np.empty(parameters.shape, dtype=np.int_)
+    np.put_along_axis(
+        ranks, order, np.arange(1, parameters.shape[1] + 1)[np.newaxis], axis=1
+    )
+    return ranks
+
+
+def bootstrap_intervals(
+    parameters: NDArray[np.floating[Any]],
+    confidence: float = CONFIDENCE,
+    mask: NDArray[np.bool_] | None = None,
+) -> dict[str, NDArray[Any]]:
+    """Return the percentile intervals of parameters and ranks of each entry.
+
+    If mask is given, only the entries in mask are ranked, as in the published
+    list; the rank intervals of the others are 0."""
+    quantiles = ((1 - confidence) / 2, (1 + confidence) / 2)
+    parameter_low, parameter_high = np.quantile(parameters, quantiles, axis=0)
+    if mask is None:
+        mask = np.ones(parameters.shape[1], dtype=np.bool_)
+    ranks = compute_ranks(parameters[:, mask])
+    rank_low = np.zeros(parameters.shape[1], dtype=np.int_)
+    rank_high = np.zeros(parameters.shape[1], dtype=np.int_)
+    # The best rank is the smallest one.
+    rank_low[mask], rank_high[mask] = np.quantile(
+        ranks, quantiles, axis=0, method="inverted_cdf"
+    ).astype(np.int_)
+    return {
+        "parameter_low": parameter_low,
+        "parameter_high": parameter_high,
+        "rank_low": rank_low,
+        "rank_high": rank_high,
+    }
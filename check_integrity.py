@@ -2,42 +2,186 @@
 
 Compare users' sampled data with anime sample data to make sure the anime IDs line up.
 Specifically, the anime scraper may have received an incorrect response, or
-raised an exception when scraping the information about an ID."""
+raised an exception when scraping the information about an ID.
 
+The anime of the sample are streamed into a compact index with the number of lists
+of each anime, and checked against the anime database with a single anti-join.
+Each anime is put in one category:
+    ok       in the projection read by the ranking scripts
+    stale    scraped, but missing from the projection (fixed by refreshing it)
+    deleted  the API answered 404, nothing to do
+    failed   the last API call failed
+    missing  never requested
+Failed and missing anime are written to the backfill queue, one ID per line, the
+anime in most lists first, for the anime crawler (src/scraper_anime.py) to consume.
+"""
+
+import argparse
 import glob
-import pickle
+import os
+import sqlite3
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
 
+from anime_store import ANIME_STORE, get_store_connection, refresh_anime_store
+from bootstrap import compact_users
 from mal_rankings import SAMPLE_PATH
-from utils import FILE_ANIME_DB, load_samples
+from utils import yield_samples
+
+API_STORE = "data/api.sqlite"
+BACKFILL_QUEUE = "data/backfill_queue.txt"
+CATEGORIES = ("ok", "stale", "deleted", "failed", "missing")
+QUEUED = ("failed", "missing")
+
+
+class SampleAnime(NamedTuple):
+    """IDs of the anime in the sample, with the number of lists containing them."""
+
+    anime_ids: NDArray[np.int32]
+    num_lists: NDArray[np.int64]
+
+
+class IntegrityReport(NamedTuple):
+    """Category of each anime of the sample, and the backfill queue."""
+
+    categories: dict[int, str]
+    queue: list[int]
+
+    def counts(self) -> dict[str, int]:
+        """Return the number of anime in each category."""
+        counter = Counter(self.categories.values())
+        return {category: counter[category] for category in CATEGORIES}
+
+
+def get_sample_anime(path_name: str = SAMPLE_PATH) -> SampleAnime:
+    """Return the anime that appear in users' lists, streaming the sample files.
+
+    Plan to watch entries are skipped, as in the tables of the rankings."""
+    compact = compact_users(yield_samples(*glob.glob(path_name)))
+    anime_ids, num_lists = np.unique(compact.anime, return_counts=True)
+    return SampleAnime(anime_ids, num_lists)
+
+
+def has_table(conn: sqlite3.Connection, name: str, schema: str = "main") -> bool:
+    """Return whether a table exists in a database of the connection."""
+    query = f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?"
+    return conn.execute(query, (name,)).fetchone() is not None
+
+
+def categorise(
+    conn: sqlite3.Connection, sample: SampleAnime, api_schema: str | None = None
+) -> IntegrityReport:
+    """Return the category of each anime of the sample.
+
+    The full anime table is used to tell stale anime from missing ones if it is in
+    the database, and the API calls in api_schema (an attached database) to tell
+    deleted and failed anime."""
+    conn.execute(
+        """CREATE TEMP TABLE sample_anime (
+            anime_id INTEGER PRIMARY KEY, num_lists INTEGER NOT NULL)"""
+    )
+    conn.executemany(
+        "INSERT INTO sample_anime VALUES (?, ?)",
+        zip(sample.anime_ids.tolist(), sample.num_lists.tolist()),
+    )
+    scraped = (
+        "EXISTS (SELECT 1 FROM anime a WHERE a.anime_id = s.anime_id)"
+        if has_table(conn, "anime")
+        else "0"
+    )
+    response = (
+        f"""(SELECT c.response FROM {api_schema}.api_call c
+        WHERE c.endpoint = 'anime' AND c.element_id = s.anime_id)"""
+        if api_schema
+        else "NULL"
+    )
+    rows = conn.execute(
+        f"""SELECT s.anime_id,
+            CASE
+                WHEN i.anime_id IS NOT NULL THEN 'ok'
+                WHEN {scraped} THEN 'stale'
+                WHEN {response} = 404 THEN 'deleted'
+                WHEN {response} IS NOT NULL THEN 'failed'
+                ELSE 'missing'
+            END
+        FROM sample_anime s
+        LEFT JOIN anime_info i ON i.anime_id = s.anime_id
+        ORDER BY s.num_lists DESC, s.anime_id"""
+    ).fetchall()
+    conn.execute("DROP TABLE temp.sample_anime")
+    categories = dict(rows)
+    queue = [anime_id for anime_id, category in rows if category in QUEUED]
+    return IntegrityReport(categories, queue)
 
 
-def get_anime_ids_from_sample(path_name: str = SAMPLE_PATH) -> set[int]:
-    """Retrieve the anime IDs that appear in users' lists."""
-    paths = glob.glob(path_name)
-    sample = load_samples(*paths)
-    sample_anime_ids = {
-        entry["node"]["id"] for _, user_data in sample.items() for entry in user_data
-    }
-    return sample_anime_ids
+def check_integrity(
+    sample: SampleAnime, store_path: str = ANIME_STORE, api_path: str = API_STORE
+) -> IntegrityReport:
+    """Return the categories of the anime of the sample in the store."""
+    conn = get_store_connection(store_path)
+    try:
+        api_schema = None
+        if os.path.exists(api_path):
+            conn.execute("ATTACH DATABASE ? AS api", (f"file:{api_path}?mode=ro",))
+            if has_table(conn, "api_call", "api"):
+                api_schema = "api"
+        return categorise(conn, sample, api_schema)
+    finally:
+        conn.close()
 
 
-def get_anime_ids_from_db(path_name: str = FILE_ANIME_DB) -> set[int]:
-    """Retrieve the anime IDs that appear in the db."""
-    with open(path_name, "rb") as f:
-        anime_info = pickle.load(f)
-    db_anime_ids = set(map(int, anime_info.keys()))
-    return db_anime_ids
+def save_queue(queue: list[int], path: str = BACKFILL_QUEUE) -> None:
+    """Write the backfill queue, one anime ID per line."""
+    with open(path, "w", encoding="utf8") as f:
+        f.writelines(f"{anime_id}\n" for anime_id in queue)
 
 
-def main() -> None:
+def main(
+    sample_path: str = SAMPLE_PATH,
+    store_path: str = ANIME_STORE,
+    api_path: str = API_STORE,
+    queue_path: str = BACKFILL_QUEUE,
+    refresh: bool = True,
+) -> IntegrityReport:
     """Run the check.
 
-    Display mismatches on screen."""
-    sample_anime_ids = get_anime_ids_from_sample()
-    db_anime_ids = get_anime_ids_from_db()
-    diff = sample_anime_ids.difference(db_anime_ids)
-    print(diff)
+    Display the number of anime in each category, refresh the projection if some
+    anime are stale, and write the backfill queue."""
+    sample = get_sample_anime(sample_path)
+    report = check_integrity(sample, store_path, api_path)
+    counts = report.counts()
+    print(", ".join(f"{category}: {num}" for category, num in counts.items()))
+    if refresh and counts["stale"]:
+        refresh_anime_store(store_path)
+        report = check_integrity(sample, store_path, api_path)
+        print(f"Projection refreshed, {report.counts()['stale']} stale anime left")
+    save_queue(report.queue, queue_path)
+    print(f"{len(report.queue)} anime queued in {queue_path}")
+    return report
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sample", type=str, default=SAMPLE_PATH, help=f"default={SAMPLE_PATH}"
+    )
+    parser.add_argument(
+        "--store", type=str, default=ANIME_STORE, help=f"default={ANIME_STORE}"
+    )
+    parser.add_argument(
+        "--api", type=str, default=API_STORE, help=f"default={API_STORE}"
+    )
+    parser.add_argument(
+        "--queue", type=str, default=BACKFILL_QUEUE, help=f"default={BACKFILL_QUEUE}"
+    )
+    parser.add_argument(
+        "--refresh",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="refresh the projection if some anime are stale",
+    )
+    args = parser.parse_args()
+    main(args.sample, args.store, args.api, args.queue, args.refresh)
@@ -0,0 +1,154 @@
+"""Rules deciding which entries of a user's list win over the others.
+
+Each rule maps the scores and statuses of the entries of a user to the matrix of
+weights of the win of each entry over each other. Several rules are evaluated
+in the same pass over the users, each giving its own table.
+Users can also be weighted by the number of their comparisons, so that users with
+long lists do not dominate the fit; weighted tables have fractional counts."""
+
+from typing import Any, Callable, Iterable, NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+from bootstrap import CompactSample, compare_entries
+from utils import Counts, count_dtype
+
+DEFAULT_RULE = "default"
+
+Comparison = Callable[[NDArray[np.int8], NDArray[np.int8]], NDArray[Any]]
+
+
+class ComparisonRule(NamedTuple):
+    """Comparison of the entries of a user, with the largest weight of a win."""
+
+    compare: Comparison
+    max_weight: int
+
+
+RULES: dict[str, ComparisonRule] = {}
+# Weight of a user as a function of the total weight of their wins, so that each user
+# contributes a total of 1 (unit) or the square root of their total (sqrt).
+WEIGHTINGS: dict[str, Callable[[float], float]] = {
+    "unit": lambda total_weight: 1 / total_weight,
+    "sqrt": lambda total_weight: 1 / np.sqrt(total_weight),
+}
+
+
+def table_name(rule: str, weighting: str | None = None) -> str:
+    """Return the name of the table of a rule with a weighting of users."""
+    return rule if weighting is None else f"{rule}-{weighting}"
+
+
+def register_rule(name: str, max_weight: int = 1) -> Callable[[Comparison], Comparison]:
+    """Add the decorated comparison to the registry of rules."""
+
+    def register(compare: Comparison) -> Comparison:
+        RULES[name] = ComparisonRule(compare, max_weight)
+        return compare
+
+    return register
+
+
+register_rule(DEFAULT_RULE)(compare_entries)
+
+
+@register_rule("no_dropped")
+def compare_completed(
+    score: NDArray[np.int8], status: NDArray[np.int8]
+) -> NDArray[np.bool_]:
+    """A higher score wins, dropped entries are ignored."""
+    completed = status == 1
+    return (
+        (score[:, np.newaxis] > score)
+        & (score > 0)
+        & completed[:, np.newaxis]
+        & completed
+    )
+
+
+@register_rule("score_gap", max_weight=9)
+def compare_score_gap(
+    score: NDArray[np.int8], status: NDArray[np.int8]
+) -> NDArray[np.uint8]:
+    """A higher score wins with weight the score difference, otherwise completed
+    beats dropped with weight 1."""
+    gap = score[:, np.newaxis].astype(np.int16) - score
+    higher = (gap > 0) & (score > 0)
+    wins = compare_entries(score, status)
+    return np.where(higher, gap, wins).astype(np.uint8)
+
+
+@register_rule("ties", max_weight=2)
+def compare_ties(
+    score: NDArray[np.int8], status: NDArray[np.int8]
+) -> NDArray[np.uint8]:
+    """As the default rule, with equal scores counting as half a win each way.
+
+    Weights are doubled to keep the counts integer, which does not change the
+    fitted parameters."""
+    wins = compare_entries(score, status)
+    ties = (score[:, np.newaxis] == score) & (score > 0) & ~wins & ~wins.T
+    np.fill_diagonal(ties, False)
+    return (2 * wins + ties).astype(np.uint8)
+
+
+def build_rule_table(
+    compact: CompactSample,
+    size: int,
+    counts: NDArray[np.uint32] | None = None,
+    rule: str = DEFAULT_RULE,
+    weighting: str | None = None,
+) -> Counts:
+    """Return the table of a single rule with a weighting of users, as build_tables."""
+    return build_tables(compact, size, [rule], counts, weighting)[rule]
+
+
+def build_tables(
+    compact: CompactSample,
+    size: int,
+    rules: Iterable[str],
+    counts: NDArray[np.uint32] | None = None,
+    weighting: str | None = None,
+) -> dict[str, Counts]:
+    """Return the table of each rule, with user u counted counts[u] times.
+
+    Same as bootstrap.build_table, with all the rules evaluated for each user.
+    With a weighting (see WEIGHTINGS), the wins of each user are multiplied by
+    their weight, depending on the total weight of their wins with each rule, and
+    the tables have dtype float64."""
+    num_users = compact.offsets.shape[0] - 1
+    if counts is None:
+        counts = np.ones(num_users, dtype=np.uint32)
+    total = int(np.sum(counts))
+    # A pair gets at most max_weight per user in either direction, so table + table.T
+    # fits too.
+    tables = {
+        name: np.zeros(
+            (size, size),
+            dtype=(
+                np.float64 if weighting else count_dtype(total * RULES[name].max_weight)
+            ),
+        )
+        for name in rules
+    }
+    for user in np.flatnonzero(counts):
+        entries = slice(compact.offsets[user], compact.offsets[user + 1])
+        anime = compact.anime[entries]
+        for name, table in tables.items():
+            weights = RULES[name].compare(
+                compact.score[entries], compact.status[entries]
+            )
+            rows, cols = np.nonzero(weights)
+            if not rows.shape[0]:
+                continue
+            user_weight = (
+                WEIGHTINGS[weighting](float(np.sum(weights[rows, cols]))) * counts[user]
+                if weighting
+                else counts[user]
+            )
+            # Entries of a user are distinct, so the pairs have no repetitions.
+            table[anime[rows], anime[cols]] += (
+                weights[rows, cols] * user_weight
+            ).astype(table.dtype)
+    return tables
@@ -0,0 +1,155 @@
+"""Timing and memory instrumentation of the ranking computation.
+
+Disabled by default, in which case every call is a cheap no-op.
+When enabled, the metrics of a command are stored in metrics.json in the run directory,
+next to an optional cProfile dump."""
+
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Iterator, TypedDict
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+METRICS_FILE = "metrics.json"
+
+
+class StageMetrics(TypedDict):
+    count: int
+    total_seconds: float
+    min_seconds: float
+    max_seconds: float
+    peak_rss_bytes: int | None
+    peak_traced_bytes: int | None
+
+
+def get_peak_rss() -> int | None:
+    """Return the peak resident set size of the process in bytes, if available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Instrumentation:
+    """Collect stage timings, array sizes and memory usage of a command."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.trace_memory = False
+        self.profiler: cProfile.Profile | None = None
+        self.command = ""
+        self.started = ""
+        self.stages: dict[str, StageMetrics] = {}
+        self.arrays: dict[str, dict[str, Any]] = {}
+
+    def configure(
+        self,
+        command: str,
+        enabled: bool = True,
+        profile: bool = False,
+        trace_memory: bool = False,
+    ) -> None:
+        """Start collecting metrics for the given command."""
+        self.enabled = enabled
+        self.command = command
+        self.started = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.stages = {}
+        self.arrays = {}
+        self.trace_memory = enabled and trace_memory
+        if self.trace_memory:
+            tracemalloc.start()
+        self.profiler = cProfile.Profile() if enabled and profile else None
+        if self.profiler:
+            self.profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block, aggregating repeated stages."""
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Add a measurement to the given stage."""
+        if not self.enabled:
+            return
+        traced = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = StageMetrics(
+                count=1,
+                total_seconds=seconds,
+                min_seconds=seconds,
+                max_seconds=seconds,
+                peak_rss_bytes=get_peak_rss(),
+                peak_traced_bytes=traced,
+            )
+            return
+        stage["count"] += 1
+        stage["total_seconds"] += seconds
+        stage["min_seconds"] = min(stage["min_seconds"], seconds)
+        stage["max_seconds"] = max(stage["max_seconds"], seconds)
+        stage["peak_rss_bytes"] = get_peak_rss()
+        if traced is not None:
+            stage["peak_traced_bytes"] = max(stage["peak_traced_bytes"] or 0, traced)
+
+    def array(self, name: str, array: np.ndarray) -> None:
+        """Record the size of an array."""
+        if not self.enabled:
+            return
+        self.arrays[name] = {
+            "shape": list(array.shape),
+            "dtype": str(array.dtype),
+            "nbytes": int(array.nbytes),
+        }
+
+    def save(self, directory: str) -> None:
+        """Store the metrics collected so far in the given run directory.
+
+        Each command adds its own record; saving again updates it."""
+        if not self.enabled:
+            return
+        path = f"{directory}/{METRICS_FILE}"
+        records: list[dict[str, Any]] = []
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as f:
+                records = json.load(f)
+        records = [r for r in records if r["started"] != self.started]
+        records.append(
+            {
+                "command": self.command,
+                "started": self.started,
+                "saved": datetime.now().strftime("%Y%m%d-%H%M%S"),
+                "peak_rss_bytes": get_peak_rss(),
+                "stages": self.stages,
+                "arrays": self.arrays,
+            }
+        )
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(records, f, indent=2)
+        if self.profiler:
+            # Dumping the statistics disables the profiler.
+            self.profiler.dump_stats(f"{directory}/profile_{self.started}.prof")
+            self.profiler.enable()
+
+
+metrics = Instrumentation()
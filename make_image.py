@@ -1,15 +1,34 @@
-"""Create the infographic for the top 50 to publish."""
+"""Create the infographic for the top entries to publish.
 
+Thumbnails are resized once and kept in an on-disk cache keyed by the hash of the
+source picture and the target box, so several variants (top 50/100, one per cutoff)
+can be rendered in a single run."""
+
+import argparse
+import hashlib
 import json
-import pickle
+import re
 import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
 from math import prod
+from pathlib import Path
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from anime_store import ANIME_STORE, load_anime_info
+from models import AnimeSummary, Result
+from ranked_view import top_k
+
 RESULT_FILE = "docs/data/50027_100.json"
-ANIME = "data/anime"
+ANIME = ANIME_STORE
 PICTURE_PATH = "docs/images"
+SOURCE_PICTURE_PATH = "pictures"
+THUMBNAIL_CACHE_PATH = "pictures/cache"
+FONT = "cmunsx.ttf"
+NUM_WORKERS = 8
+MIN_LISTS = 10
 
 ENTRIES = (10, 5)
 TEXT_BOX = (450, 80)
@@ -22,7 +41,7 @@ H_PICTURE_OFFSET = 4
 TOP_OFFSET = 650
 BOTTOM_OFFSET = 0
 
-BG_RGB = (32, 33, 36)
+BG_RGB = (14, 14, 14)
 BOX_BG_RGB = (51, 89, 147)
 RANK_BG_RGB = (8, 32, 69)
 TEXT_COLOUR = (255, 255, 255)
@@ -37,11 +56,51 @@ UPVOTE_TOP_H = 18
 VOTE_SHIFT_X = {1: -20, 2: -32, 3: -45}
 VOTE_SHIFT_Y = -5
 
-title_font = ImageFont.truetype("cmunsx.ttf", 150)
-subtitle_font = ImageFont.truetype("cmunsx.ttf", 100)
-description_font = ImageFont.truetype("cmunsx.ttf", 50)
-anime_font = ImageFont.truetype("cmunsx.ttf", 29)
-rank_font = ImageFont.truetype("cmunsx.ttf", 50)
+# Pictures taller than the box are cropped from the bottom or the top respectively.
+CROP_BOTTOM = {28977, 21329}
+CROP_TOP = {28957, 21939}
+# Manual line breaks for titles that textwrap splits awkwardly.
+TITLE_LINES = {
+    "Shingeki no Kyojin Season 3 Part 2": ["Shingeki no Kyojin", "Season 3 Part 2"],
+    "Mushishi Zoku Shou: Suzu no Shizuku": ["Mushishi Zoku Shou:", "Suzu no Shizuku"],
+    "Code Geass: Hangyaku no Lelouch R2": ["Code Geass:", "Hangyaku no Lelouch R2"],
+    "Made in Abyss Movie 3: Fukaki Tamashii no Reimei": [
+        "Made in Abyss Movie 3:",
+        "Fukaki Tamashii no Reimei",
+    ],
+    "Made in Abyss: Retsujitsu no Ougonkyou": [
+        "Made in Abyss:",
+        "Retsujitsu no Ougonkyou",
+    ],
+    "Fate/stay night Movie: Heaven's Feel - III. Spring Song": [
+        "Fate/stay night Movie:",
+        "Heaven's Feel - III. Spring Song",
+    ],
+    "Monogatari Series: Second Season": ["Monogatari Series:", "Second Season"],
+    "JoJo no Kimyou na Bouken Part 6: Stone Ocean Part 3": [
+        "JoJo no Kimyou na Bouken",
+        "Part 6: Stone Ocean Part 3",
+    ],
+    "Shingeki no Kyojin: The Final Season": [
+        "Shingeki no Kyojin:",
+        "The Final Season",
+    ],
+    "Mushishi Zoku Shou: Odoro no Michi": ["Mushishi Zoku Shou:", "Odoro no Michi"],
+}
+
+MAIN_TITLE = "MAL Top {num} via paired comparisons"
+SUBTITLE = "(as of 18/01/2023)"
+DESCRIPTION_ROWS = (
+    "Every user uses a different scoring pattern. What would MAL rankings look like if we used a method that ignored such discrepancy and only accounted for relative scores?",
+    "We used the Bradley-Terry model on a sample of {sample:,} randomly selected MAL users that scored at least 5 anime: this is the resulting top {num}.",
+    "More details and source code available at manitary.github.io/MAL-ranking. All the data was collected from MyAnimeList via the official API between 14th and 18th January 2023.",
+)
+
+
+@cache
+def get_font(size: int) -> ImageFont.FreeTypeFont:
+    """Return the font of the given size, loading it only once."""
+    return ImageFont.truetype(FONT, size)
 
 
 def vote_vertices(x: int, y: int, direction: str = "up") -> list[tuple[int, int]]:
@@ -57,96 +116,118 @@ def vote_vertices(x: int, y: int, direction: str = "up") -> list[tuple[int, int]
     return [top, left, left_corner, left_bottom, right_bottom, right_corner, right]
 
 
-with open(RESULT_FILE, encoding="utf8") as f:
-    results = json.load(f)
+def thumbnail_path(
+    anime_id: int,
+    box: tuple[int, int] = PICTURE_BOX,
+    source_path: str = SOURCE_PICTURE_PATH,
+    cache_path: str = THUMBNAIL_CACHE_PATH,
+) -> Path:
+    """Return the cached thumbnail of an anime picture, creating it if needed.
+
+    The cache key is the hash of the source picture and the box size,
+    so replacing a picture or changing the layout invalidates the entry."""
+    source = Path(f"{source_path}/{anime_id}.jpg")
+    digest = hashlib.sha1(source.read_bytes()).hexdigest()
+    path = Path(cache_path) / f"{digest}_{box[0]}x{box[1]}.png"
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with Image.open(source) as image:
+        ratio = box[0] / float(image.size[0])
+        new_height = int(float(image.size[1]) * ratio)
+        thumbnail = image.convert("RGB").resize(
+            (box[0], new_height), Image.Resampling.LANCZOS
+        )
+    # Write to a temporary file first so concurrent runs never see partial images.
+    tmp_path = path.with_suffix(".tmp")
+    thumbnail.save(tmp_path, format="PNG")
+    tmp_path.replace(path)
+    return path
 
-with open(ANIME, "rb") as f:
-    anime = pickle.load(f)
-# anime = {int(k): v for k, v in anime.items()}
 
-filtered_results = [x for x in results if x["num_lists"] >= 10][: prod(ENTRIES)]
+def load_thumbnails(
+    anime_ids: set[int],
+    box: tuple[int, int] = PICTURE_BOX,
+    num_workers: int = NUM_WORKERS,
+) -> dict[int, Image.Image]:
+    """Return the resized pictures of the given anime, prepared in parallel."""
+    ids = sorted(anime_ids)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        paths = list(executor.map(lambda i: thumbnail_path(i, box), ids))
+    thumbnails: dict[int, Image.Image] = {}
+    for anime_id, path in zip(ids, paths):
+        with Image.open(path) as image:
+            thumbnails[anime_id] = image.copy()
+    return thumbnails
 
-final_image = Image.new(
-    "RGB",
-    (
-        ENTRIES[0] * TEXT_BOX[0] + (ENTRIES[0] + 1) * W_PADDING,
-        TOP_OFFSET
-        + ENTRIES[1] * (TEXT_BOX[1] + PICTURE_BOX[1])
-        + (ENTRIES[1]) * H_PADDING
-        + BOTTOM_OFFSET,
-    ),
-    (14, 14, 14),
-)
-draw = ImageDraw.Draw(final_image)
 
-for rank, entry in enumerate(filtered_results):
-    image = Image.open(f"pictures/{entry['mal_ID']}.jpg")
-    global_x = W_PADDING + (rank % 10) * (W_PADDING + TEXT_BOX[0])
-    global_y = TOP_OFFSET + (rank // 10) * (H_PADDING + TEXT_BOX[1] + PICTURE_BOX[1])
-    # background box
-    bg_x0 = global_x
-    bg_y0 = global_y
-    bg_x1 = bg_x0 + TEXT_BOX[0]
-    bg_y1 = bg_y0 + PICTURE_BOX[1] + TEXT_BOX[1]
-    ImageDraw.Draw(final_image).rectangle(
-        ((bg_x0, bg_y0), (bg_x1, bg_y1)), fill=BOX_BG_RGB
+def crop_thumbnail(
+    image: Image.Image, anime_id: int, box: tuple[int, int] = PICTURE_BOX
+) -> Image.Image:
+    """Crop a thumbnail taller than the picture box."""
+    if image.size[1] <= box[1]:
+        return image
+    if anime_id in CROP_BOTTOM:
+        return image.crop((0, image.size[1] - box[1], image.size[0], image.size[1]))
+    if anime_id in CROP_TOP:
+        return image.crop((0, 0, image.size[0], box[1]))
+    print(f"Picture of {anime_id} exceeds the box")
+    return image
+
+
+def get_title_lines(title: str) -> list[str]:
+    """Split an anime title in lines fitting the text box."""
+    if title in TITLE_LINES:
+        return TITLE_LINES[title]
+    return textwrap.wrap(
+        text=title,
+        width=30,
+        break_long_words=False,
+        break_on_hyphens=False,
     )
+
+
+def select_results(
+    results: list[Result], num: int, min_lists: int = MIN_LISTS
+) -> list[Result]:
+    """Return the top num results among those appearing in enough lists."""
+    params = np.array([x["parameter"] for x in results], dtype=np.float64)
+    mask = np.array([x["num_lists"] >= min_lists for x in results], dtype=np.bool_)
+    return [results[i] for i in top_k(params, num, mask).tolist()]
+
+
+def draw_entry(
+    final_image: Image.Image,
+    draw: ImageDraw.ImageDraw,
+    rank: int,
+    entry: Result,
+    info: AnimeSummary,
+    thumbnail: Image.Image,
+    columns: int,
+) -> None:
+    """Draw the box of a single entry of the ranking."""
+    rank_font = get_font(50)
+    global_x = W_PADDING + (rank % columns) * (W_PADDING + TEXT_BOX[0])
+    global_y = TOP_OFFSET + (rank // columns) * (
+        H_PADDING + TEXT_BOX[1] + PICTURE_BOX[1]
+    )
+    # background box
+    bg_x1 = global_x + TEXT_BOX[0]
+    bg_y1 = global_y + PICTURE_BOX[1] + TEXT_BOX[1]
+    draw.rectangle(((global_x, global_y), (bg_x1, bg_y1)), fill=BOX_BG_RGB)
     # rank box
-    rk_x0 = global_x
     rk_y0 = global_y - H_PICTURE_OFFSET * 2
     rk_x1 = global_x + TEXT_BOX[0]
     rk_y1 = global_y + RANK_BOX[1] * 3
-    ImageDraw.Draw(final_image).rectangle(
-        ((rk_x0, rk_y0), (rk_x1, rk_y1)), fill=RANK_BG_RGB
-    )
+    draw.rectangle(((global_x, rk_y0), (rk_x1, rk_y1)), fill=RANK_BG_RGB)
     # anime image
-    image_ratio = PICTURE_BOX[0] / float(image.size[0])
-    new_height = int((float(image.size[1]) * float(image_ratio)))
-    image = image.resize((PICTURE_BOX[0], new_height), Image.Resampling.LANCZOS)
-    if image.size[1] > PICTURE_BOX[1]:
-        if entry["mal_ID"] in (28977, 21329):
-            image = image.crop(
-                (0, image.size[1] - PICTURE_BOX[1], image.size[0], image.size[1])
-            )
-        elif entry["mal_ID"] in (28957, 21939):
-            image = image.crop((0, 0, image.size[0], PICTURE_BOX[1]))
-        else:
-            print(rank, entry["mal_ID"])
-
+    image = crop_thumbnail(thumbnail, entry["mal_ID"])
     image_corner_x = global_x + RANK_BOX[0] - W_PICTURE_OFFSET
     image_corner_y = global_y + (PICTURE_BOX[1] - image.size[1]) // 2 - H_PICTURE_OFFSET
     final_image.paste(image, (image_corner_x, image_corner_y))
     # anime title
-    title = anime[entry["mal_ID"]]["title"]
-    if rank == 10:
-        title_lines = ["Shingeki no Kyojin", "Season 3 Part 2"]
-    elif rank == 16:
-        title_lines = ["Mushishi Zoku Shou:", "Suzu no Shizuku"]
-    elif rank == 25:
-        title_lines = ["Code Geass:", "Hangyaku no Lelouch R2"]
-    elif rank == 27:
-        title_lines = ["Made in Abyss Movie 3:", "Fukaki Tamashii no Reimei"]
-    elif rank == 30:
-        title_lines = ["Made in Abyss:", "Retsujitsu no Ougonkyou"]
-    elif rank == 36:
-        title_lines = ["Fate/stay night Movie:", "Heaven's Feel - III. Spring Song"]
-    elif rank == 38:
-        title_lines = ["Monogatari Series:", "Second Season"]
-    elif rank == 40:
-        title_lines = ["JoJo no Kimyou na Bouken", "Part 6: Stone Ocean Part 3"]
-    elif rank == 46:
-        title_lines = ["Shingeki no Kyojin:", "The Final Season"]
-    elif rank == 48:
-        title_lines = ["Mushishi Zoku Shou:", "Odoro no Michi"]
-    else:
-        title_lines = textwrap.wrap(
-            text=title,
-            width=30,
-            break_long_words=False,
-            break_on_hyphens=False,
-        )
+    title_lines = get_title_lines(info["title"])
     text_centre_x = global_x + TEXT_BOX[0] // 2
-    # text_centre_y = global_y + PICTURE_BOX[1] + TEXT_BOX[1] // 2
     text_centre_y = global_y + PICTURE_BOX[1]
     step = TEXT_BOX[1] // (len(title_lines) + 1)
     for i, line in enumerate(title_lines):
@@ -154,8 +235,8 @@ for rank, entry in enumerate(filtered_results):
         draw.text(
             (text_centre_x, text_centre_y),
             line,
-            (255, 255, 255),
-            font=anime_font,
+            TEXT_COLOUR,
+            font=get_font(29),
             anchor="mm",
         )
     # rank
@@ -169,7 +250,7 @@ for rank, entry in enumerate(filtered_results):
         anchor="mm",
     )
     # diff
-    rank_diff = anime[entry["mal_ID"]]["rank"] - rank - 1
+    rank_diff = (info["rank"] or 0) - rank - 1
     diff_colour = (
         POSITIVE_COLOUR
         if rank_diff > 0
@@ -191,54 +272,158 @@ for rank, entry in enumerate(filtered_results):
     score_centre_y = global_y + RANK_BOX[1] * 5 // 2
     draw.text(
         (score_centre_x, score_centre_y),
-        f"{anime[entry['mal_ID']]['mean']}",
+        f"{info['mean']}",
         TEXT_COLOUR,
         font=rank_font,
         anchor="mm",
     )
     # vote arrow
     if rank_diff != 0:
-        ImageDraw.Draw(final_image).polygon(
+        draw.polygon(
             vote_vertices(
-                diff_centre_x + VOTE_SHIFT_X[len(str(abs(rank_diff)))],
+                diff_centre_x + VOTE_SHIFT_X[min(len(str(abs(rank_diff))), 3)],
                 diff_centre_y + VOTE_SHIFT_Y,
                 direction="up" if rank_diff > 0 else "down",
             ),
             fill=POSITIVE_COLOUR if rank_diff > 0 else NEGATIVE_COLOUR,
         )
 
-# Title
-main_title = "MAL Top 50 via paired comparisons"
-main_title_x = final_image.size[0] // 2
-main_title_y = 150
-draw.text(
-    (main_title_x, main_title_y), main_title, TEXT_COLOUR, font=title_font, anchor="mm"
-)
-# Subtitle
-subtitle = "(as of 18/01/2023)"
-subtitle_x = final_image.size[0] // 2
-subtitle_y = 300
-draw.text(
-    (subtitle_x, subtitle_y), subtitle, TEXT_COLOUR, font=subtitle_font, anchor="mm"
-)
 
-# Description
-description_rows = [
-    "Every user uses a different scoring pattern. What would MAL rankings look like if we used a method that ignored such discrepancy and only accounted for relative scores?",
-    "We used the Bradley-Terry model on a sample of 50,027 randomly selected MAL users that scored at least 5 anime: this is the resulting top 50.",
-    "More details and source code available at manitary.github.io/MAL-ranking. All the data was collected from MyAnimeList via the official API between 14th and 18th January 2023.",
-]
-description_x = W_PADDING
-description_y = 400
-description_step = 70
-for description in description_rows:
+def render_image(
+    results: list[Result],
+    anime: dict[int, AnimeSummary],
+    thumbnails: dict[int, Image.Image],
+    entries: tuple[int, int] = ENTRIES,
+    sample_size: int = 0,
+    subtitle: str = SUBTITLE,
+) -> Image.Image:
+    """Return the infographic of the given (already selected) results."""
+    columns, rows = entries
+    num = len(results)
+    final_image = Image.new(
+        "RGB",
+        (
+            columns * TEXT_BOX[0] + (columns + 1) * W_PADDING,
+            TOP_OFFSET
+            + rows * (TEXT_BOX[1] + PICTURE_BOX[1])
+            + rows * H_PADDING
+            + BOTTOM_OFFSET,
+        ),
+        BG_RGB,
+    )
+    draw = ImageDraw.Draw(final_image)
+    for rank, entry in enumerate(results):
+        draw_entry(
+            final_image=final_image,
+            draw=draw,
+            rank=rank,
+            entry=entry,
+            info=anime[entry["mal_ID"]],
+            thumbnail=thumbnails[entry["mal_ID"]],
+            columns=columns,
+        )
+
+    centre_x = final_image.size[0] // 2
     draw.text(
-        (description_x, description_y),
-        description,
+        (centre_x, 150),
+        MAIN_TITLE.format(num=num),
         TEXT_COLOUR,
-        font=description_font,
+        font=get_font(150),
+        anchor="mm",
+    )
+    draw.text((centre_x, 300), subtitle, TEXT_COLOUR, font=get_font(100), anchor="mm")
+    description_y = 400
+    description_step = 70
+    for description in DESCRIPTION_ROWS:
+        draw.text(
+            (W_PADDING, description_y),
+            description.format(num=num, sample=sample_size),
+            TEXT_COLOUR,
+            font=get_font(50),
+        )
+        description_y += description_step
+    return final_image
+
+
+def parse_grid(grid: str) -> tuple[int, int]:
+    """Parse a grid size given as COLUMNSxROWS."""
+    columns, rows = map(int, grid.lower().split("x"))
+    return columns, rows
+
+
+def make_images(
+    result_files: list[str],
+    grids: list[tuple[int, int]],
+    anime: dict[int, AnimeSummary],
+    destination_path: str = PICTURE_PATH,
+    formats: tuple[str, ...] = ("jpg",),
+) -> list[Path]:
+    """Render every grid size for every result file.
+
+    Thumbnails of all the entries involved are prepared once, before rendering."""
+    selections: dict[str, list[Result]] = {}
+    for result_file in result_files:
+        with open(result_file, encoding="utf8") as f:
+            results: list[Result] = json.load(f)
+        selections[result_file] = select_results(results, max(map(prod, grids)))
+    thumbnails = load_thumbnails(
+        {entry["mal_ID"] for selection in selections.values() for entry in selection}
     )
-    description_y += description_step
+    saved: list[Path] = []
+    for result_file, selection in selections.items():
+        stem = Path(result_file).stem
+        sample_size = int(re.findall(r"^(\d+)", stem)[0]) if stem[0].isdigit() else 0
+        for grid in grids:
+            num = prod(grid)
+            image = render_image(
+                results=selection[:num],
+                anime=anime,
+                thumbnails=thumbnails,
+                entries=grid,
+                sample_size=sample_size,
+            )
+            for extension in formats:
+                path = Path(destination_path) / f"top{num}_{stem}.{extension}"
+                image_format = "JPEG" if extension == "jpg" else extension.upper()
+                image.save(path, format=image_format)
+                saved.append(path)
+    return saved
+
 
-final_image.save(f"{PICTURE_PATH}/top50.bmp", format="BMP")
-final_image.save(f"{PICTURE_PATH}/top50.jpg", format="JPEG")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r",
+        "--results",
+        metavar="R",
+        type=str,
+        nargs="+",
+        default=[RESULT_FILE],
+        help=f"result JSON files to render, default={RESULT_FILE}",
+    )
+    parser.add_argument(
+        "-g",
+        "--grid",
+        metavar="G",
+        type=parse_grid,
+        nargs="+",
+        default=[ENTRIES],
+        help="grid sizes as COLUMNSxROWS, default=10x5",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        metavar="F",
+        type=str,
+        nargs="+",
+        default=["jpg", "bmp"],
+        help="image formats to save, default=jpg bmp",
+    )
+    args = parser.parse_args()
+    for saved_path in make_images(
+        result_files=args.results,
+        grids=args.grid,
+        anime=load_anime_info(store_path=ANIME),
+        formats=tuple(args.format),
+    ):
+        print(f"Saved {saved_path}")
@@ -3,37 +3,130 @@
 import argparse
 import glob
 import json
-import pickle
+import os
 import re
+import sys
+import time
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from itertools import count
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, NamedTuple
 
 import numpy as np
 from numpy.typing import NDArray
 from tqdm import tqdm
 
-from models import Anime, Result, ResultShort, UserList
+from anime_store import ANIME_STORE, get_store_connection, load_anime_info, load_titles
+from bootstrap import (
+    NUM_REPLICATES,
+    CompactSample,
+    bootstrap_intervals,
+    build_table,
+    compact_users,
+    load_replicates,
+    restrict_sample,
+    run_bootstrap,
+    user_periods,
+)
+from comparison_rules import (
+    DEFAULT_RULE,
+    RULES,
+    WEIGHTINGS,
+    build_rule_table,
+    build_tables,
+    table_name,
+)
+from instrumentation import metrics
+from manifest import (
+    CACHE_DIR,
+    fingerprint_files,
+    get_cache_entry,
+    input_key,
+    link_artifact,
+    link_artifacts,
+    load_info,
+    load_manifest,
+    save_info,
+    save_manifest,
+)
+from models import AnimeSummary, Result, ResultShort, UserList
+from ranked_view import RankedView, top_k
+from subrankings import (
+    FILTERS,
+    NUM_ITERATIONS as SUBSET_ITERATIONS,
+    SUBSET_DIR,
+    enumerate_subsets,
+    fit_subsets,
+    load_subsets,
+    parse_subset,
+)
+from telemetry import Telemetry, summarise_telemetry
 from utils import (
+    DEFAULT_PRECISION,
+    KERNELS,
+    PRECISIONS,
+    Counts,
+    Kernel,
     TIMESTAMP,
-    create_table,
-    get_anime_ids_from_sample,
+    build_id_lookup,
+    compute_denominator,
+    count_dtype,
+    get_kernel,
+    get_last_checkpoint,
+    is_improving,
+    iterate_log_parameter,
     iterate_parameter,
+    load_id_maps,
     load_samples,
+    load_symmetric,
+    log_likelihood,
+    log_likelihood_log,
+    save_id_maps,
+    save_symmetric,
     setup_bradley_terry,
+    translate_ids,
+    yield_samples,
 )
 
 SAMPLE_PATH = "data/samples/sample_*.json"
-ANIME_PATH = "data/anime"
+ANIME_PATH = ANIME_STORE
 SAVE_EVERY = 50
+NUM_WORKERS = os.cpu_count() or 1
+TABLE_ARTIFACTS = (
+    "table.npy",
+    "map_id_order.npy",
+    "map_order_id.npy",
+    "list_counts.npy",
+)
+REDUCED_ARTIFACTS = (
+    "mt.npy",
+    "w.npy",
+    "p.npy",
+    "reduced_map_id_order.npy",
+    "reduced_map_order_id.npy",
+    "dropped",
+)
+PERIOD_DIR = "periods"
+PERIODS_FILE = "periods.json"
+H2H_TOP_K = 100
+H2H_BLOCK_SIZE = 25
+H2H_DIGITS = 4  # Decimal digits of the predicted probabilities exported.
+MAX_NON_IMPROVING = 3  # Steps in a row not increasing the likelihood before stopping.
+ROUNDING_EPS = 4096  # Relative likelihood decreases due to rounding, in epsilons.
 
 
 def step_iteration(
     p: NDArray[np.floating[Any]],
-    mt: NDArray[np.uint],
-    w: NDArray[np.uint],
+    mt: Counts,
+    w: Counts,
     num_iter: int,
+    telemetry: Telemetry | None = None,
+    start: int = 0,
+    check: bool = False,
+    log_space: bool = False,
+    kernel: Kernel = compute_denominator,
 ) -> tuple[
     NDArray[np.floating[Any]],
     list[NDArray[np.floating[Any]]],
@@ -42,11 +135,65 @@ def step_iteration(
 ]:
     """Iterate the parameter num_iter times.
 
-    Display the max delta of a single parameter between first and last iteration."""
+    Display the max delta of a single parameter between first and last iteration.
+    If telemetry is given, log the metrics of every iteration, numbered from start.
+    If log_space is True, iterate the logarithm of the parameters instead.
+    If check is True, compute the log-likelihood after every iteration:
+    the iteration increases it, so a step that does not (beyond the rounding of the
+    precision of p, see ROUNDING_EPS) is reported, and the iteration stops early
+    after MAX_NON_IMPROVING such steps in a row.
+    kernel computes the denominator of iterate_parameter, see utils.get_kernel.
+    The number of iterations done is len(p_list) - 1."""
     p_list = [np.copy(p)]
-    for _ in tqdm(range(num_iter)):
-        p = iterate_parameter(p=p, mt=mt, w=w)
+    with np.errstate(divide="ignore"):
+        theta = np.log(p.astype(np.float64)) if log_space else None
+    likelihood = None
+    if check or telemetry:
+        likelihood = (
+            log_likelihood_log(theta, mt, w)
+            if theta is not None
+            else log_likelihood(p, mt, w)
+        )
+    rtol = ROUNDING_EPS * float(np.finfo(p.dtype).eps)
+    non_improving = 0
+    for i in tqdm(range(num_iter)):
+        iteration_start = time.perf_counter()
+        with metrics.stage("iteration"):
+            if theta is not None:
+                theta = iterate_log_parameter(theta=theta, mt=mt, w=w)
+                p = np.exp(theta).astype(p.dtype)
+            else:
+                p = iterate_parameter(p=p, mt=mt, w=w, kernel=kernel)
+        seconds = time.perf_counter() - iteration_start
+        if likelihood is not None:
+            previous = likelihood
+            likelihood = (
+                log_likelihood_log(theta, mt, w)
+                if theta is not None
+                else log_likelihood(p, mt, w)
+            )
+            non_improving = (
+                0
+                if not check or is_improving(previous, likelihood, rtol)
+                else non_improving + 1
+            )
+        if telemetry:
+            telemetry.record(
+                iteration=start + i + 1,
+                seconds=seconds,
+                p_old=p_list[-1],
+                p_new=p,
+                likelihood=likelihood,
+            )
         p_list.append(np.copy(p))
+        if non_improving:
+            print(
+                f"Iteration {start + i + 1} decreased the log-likelihood "
+                f"from {previous} to {likelihood}"
+            )
+        if non_improving >= MAX_NON_IMPROVING:
+            print("The iteration has stalled, stopping")
+            break
     delta = np.abs(p - p_list[0])
     last_delta = np.abs(p_list[-1] - p_list[-2])
     print(
@@ -57,31 +204,347 @@ Last step max delta: {np.amax(last_delta)} at position {np.argmax(delta)}"""
 
 
 def endless_iteration(
-    datum: tuple[NDArray[np.floating[Any]], NDArray[np.uint], NDArray[np.uint]],
+    datum: tuple[NDArray[np.floating[Any]], Counts, Counts],
     num_iter: int,
     timestamp: str,
     sample_size: int,
     start: int = 0,
+    telemetry: bool = False,
+    check: bool = False,
+    log_space: bool = False,
+    kernel: Kernel = compute_denominator,
+    num_steps: int | None = None,
 ) -> None:
     """Iterate endlessly the parameter computation.
 
-    Interrupt manually.
+    Interrupt manually, or set num_steps to stop after that many saves.
     Results are stored every num_iter iterations.
+    If telemetry is True, the metrics of every iteration are appended to the log
+    in the run directory.
+    check, log_space and kernel are as in step_iteration; if the iteration stalls,
+    the last results are stored and the computation stops.
     """
     p, mt, w = datum
-    for i in count(start=1):
-        marker = start + i * num_iter
-        p, p_list, _, last_delta = step_iteration(p=p, mt=mt, w=w, num_iter=num_iter)
-        with open(f"data/{timestamp}_{sample_size}/parameter_{marker}.npy", "wb") as f:
-            np.save(f, p)
-        with open(f"data/{timestamp}_{sample_size}/parameters_{marker}.npz", "wb") as f:
-            np.savez(f, *p_list)
-        with open(f"data/{timestamp}_{sample_size}/last_delta_{marker}.npy", "wb") as f:
-            np.save(f, last_delta)
-        with open(f"data/{timestamp}_{sample_size}/error_pct_{marker}.npy", "wb") as f:
-            np.save(
-                f, np.divide(last_delta, p, out=np.zeros_like(p), where=p != 0) * 100
+    log = Telemetry(f"data/{timestamp}_{sample_size}", mt, w) if telemetry else None
+    marker = start
+    for _ in count() if num_steps is None else range(num_steps):
+        if log:
+            log.checkpoint(p)
+        p, p_list, _, last_delta = step_iteration(
+            p=p,
+            mt=mt,
+            w=w,
+            num_iter=num_iter,
+            telemetry=log,
+            start=marker,
+            check=check,
+            log_space=log_space,
+            kernel=kernel,
+        )
+        marker += len(p_list) - 1
+        with metrics.stage("save_checkpoint"):
+            with open(
+                f"data/{timestamp}_{sample_size}/parameter_{marker}.npy", "wb"
+            ) as f:
+                np.save(f, p)
+            with open(
+                f"data/{timestamp}_{sample_size}/parameters_{marker}.npz", "wb"
+            ) as f:
+                np.savez(f, *p_list)
+            with open(
+                f"data/{timestamp}_{sample_size}/last_delta_{marker}.npy", "wb"
+            ) as f:
+                np.save(f, last_delta)
+            with open(
+                f"data/{timestamp}_{sample_size}/error_pct_{marker}.npy", "wb"
+            ) as f:
+                np.save(
+                    f,
+                    np.divide(last_delta, p, out=np.zeros_like(p), where=p != 0) * 100,
+                )
+        metrics.save(f"data/{timestamp}_{sample_size}")
+        if len(p_list) - 1 < num_iter:
+            break
+    if log:
+        log.close()
+
+
+def prepare_table(
+    filenames: list[str],
+    path: str,
+    rule_entries: dict[str, str] | None = None,
+) -> None:
+    """Store the table of a sample with the maps between anime IDs and its indices.
+
+    The sample files are streamed, keeping only the relevant fields of each entry.
+    The number of lists with each anime is stored in list_counts.npy.
+    The table is the sum of the partial tables of the users grouped by the year of
+    their latest update, which are stored in the periods directory with their
+    list counts and number of users, to assemble windows of years (see load_window).
+    The tables of the comparison rules in rule_entries are computed in the same
+    pass (see prepare_rule_tables)."""
+    with metrics.stage("load_samples"):
+        compact = compact_users(yield_samples(*filenames))
+    anime_ids = np.unique(compact.anime)
+    size = anime_ids.shape[0]
+    Path(f"{path}/{PERIOD_DIR}").mkdir(parents=True, exist_ok=True)
+    save_id_maps(path, anime_ids)
+    compact = restrict_sample(compact, build_id_lookup(anime_ids))
+    periods = user_periods(compact)
+    entry_periods = np.repeat(periods, np.diff(compact.offsets))
+    table = np.zeros((size, size), dtype=count_dtype(periods.shape[0]))
+    sizes: dict[int, int] = {}
+    with metrics.stage("create_table"):
+        for year in np.unique(periods).tolist():
+            in_period = periods == year
+            period_table = build_table(compact, size, in_period.astype(np.uint32))
+            table += period_table
+            with open(f"{path}/{PERIOD_DIR}/table_{year}.npy", "wb") as f:
+                np.save(f, period_table)
+            with open(f"{path}/{PERIOD_DIR}/list_counts_{year}.npy", "wb") as f:
+                np.save(
+                    f,
+                    np.bincount(compact.anime[entry_periods == year], minlength=size),
+                )
+            sizes[year] = int(np.sum(in_period))
+    metrics.array("table", table)
+    with open(f"{path}/{PERIOD_DIR}/{PERIODS_FILE}", "w", encoding="utf8") as f:
+        json.dump(sizes, f)
+    with open(f"{path}/table.npy", "wb") as f:
+        np.save(f, table)
+    with open(f"{path}/list_counts.npy", "wb") as f:
+        np.save(f, np.bincount(compact.anime, minlength=size))
+    save_info(path, sample_size=compact.offsets.shape[0] - 1)
+    if rule_entries:
+        prepare_rule_tables(compact, path, rule_entries)
+
+
+def rule_key(table_key: str, rule: str, weighting: str | None = None) -> str:
+    """Return the key of the table of a sample with another comparison rule
+    or a weighting of users."""
+    if rule == DEFAULT_RULE and weighting is None:
+        return table_key
+    if weighting is None:
+        return input_key(table=table_key, rule=rule)
+    return input_key(table=table_key, rule=rule, weighting=weighting)
+
+
+def prepare_rule_tables(
+    compact: CompactSample,
+    table_entry: str,
+    rule_entries: dict[str, str],
+    weighting: str | None = None,
+) -> None:
+    """Store the tables of other comparison rules, in one pass over the users.
+
+    compact has the indices of the table stored in table_entry, whose maps and
+    list counts are shared by the tables of the rules.
+    Users are weighted as given (see comparison_rules.WEIGHTINGS)."""
+    order_to_id, _ = load_id_maps(table_entry)
+    with metrics.stage("create_rule_tables"):
+        tables = build_tables(
+            compact, order_to_id.shape[0], rule_entries, weighting=weighting
+        )
+    for rule, path in rule_entries.items():
+        Path(path).mkdir(parents=True, exist_ok=True)
+        link_artifacts(table_entry, path, TABLE_ARTIFACTS[1:])
+        with open(f"{path}/table.npy", "wb") as f:
+            np.save(f, tables[rule])
+        save_info(path, **load_info(table_entry), rule=rule, weighting=weighting)
+
+
+def get_rule_tables(
+    filenames: list[str],
+    table_key: str,
+    table_entry: str,
+    rules: Iterable[str],
+    weighting: str | None = None,
+) -> dict[str, bool]:
+    """Compute the missing tables of the given comparison rules and weighting.
+
+    Return whether the table of each rule was already in the cache."""
+    missing = {
+        rule: f"{CACHE_DIR}/{rule_key(table_key, rule, weighting)}"
+        for rule in rules
+        if get_cache_entry(rule_key(table_key, rule, weighting), TABLE_ARTIFACTS)
+        is None
+    }
+    if missing:
+        with metrics.stage("load_samples"):
+            _, id_to_order = load_id_maps(table_entry)
+            compact = restrict_sample(
+                compact_users(yield_samples(*filenames)), id_to_order
             )
+        prepare_rule_tables(compact, table_entry, missing, weighting)
+    return {rule: rule not in missing for rule in rules}
+
+
+def link_rule_tables(
+    path: str, table_key: str, reused: dict[str, bool], weighting: str | None = None
+) -> None:
+    """Link the tables of other comparison rules into a run directory.
+
+    The table of rule r is stored as table_r.npy, or table_r-w.npy with
+    weighting w, and added to the manifest."""
+    manifest = load_manifest(path)
+    assert manifest is not None
+    for rule, was_reused in reused.items():
+        key = rule_key(table_key, rule, weighting)
+        name = f"table_{table_name(rule, weighting)}.npy"
+        link_artifact(f"{CACHE_DIR}/{key}/table.npy", f"{path}/{name}")
+        manifest["artifacts"][name] = {
+            "key": key,
+            "reused": was_reused,
+        }
+    save_manifest(path, inputs=manifest["inputs"], artifacts=manifest["artifacts"])
+
+
+class TableData(NamedTuple):
+    """Table of a sample with the anime IDs of its indices."""
+
+    table: Counts
+    order_to_id: NDArray[np.int32]
+    list_counts: NDArray[np.int_]
+
+
+def load_table(path: str) -> TableData:
+    """Load the table artifacts stored in a directory by prepare_table."""
+    with metrics.stage("load_table"):
+        with open(f"{path}/table.npy", "rb") as f:
+            table = np.load(f)
+        order_to_id, _ = load_id_maps(path)
+        with open(f"{path}/list_counts.npy", "rb") as f:
+            list_counts = np.load(f)
+    return TableData(table, order_to_id, list_counts)
+
+
+def load_window(path: str, start: int, stop: int) -> tuple[TableData, int]:
+    """Return the table of the users whose latest update is in the years from start
+    to stop included, and the number of these users.
+
+    path is a directory where the table was stored by prepare_table."""
+    with open(f"{path}/{PERIOD_DIR}/{PERIODS_FILE}", encoding="utf8") as f:
+        sizes = {int(year): num for year, num in json.load(f).items()}
+    years = [year for year in sorted(sizes) if start <= year <= stop]
+    num_users = sum(sizes[year] for year in years)
+    order_to_id, _ = load_id_maps(path)
+    size = order_to_id.shape[0]
+    table = np.zeros((size, size), dtype=count_dtype(num_users))
+    list_counts = np.zeros(size, dtype=np.int_)
+    with metrics.stage("load_window"):
+        for year in years:
+            table += np.load(f"{path}/{PERIOD_DIR}/table_{year}.npy")
+            list_counts += np.load(f"{path}/{PERIOD_DIR}/list_counts_{year}.npy")
+    return TableData(table, order_to_id, list_counts), num_users
+
+
+def prepare_window(table_key: str, table_entry: str, start: int, stop: int) -> str:
+    """Return the key of the table of a window of years, storing it if needed."""
+    if not os.path.exists(f"{table_entry}/{PERIOD_DIR}/{PERIODS_FILE}"):
+        raise FileNotFoundError(f"{table_entry} has no period tables, prepare it again")
+    key = input_key(table=table_key, window=[start, stop])
+    path = f"{CACHE_DIR}/{key}"
+    if get_cache_entry(key, TABLE_ARTIFACTS) is not None:
+        return key
+    data, num_users = load_window(table_entry, start, stop)
+    Path(path).mkdir(parents=True, exist_ok=True)
+    link_artifacts(table_entry, path, ("map_id_order.npy", "map_order_id.npy"))
+    with open(f"{path}/table.npy", "wb") as f:
+        np.save(f, data.table)
+    with open(f"{path}/list_counts.npy", "wb") as f:
+        np.save(f, data.list_counts)
+    save_info(path, sample_size=num_users)
+    return key
+
+
+def reduce_table(
+    data: TableData,
+    path: str,
+    cutoff: int = 0,
+    curb: int = 0,
+    connected: bool = False,
+    precision: str = DEFAULT_PRECISION,
+) -> None:
+    """Store the arrays of the model restricted to the entries passing the filters.
+
+    The IDs of the anime excluded from the computation are stored in "dropped"."""
+    with metrics.stage("setup_bradley_terry"):
+        p, mt, w, _, new_to_old = setup_bradley_terry(
+            matrix=data.table,
+            sample={},
+            io_map={},
+            curb=curb,
+            cutoff=cutoff,
+            connected=connected,
+            precision=precision,
+            list_counts=data.list_counts,
+        )
+    for name, array in (("mt", mt), ("w", w), ("p", p)):
+        metrics.array(name, array)
+    kept = np.zeros(data.order_to_id.shape[0], dtype=np.bool_)
+    kept[list(new_to_old.values())] = True
+    Path(path).mkdir(parents=True, exist_ok=True)
+    with open(f"{path}/dropped", "w", encoding="utf8") as f:
+        json.dump(data.order_to_id[~kept].tolist(), f)
+    save_id_maps(path, data.order_to_id[kept], prefix="reduced_")
+    save_symmetric(f"{path}/mt.npy", mt)
+    with open(f"{path}/w.npy", "wb") as f:
+        np.save(f, w)
+    with open(f"{path}/p.npy", "wb") as f:
+        np.save(f, p)
+    save_info(path, num_entries=p.shape[0])
+
+
+def reduction_key(table_key: str, inputs: dict[str, Any]) -> str:
+    """Return the key of the reduction of a table with the filters in inputs."""
+    return input_key(
+        table=table_key,
+        **{name: inputs[name] for name in ("cutoff", "curb", "connected", "precision")},
+    )
+
+
+def create_run(
+    path: str,
+    table_entry: str,
+    table_key: str,
+    inputs: dict[str, Any],
+    data: TableData | None = None,
+    save: bool = True,
+    table_reused: bool = True,
+) -> None:
+    """Create a run directory with the artifacts of the table and its reduction.
+
+    inputs contains the filters of the reduction (see reduce_table) and is
+    stored in the manifest. The reduction is reused from the cache if available,
+    otherwise it is computed from data, loaded from table_entry if not given."""
+    reduced_key = reduction_key(table_key, inputs)
+    reduced_entry = get_cache_entry(reduced_key, REDUCED_ARTIFACTS)
+    names = TABLE_ARTIFACTS if save else TABLE_ARTIFACTS[1:]
+    artifacts = {
+        **{name: {"key": table_key, "reused": table_reused} for name in names},
+        **{
+            name: {"key": reduced_key, "reused": reduced_entry is not None}
+            for name in REDUCED_ARTIFACTS
+        },
+    }
+    if reduced_entry is None:
+        reduced_entry = f"{CACHE_DIR}/{reduced_key}"
+        reduce_table(
+            data or load_table(table_entry),
+            reduced_entry,
+            inputs["cutoff"],
+            inputs["curb"],
+            inputs["connected"],
+            inputs["precision"],
+        )
+    Path(path).mkdir(parents=True, exist_ok=True)
+    link_artifacts(table_entry, path, names)
+    link_artifacts(reduced_entry, path, REDUCED_ARTIFACTS)
+    with open(f"{path}/cutoff", "w", encoding="utf8") as f:
+        f.write(str(inputs["cutoff"]))
+    with open(f"{path}/precision", "w", encoding="utf8") as f:
+        f.write(inputs["precision"])
+    save_manifest(path, inputs=inputs, artifacts=artifacts)
 
 
 def initialise(
@@ -90,179 +553,605 @@ def initialise(
     timestamp: str = TIMESTAMP,
     cutoff: int = 0,
     curb: int = 0,
+    connected: bool = False,
+    precision: str = DEFAULT_PRECISION,
+    rules: Iterable[str] = (),
 ) -> None:
-    """Do the entire calculation from scratch."""
-    sample = load_samples(*glob.glob(sample_path))
-    sample_anime_ids = get_anime_ids_from_sample(sample)
-    id_to_order = {j: i for i, j in enumerate(sorted(sample_anime_ids))}
-    Path(f"data/{timestamp}_{len(sample)}").mkdir(parents=True, exist_ok=True)
-    with open(f"data/{timestamp}_{len(sample)}/cutoff", "w", encoding="utf8") as f:
-        f.write(str(cutoff))
-    with open(f"data/{timestamp}_{len(sample)}/map_id_order", "wb") as f:
-        pickle.dump(id_to_order, f)
-    order_to_id = dict(enumerate(sorted(sample_anime_ids)))
-    with open(f"data/{timestamp}_{len(sample)}/map_order_id", "wb") as f:
-        pickle.dump(order_to_id, f)
-    table = create_table(
-        size=len(id_to_order), id_to_order=id_to_order, sample=sample, save=save
-    )
-    p, mt, w, _, new_to_old = setup_bradley_terry(
-        matrix=table,
-        sample=sample,
-        io_map=id_to_order,
-        curb=curb,
-        cutoff=cutoff,
-    )
-    reduced_order_to_id = {i: order_to_id[new_to_old[i]] for i in range(p.shape[0])}
-    reduced_id_to_order = {j: i for i, j in reduced_order_to_id.items()}
-    with open(f"data/{timestamp}_{len(sample)}/reduced_map_id_order", "wb") as f:
-        pickle.dump(reduced_id_to_order, f)
-    with open(f"data/{timestamp}_{len(sample)}/reduced_map_order_id", "wb") as f:
-        pickle.dump(reduced_order_to_id, f)
-    with open(f"data/{timestamp}_{len(sample)}/mt.npy", "wb") as f:
-        np.save(f, mt)
-    with open(f"data/{timestamp}_{len(sample)}/w.npy", "wb") as f:
-        np.save(f, w)
-    with open(f"data/{timestamp}_{len(sample)}/p.npy", "wb") as f:
-        np.save(f, p)
+    """Do the entire calculation from scratch, reusing cached artifacts.
+
+    The table only depends on the content of the sample files, and the arrays of
+    the model on the table and the filters: those already computed from the same
+    inputs are linked from the cache instead.
+    The tables of other comparison rules are stored in the run directory too,
+    computed in the same pass over the sample as the table if that is missing.
+    The precision of the parameters is stored in "precision",
+    the inputs and the key of every artifact in the manifest of the run."""
+    filenames = sorted(glob.glob(sample_path))
+    with metrics.stage("fingerprint_samples"):
+        samples = fingerprint_files(filenames)
+    table_key = input_key(samples=sorted(x["sha256"] for x in samples.values()))
+    table_entry = get_cache_entry(table_key, TABLE_ARTIFACTS)
+    table_reused = table_entry is not None
+    rules = [rule for rule in rules if rule != DEFAULT_RULE]
+    if table_entry is None:
+        table_entry = f"{CACHE_DIR}/{table_key}"
+        prepare_table(
+            filenames,
+            table_entry,
+            {rule: f"{CACHE_DIR}/{rule_key(table_key, rule)}" for rule in rules},
+        )
+        rules_reused = dict.fromkeys(rules, False)
+    else:
+        rules_reused = get_rule_tables(filenames, table_key, table_entry, rules)
+    path = f"data/{timestamp}_{load_info(table_entry)['sample_size']}"
+    create_run(
+        path,
+        table_entry,
+        table_key,
+        inputs={
+            "samples": samples,
+            "cutoff": cutoff,
+            "curb": curb,
+            "connected": connected,
+            "precision": precision,
+        },
+        save=save,
+        table_reused=table_reused,
+    )
+    if rules:
+        link_rule_tables(path, table_key, rules_reused)
+    metrics.save(path)
+
+
+def derive_timestamp(
+    timestamp: str,
+    cutoff: int,
+    curb: int,
+    connected: bool,
+    window: tuple[int, int] | None = None,
+    rule: str = DEFAULT_RULE,
+    weighting: str | None = None,
+) -> str:
+    """Return the timestamp of a run derived from another with different filters."""
+    derived = f"{timestamp}-c{cutoff}-f{curb}{'-s' if connected else ''}"
+    if window is not None:
+        derived += f"-y{window[0]}-{window[1]}"
+    if rule != DEFAULT_RULE:
+        derived += f"-{rule}"
+    if weighting is not None:
+        derived += f"-{weighting}"
+    return derived
+
+
+def derive_runs(
+    timestamp: str,
+    cutoffs: list[int],
+    curb: int = 0,
+    connected: bool = False,
+    precision: str | None = None,
+    windows: list[tuple[int, int]] | None = None,
+    rule: str = DEFAULT_RULE,
+    weighting: str | None = None,
+) -> list[str]:
+    """Create runs with other filters from the table of an existing run.
 
+    The table is loaded once and reduced for every cutoff; runs with the same
+    filters as previous ones reuse their arrays. If windows of years are given,
+    runs are created for each of them from the users whose latest update is in the
+    window, summing the stored period tables. With another comparison rule or a
+    weighting of users, its table is used, computed from the sample files if needed.
+    Return the new timestamps."""
+    source = get_run_directory(timestamp)
+    manifest = load_manifest(source)
+    if manifest is None or "list_counts.npy" not in manifest["artifacts"]:
+        raise FileNotFoundError(f"{source} has no cached table, prepare it again")
+    source_key = manifest["artifacts"]["table.npy"]["key"]
+    source_entry = get_cache_entry(source_key, TABLE_ARTIFACTS) or source
+    precision = precision or load_precision(source)
+    if rule != DEFAULT_RULE or weighting is not None:
+        if windows:
+            raise ValueError("Windows of years are only stored for the default rule")
+        key = rule_key(source_key, rule, weighting)
+        if get_cache_entry(key, TABLE_ARTIFACTS) is None:
+            samples = manifest["inputs"]["samples"]
+            current = fingerprint_files(samples)
+            if any(current[x]["sha256"] != samples[x]["sha256"] for x in samples):
+                raise FileNotFoundError(f"The samples of {source} changed")
+            get_rule_tables(
+                sorted(samples), source_key, source_entry, [rule], weighting
+            )
+        source_key, source_entry = key, f"{CACHE_DIR}/{key}"
+    timestamps = []
+    for window in windows or [None]:
+        table_key, table_entry = source_key, source_entry
+        size = source.rsplit("_", 1)[1]
+        inputs = {**manifest["inputs"]}
+        if window is not None:
+            table_key = prepare_window(source_key, source_entry, *window)
+            table_entry = f"{CACHE_DIR}/{table_key}"
+            size = str(load_info(table_entry)["sample_size"])
+            inputs["window"] = list(window)
+        if rule != DEFAULT_RULE:
+            inputs["rule"] = rule
+        if weighting is not None:
+            inputs["weighting"] = weighting
+        data: TableData | None = None
+        for cutoff in cutoffs:
+            derived = derive_timestamp(
+                timestamp, cutoff, curb, connected, window, rule, weighting
+            )
+            inputs = {
+                **inputs,
+                "cutoff": cutoff,
+                "curb": curb,
+                "connected": connected,
+                "precision": precision,
+            }
+            reduced_key = reduction_key(table_key, inputs)
+            if data is None and get_cache_entry(reduced_key, REDUCED_ARTIFACTS) is None:
+                data = load_table(table_entry)
+            create_run(f"data/{derived}_{size}", table_entry, table_key, inputs, data)
+            metrics.save(f"data/{derived}_{size}")
+            timestamps.append(derived)
+    return timestamps
+
+
+def _fit_run(job: tuple[str, int, int]) -> None:
+    """Iterate the parameters of a run for the given number of saves."""
+    timestamp, num_iter, num_steps = job
+    iterate(timestamp=timestamp, num_iter=num_iter, num_steps=num_steps)
+
+
+def fit_runs(
+    timestamps: list[str],
+    num_iter: int = SAVE_EVERY,
+    num_steps: int = 1,
+    num_workers: int = NUM_WORKERS,
+) -> None:
+    """Iterate the parameters of several runs concurrently.
+
+    Each run is resumed and saved num_steps times every num_iter iterations."""
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        list(executor.map(_fit_run, [(t, num_iter, num_steps) for t in timestamps]))
 
-def iterate(timestamp: str, num_iter: int = SAVE_EVERY) -> None:
-    """Resume computation of the parameters from the last available iteration."""
-    with open(glob.glob(f"data/{timestamp}_*/mt.npy")[0], "rb") as f:
-        mt = np.load(f)
-    with open(glob.glob(f"data/{timestamp}_*/w.npy")[0], "rb") as f:
-        w = np.load(f)
-    filenames = sorted(glob.glob(f"data/{timestamp}_*/parameter_*.npy"))
-    if filenames:
-        filename = filenames[-1]
-        size = re.findall(r"_(\d+)\\parameter", filename)[0]
-        num = int(re.findall(r"_(\d+)\.npy", filename)[0])
-        with open(filename, "rb") as f:
-            p = np.load(f)
+
+def bootstrap_run(
+    timestamp: str,
+    sample_path: str = SAMPLE_PATH,
+    num_replicates: int = NUM_REPLICATES,
+    num_iter: int = SAVE_EVERY,
+    num_workers: int = NUM_WORKERS,
+) -> None:
+    """Fit the bootstrap replicates of a run, with the users of its window of years,
+    its comparison rule and its weighting of users as recorded in its manifest."""
+    path = get_run_directory(timestamp)
+    manifest = load_manifest(path)
+    inputs = manifest["inputs"] if manifest else {}
+    window = inputs.get("window")
+    rule = inputs.get("rule", DEFAULT_RULE)
+    weighting = inputs.get("weighting")
+    run_bootstrap(
+        path=path,
+        sample_path=sample_path,
+        num_replicates=num_replicates,
+        num_iter=num_iter,
+        num_workers=num_workers,
+        window=tuple(window) if window else None,
+        build=(
+            build_table
+            if rule == DEFAULT_RULE and weighting is None
+            else partial(build_rule_table, rule=rule, weighting=weighting)
+        ),
+    )
+
+
+def get_run_directory(timestamp: str) -> str:
+    """Return the directory of the run with the given timestamp."""
+    paths = glob.glob(f"data/{timestamp}_*")
+    if not paths:
+        raise FileNotFoundError(f"No run with timestamp {timestamp}")
+    return paths[0]
+
+
+def load_precision(path: str) -> str:
+    """Return the precision of the parameters of a run.
+
+    Runs prepared before it was stored used double precision."""
+    if not os.path.exists(f"{path}/precision"):
+        return "double"
+    with open(f"{path}/precision", encoding="utf8") as f:
+        return f.read().strip()
+
+
+def iterate(
+    timestamp: str,
+    num_iter: int = SAVE_EVERY,
+    telemetry: bool = False,
+    check: bool = False,
+    log_space: bool = False,
+    precision: str | None = None,
+    kernel: str = "numpy",
+    num_threads: int = 1,
+    num_steps: int | None = None,
+) -> None:
+    """Resume computation of the parameters from the last available iteration.
+
+    If precision is given, it replaces the one stored in the run directory.
+    kernel is one of utils.KERNELS, using up to num_threads threads.
+    num_steps is as in endless_iteration."""
+    path = get_run_directory(timestamp)
+    size = int(path.rsplit("_", 1)[1])
+    with metrics.stage("load_arrays"):
+        mt = load_symmetric(f"{path}/mt.npy")
+        with open(f"{path}/w.npy", "rb") as f:
+            w = np.load(f)
+    num, filename = get_last_checkpoint(path) or (0, f"{path}/p.npy")
+    with open(filename, "rb") as f:
+        p = np.load(f)
+    if precision is None:
+        precision = load_precision(path)
     else:
-        filename = glob.glob(f"data/{timestamp}_*/p.npy")[0]
-        size = re.findall(r"_(\d+)\\p", filename)[0]
-        num = 0
-        with open(filename, "rb") as f:
-            p = np.load(f)
+        with open(f"{path}/precision", "w", encoding="utf8") as f:
+            f.write(precision)
+    p = p.astype(PRECISIONS[precision])
+    for name, array in (("mt", mt), ("w", w), ("p", p)):
+        metrics.array(name, array)
     endless_iteration(
         datum=(p, mt, w),
         num_iter=num_iter,
         timestamp=timestamp,
         sample_size=size,
         start=num,
+        telemetry=telemetry,
+        check=check,
+        log_space=log_space,
+        kernel=get_kernel(kernel, num_threads),
+        num_steps=num_steps,
     )
 
 
-def extract_list_from_parameter(
-    p: NDArray[np.floating[Any]], f: dict[int, int], mal: dict[int, Anime]
-) -> list[ResultShort]:
-    """Transform the parameter vector into a list of dictionaries (ID, title, parameter)."""
-    return sorted(
-        (
-            ResultShort(mal_ID=f[i], title=mal[f[i]]["title"], parameter=v)
-            for i, v in enumerate(p)
-            if f[i] in mal
+def as_id_array(f: NDArray[np.integer[Any]] | dict[int, int]) -> NDArray[np.int_]:
+    """Return the anime IDs of the indices, given as array or as dict."""
+    if isinstance(f, dict):
+        return np.fromiter((f[i] for i in range(len(f))), dtype=np.int_, count=len(f))
+    return np.asarray(f, dtype=np.int_)
+
+
+def align_titles(
+    f: NDArray[np.integer[Any]] | dict[int, int], mal: dict[int, str]
+) -> tuple[NDArray[np.int_], NDArray[np.object_]]:
+    """Return the anime IDs and titles aligned with the parameter vector.
+
+    f maps indices to anime IDs. Entries missing from mal have title None."""
+    ids = as_id_array(f)
+    titles = np.array([mal.get(anime_id) for anime_id in ids.tolist()], dtype=object)
+    return ids, titles
+
+
+def rank_view(
+    p: NDArray[np.floating[Any]],
+    ids: NDArray[np.int_],
+    titles: NDArray[np.object_],
+    num: int | None = None,
+) -> RankedView[ResultShort]:
+    """Return the view of the top num entries with a title by decreasing parameter,
+    of all of them if num is None."""
+    return RankedView(
+        top_k(p, num, np.not_equal(titles, None)),
+        lambda i: ResultShort(
+            mal_ID=int(ids[i]), title=titles[i], parameter=float(p[i])
         ),
-        key=lambda x: x["parameter"],
-        reverse=True,
     )
 
 
+def rank_parameter(
+    p: NDArray[np.floating[Any]],
+    ids: NDArray[np.int_],
+    titles: NDArray[np.object_],
+    num: int | None = None,
+) -> list[ResultShort]:
+    """Return the top num entries with a title sorted by decreasing parameter,
+    all of them if num is None."""
+    return rank_view(p, ids, titles, num).tolist()
+
+
+def extract_list_from_parameter(
+    p: NDArray[np.floating[Any]],
+    f: NDArray[np.integer[Any]] | dict[int, int],
+    mal: dict[int, str],
+    num: int | None = None,
+) -> list[ResultShort]:
+    """Transform the parameter vector into a list of dictionaries (ID, title, parameter).
+
+    mal maps anime IDs to their titles. Only the top num entries are kept if given.
+    """
+    return rank_parameter(p, *align_titles(f, mal), num)
+
+
 def convert_parameter_for_website(
     p: NDArray[np.floating[Any]],
-    mt: NDArray[np.uint],
-    f: dict[int, int],
-    mal: dict[int, Anime],
+    mt: Counts,
+    f: NDArray[np.integer[Any]] | dict[int, int],
+    mal: dict[int, AnimeSummary],
     sample: dict[int, UserList],
     e: NDArray[np.floating[Any]],
+    intervals: dict[str, NDArray[Any]] | None = None,
+    num: int | None = None,
 ) -> list[Result]:
-    """Compute data used for the website from the results."""
+    """Compute data used for the website from the results.
+
+    f maps indices to anime IDs.
+    If bootstrap intervals are given, they are added to each entry.
+    Only the top num entries are computed if given."""
     counter = Counter[int]()
     for _, user_list in sample.items():
         for entry in user_list:
             if entry["list_status"]["status"] in {"completed", "dropped"}:
                 counter[entry["node"]["id"]] += 1
-    return sorted(
-        (
-            Result(
-                mal_ID=f[i],
-                parameter=v,
-                num_comparisons=int(np.sum(mt[i])),
-                num_lists=counter[f[i]],
-                pct_lists=counter[f[i]] / len(sample) * 100,
-                rel_error_pct=float(e[i]),
-            )
-            for i, v in enumerate(p)
-            if f[i] in mal
-        ),
-        key=lambda x: x["parameter"],
-        reverse=True,
-    )
+    ids = as_id_array(f)
+    comparisons = np.sum(mt, axis=1)
+    known = np.array([anime_id in mal for anime_id in ids.tolist()], dtype=np.bool_)
+
+    def record(i: int) -> Result:
+        anime_id = int(ids[i])
+        result = Result(
+            mal_ID=anime_id,
+            parameter=p[i].item(),
+            num_comparisons=comparisons[i].item(),
+            num_lists=counter[anime_id],
+            pct_lists=counter[anime_id] / len(sample) * 100,
+            rel_error_pct=float(e[i]),
+        )
+        if intervals:
+            result["parameter_low"] = float(intervals["parameter_low"][i])
+            result["parameter_high"] = float(intervals["parameter_high"][i])
+            result["rank_low"] = int(intervals["rank_low"][i])
+            result["rank_high"] = int(intervals["rank_high"][i])
+        return result
+
+    return RankedView(top_k(p, num, known), record).tolist()
 
 
 def extract_list_for_website(timestamp: str, sample_path: str = SAMPLE_PATH) -> None:
     """Compute most recent data making it usable for the website."""
-    sample = load_samples(*glob.glob(sample_path))
-    with open("data/anime", "rb") as f:
-        anime = pickle.load(f)
-    path = glob.glob(f"data/{timestamp}_*")[0]
-    num = int(re.findall(r"_(\d+)$", path)[0])
-    list_p = sorted(glob.glob(f"{path}/parameter_*.npy"), key=lambda x: (len(x), x))[-1]
-    list_e = sorted(glob.glob(f"{path}/error_pct_*.npy"), key=lambda x: (len(x), x))[-1]
-    with open(list_p, "rb") as f:
+    with metrics.stage("load_samples"):
+        sample = load_samples(*glob.glob(sample_path))
+    with metrics.stage("load_anime_info"):
+        anime = load_anime_info(store_path=ANIME_PATH)
+    path = get_run_directory(timestamp)
+    num = int(path.rsplit("_", 1)[1])
+    checkpoint = get_last_checkpoint(path)
+    if checkpoint is None:
+        raise FileNotFoundError(f"No parameters computed in {path}")
+    with open(checkpoint[1], "rb") as f:
         p = np.load(f)
-    with open(list_e, "rb") as f:
+    with open(f"{path}/error_pct_{checkpoint[0]}.npy", "rb") as f:
         e = np.load(f)
-    with open(f"{path}/mt.npy", "rb") as f:
-        mt = np.load(f)
-    with open(f"{path}/reduced_map_order_id", "rb") as f:
-        map_order_id = pickle.load(f)
+    mt = load_symmetric(f"{path}/mt.npy")
+    map_order_id, _ = load_id_maps(path, "reduced_")
     with open(f"{path}/cutoff", "r", encoding="utf8") as f:
         cutoff = int(f.read())
+    replicates = load_replicates(path)
+    intervals = None
+    if replicates is not None:
+        # Ranks are computed among the exported entries only.
+        known = np.array([i in anime for i in map_order_id.tolist()], dtype=np.bool_)
+        intervals = bootstrap_intervals(replicates, mask=known)
+    with metrics.stage("convert_parameter_for_website"):
+        results = convert_parameter_for_website(
+            p=p,
+            mt=mt,
+            f=map_order_id,
+            mal=anime,
+            sample=sample,
+            e=e,
+            intervals=intervals,
+        )
     with open(f"docs/data/{num}_{cutoff}.json", "w", encoding="utf8") as f:
+        json.dump(results, f)
+    metrics.save(path)
+
+
+class HeadToHead(NamedTuple):
+    """Head-to-head data of a set of entries, in the order of the set."""
+
+    wins: Counts
+    total: Counts
+    predicted: NDArray[np.float64]
+
+
+def head_to_head(
+    table: Counts, indices: NDArray[np.intp], p: NDArray[np.floating[Any]]
+) -> HeadToHead:
+    """Return the observed wins, total comparisons and predicted probabilities
+    of i beating j, for i and j among the given indices of the table.
+
+    p holds the parameters of the entries with the given indices."""
+    wins = table[np.ix_(indices, indices)]
+    p_top = p.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        predicted = p_top[:, np.newaxis] / (p_top[:, np.newaxis] + p_top)
+    return HeadToHead(wins, wins + wins.T, np.nan_to_num(predicted, nan=0.5))
+
+
+def compress_blocks(
+    data: HeadToHead, block_size: int = H2H_BLOCK_SIZE
+) -> list[dict[str, Any]]:
+    """Return the blocks of the head-to-head matrices on or above the diagonal
+    with at least one comparison.
+
+    Entries below the diagonal follow from the symmetry of the matrices:
+    wins[j, i] = total[i, j] - wins[i, j], predicted[j, i] = 1 - predicted[i, j]."""
+    size = data.wins.shape[0]
+    blocks = []
+    for row in range(0, size, block_size):
+        for col in range(row, size, block_size):
+            block = np.s_[row : row + block_size, col : col + block_size]
+            if not np.any(data.total[block]):
+                continue
+            blocks.append(
+                {
+                    "row": row,
+                    "col": col,
+                    "wins": data.wins[block].tolist(),
+                    "total": data.total[block].tolist(),
+                    "predicted": np.round(data.predicted[block], H2H_DIGITS).tolist(),
+                }
+            )
+    return blocks
+
+
+def export_head_to_head(
+    timestamp: str, num: int = H2H_TOP_K, block_size: int = H2H_BLOCK_SIZE
+) -> None:
+    """Store the head-to-head data of the top entries of a run for the website.
+
+    The matrices are stored by blocks (see compress_blocks), with the IDs and the
+    parameters of the entries in order of rank.
+    The table is memory-mapped, so only the rows of the top entries are read."""
+    path = get_run_directory(timestamp)
+    size = int(path.rsplit("_", 1)[1])
+    checkpoint = get_last_checkpoint(path)
+    if checkpoint is None:
+        raise FileNotFoundError(f"No parameters computed in {path}")
+    p = np.load(checkpoint[1])
+    with open(f"{path}/cutoff", "r", encoding="utf8") as f:
+        cutoff = int(f.read())
+    table = np.load(f"{path}/table.npy", mmap_mode="r")
+    _, id_to_order = load_id_maps(path)
+    run_ids, _ = load_id_maps(path, "reduced_")
+    mal = load_titles(run_ids.tolist(), store_path=ANIME_PATH)
+    ids, titles = align_titles(run_ids, mal)
+    top = rank_view(p, ids, titles, num).order
+    with metrics.stage("head_to_head"):
+        matrices = head_to_head(table, translate_ids(id_to_order, ids[top]), p[top])
+    with open(f"docs/data/h2h_{size}_{cutoff}.json", "w", encoding="utf8") as f:
         json.dump(
-            convert_parameter_for_website(
-                p=p, mt=mt, f=map_order_id, mal=anime, sample=sample, e=e
-            ),
+            {
+                "ids": ids[top].tolist(),
+                "parameters": p[top].tolist(),
+                "block_size": block_size,
+                "blocks": compress_blocks(matrices, block_size),
+            },
             f,
+            separators=(",", ":"),
         )
+    metrics.save(path)
+
 
+_aligned_titles: tuple[NDArray[np.int_], NDArray[np.object_]]
 
-def extract_list(timestamp: str) -> None:
-    """Compute the sorted list of anime IDs from the computed parameters."""
-    path = glob.glob(f"data/{timestamp}_*")[0]
-    with open("data/anime", "rb") as f:
-        mal = pickle.load(f)
-    with open(f"{path}/reduced_map_order_id", "rb") as f:
-        map_order_id = pickle.load(f)
-    for p_path in tqdm(glob.glob(f"{path}/parameter_*.npy")):
-        num = int(re.findall(r"parameter_(\d+).npy", p_path)[0])
-        with open(p_path, "rb") as f:
-            p = np.load(f)
-        with open(f"{path}/list_{num}.json", "w", encoding="utf8") as f:
-            json.dump(extract_list_from_parameter(p, map_order_id, mal), f)
+
+def _init_extract_worker(ids: NDArray[np.int_], titles: NDArray[np.object_]) -> None:
+    """Share the aligned IDs and titles with a worker process."""
+    global _aligned_titles  # pylint: disable=global-statement
+    _aligned_titles = (ids, titles)
+
+
+def _extract_checkpoint(job: tuple[str, str, int | None]) -> None:
+    """Write the sorted list of a single parameter checkpoint."""
+    p_path, list_path, num = job
+    with open(p_path, "rb") as f:
+        p = np.load(f)
+    with open(list_path, "w", encoding="utf8") as f:
+        json.dump(rank_parameter(p, *_aligned_titles, num), f)
+
+
+def extract_list(
+    timestamp: str, num_workers: int = NUM_WORKERS, num: int | None = None
+) -> None:
+    """Compute the sorted list of anime IDs from the computed parameters.
+
+    If num is given, only the top num entries are stored, in list_<i>_top<num>.json.
+    Checkpoints whose list is newer than the parameter file are skipped."""
+    path = get_run_directory(timestamp)
+    map_order_id, _ = load_id_maps(path, "reduced_")
+    mal = load_titles(map_order_id.tolist(), store_path=ANIME_PATH)
+    todo: list[tuple[str, str, int | None]] = []
+    suffix = "" if num is None else f"_top{num}"
+    for p_path in glob.glob(f"{path}/parameter_*.npy"):
+        iterations = int(re.findall(r"parameter_(\d+).npy", p_path)[0])
+        list_path = f"{path}/list_{iterations}{suffix}.json"
+        if os.path.exists(list_path) and os.path.getmtime(
+            list_path
+        ) >= os.path.getmtime(p_path):
+            continue
+        todo.append((p_path, list_path, num))
+    with metrics.stage("extract_list"), ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_extract_worker,
+        initargs=align_titles(map_order_id, mal),
+    ) as executor:
+        for _ in tqdm(executor.map(_extract_checkpoint, todo), total=len(todo)):
+            pass
+    metrics.save(path)
+
+
+def rank_subsets(
+    timestamp: str,
+    subsets: list[dict[str, Any]],
+    num_iter: int = SUBSET_ITERATIONS,
+    num_workers: int = NUM_WORKERS,
+) -> list[str]:
+    """Rank the anime of each subset from the table and the parameters of a run.
+
+    Only the entries of the run are ranked, starting from its latest parameters.
+    The sorted list of each subset is stored in the subsets directory of the run.
+    Return the names of the subsets."""
+    path = get_run_directory(timestamp)
+    checkpoint = get_last_checkpoint(path)
+    if checkpoint is None:
+        raise FileNotFoundError(f"No parameters computed in {path}")
+    with open(checkpoint[1], "rb") as f:
+        p_run = np.load(f)
+    data = load_table(path)
+    _, id_to_order = load_id_maps(path)
+    run_ids, _ = load_id_maps(path, "reduced_")
+    # Parameters of the whole table, zero for the entries excluded from the run.
+    p = np.zeros(data.order_to_id.shape, dtype=p_run.dtype)
+    in_run = np.zeros(data.order_to_id.shape, dtype=bool)
+    run_indices = translate_ids(id_to_order, run_ids)
+    p[run_indices] = p_run
+    in_run[run_indices] = True
+    with metrics.stage("select_subsets"):
+        selected = load_subsets(subsets, store_path=ANIME_PATH)
+    indices = []
+    for anime_ids in selected.values():
+        subset = translate_ids(id_to_order, np.array(anime_ids, dtype=np.int_))
+        subset = np.unique(subset[subset >= 0])
+        indices.append(subset[in_run[subset]])
+    mal = load_titles(run_ids.tolist(), store_path=ANIME_PATH)
+    ids, titles = align_titles(data.order_to_id, mal)
+    Path(f"{path}/{SUBSET_DIR}").mkdir(exist_ok=True)
+    with metrics.stage("fit_subsets"):
+        for name, (subset, p_subset) in tqdm(
+            zip(
+                selected,
+                fit_subsets(data.table, p, indices, num_iter, num_workers),
+            ),
+            total=len(indices),
+        ):
+            with open(
+                f"{path}/{SUBSET_DIR}/{name}_{checkpoint[0]}.json", "w", encoding="utf8"
+            ) as f:
+                json.dump(rank_parameter(p_subset, ids[subset], titles[subset]), f)
+    metrics.save(path)
+    return list(selected)
 
 
 def extract_mal_info(
-    source_path: str = "data/anime", destination_path: str = "docs/data/anime.json"
+    source_path: str = ANIME_PATH, destination_path: str = "docs/data/anime.json"
 ) -> None:
     """Create a JSON copy of a reduced dictionary with selected entries."""
-    with open(source_path, "rb") as f:
-        anime = pickle.load(f)
+    anime = load_anime_info(store_path=source_path)
     new_anime = {
         anime_id: {
             "title": entry["title"],
-            "picture": entry["main_picture"]["medium"]
-            if "main_picture" in entry
-            else None,
-            "title_en": entry["alternative_titles"]["en"]
-            if "alternative_titles" in entry and "en" in entry["alternative_titles"]
-            else None,
-            "score": entry["mean"] if "mean" in entry else None,
-            "rank": entry["rank"] if "rank" in entry else None,
-            "popularity": entry["popularity"] if "popularity" in entry else None,
+            "picture": entry["picture"],
+            "title_en": entry["title_en"],
+            "score": entry["mean"],
+            "rank": entry["rank"],
+            "popularity": entry["popularity"],
         }
         for anime_id, entry in anime.items()
     }
@@ -277,8 +1166,9 @@ if __name__ == "__main__":
         "--number",
         metavar="N",
         type=int,
-        default=SAVE_EVERY,
-        help=f"number of iterations before saving partial data, default={SAVE_EVERY}",
+        default=None,
+        help="number of iterations before saving partial data, "
+        f"default={SAVE_EVERY}, {SUBSET_ITERATIONS} with --subsets",
     )
     parser.add_argument(
         "-p",
@@ -298,8 +1188,50 @@ if __name__ == "__main__":
         "--cutoff",
         metavar="C",
         type=int,
+        nargs="+",
+        default=[0],
+        help="cutoff of total comparisons to include an entry, default=0; "
+        "with --derive, one run is created for each cutoff",
+    )
+    parser.add_argument(
+        "-d",
+        "--derive",
+        metavar="D",
+        type=str,
+        default="",
+        help="timestamp on the data folder, create runs with other filters from its table",
+    )
+    parser.add_argument(
+        "--window",
+        metavar=("START", "STOP"),
+        type=int,
+        nargs=2,
+        action="append",
+        default=None,
+        help="with --derive, only use the users whose latest update is in the years "
+        "from START to STOP included; can be repeated, one run per window",
+    )
+    parser.add_argument(
+        "--rules",
+        choices=sorted(RULES),
+        nargs="+",
+        default=[],
+        help="with --prepare, also store the tables of these comparison rules; "
+        "with --derive, create the runs for each of these rules",
+    )
+    parser.add_argument(
+        "--weighting",
+        choices=sorted(WEIGHTINGS),
+        default=None,
+        help="with --derive, weight each user by the total weight of their wins, "
+        "giving tables with fractional counts",
+    )
+    parser.add_argument(
+        "--steps",
+        metavar="S",
+        type=int,
         default=0,
-        help="cutoff of total comparisons to include an entry, default=0",
+        help="with --derive, iterate the new runs concurrently for S saves, default=0",
     )
     parser.add_argument(
         "-f",
@@ -309,6 +1241,12 @@ if __name__ == "__main__":
         default=0,
         help="pre-filter by number of lists with the anime",
     )
+    parser.add_argument(
+        "-s",
+        "--connected",
+        action="store_true",
+        help="only keep the main strongly connected component of the win graph",
+    )
     parser.add_argument(
         "-l",
         "--list",
@@ -322,13 +1260,212 @@ if __name__ == "__main__":
         "--website",
         action="store_true",
     )
+    parser.add_argument(
+        "-b",
+        "--bootstrap",
+        metavar="B",
+        type=str,
+        default="",
+        help="timestamp on the data folder, fit bootstrap replicates of its sample",
+    )
+    parser.add_argument(
+        "-r",
+        "--replicates",
+        metavar="R",
+        type=int,
+        default=NUM_REPLICATES,
+        help=f"number of bootstrap replicates, default={NUM_REPLICATES}",
+    )
+    parser.add_argument(
+        "--subsets",
+        metavar="S",
+        type=str,
+        default="",
+        help="timestamp on the data folder, rank subsets of its anime, "
+        "iterating up to N times",
+    )
+    parser.add_argument(
+        "--subset",
+        metavar="FIELD=VALUE[,...]",
+        type=str,
+        action="append",
+        default=[],
+        help=f"with --subsets, a subset to rank, fields: {', '.join(FILTERS)}",
+    )
+    parser.add_argument(
+        "--by",
+        choices=sorted(FILTERS),
+        nargs="+",
+        default=[],
+        help="with --subsets, rank one subset for each value of the given fields",
+    )
+    parser.add_argument(
+        "--head-to-head",
+        metavar="H",
+        type=str,
+        default="",
+        help="timestamp on the data folder, export the head-to-head data of its "
+        "top entries for the website",
+    )
+    parser.add_argument(
+        "--top",
+        metavar="K",
+        type=int,
+        default=None,
+        help="with --head-to-head or --list, number of top entries, "
+        f"default={H2H_TOP_K} with --head-to-head and all with --list",
+    )
+    parser.add_argument(
+        "-t",
+        "--telemetry",
+        action="store_true",
+        help="with --iterate, log the convergence metrics of every iteration",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=sorted(PRECISIONS),
+        default=None,
+        help="with --prepare or --iterate, precision of the parameters, "
+        f"stored in the run directory, default={DEFAULT_PRECISION}",
+    )
+    parser.add_argument(
+        "-k",
+        "--kernel",
+        choices=KERNELS,
+        default="numpy",
+        help="with --iterate, implementation of the iteration, "
+        "threads and numba use up to --jobs threads, default=numpy",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="with --iterate, stop when the iterations no longer increase the likelihood",
+    )
+    parser.add_argument(
+        "--log-space",
+        action="store_true",
+        help="with --iterate, iterate the logarithm of the parameters",
+    )
+    parser.add_argument(
+        "--summary",
+        metavar="S",
+        type=str,
+        default="",
+        help="timestamp on the data folder, summarise its convergence telemetry",
+    )
+    parser.add_argument(
+        "--tolerance",
+        metavar="T",
+        type=float,
+        default=None,
+        help="with --summary, target max delta of an iteration, default: the "
+        "square root of the machine epsilon of the parameters times the largest one",
+    )
+    parser.add_argument(
+        "-m",
+        "--metrics",
+        action="store_true",
+        help="store timings and memory usage in metrics.json in the run directory",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="with --metrics, also store a cProfile dump in the run directory",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="with --metrics, also trace the peak memory of each stage",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="J",
+        type=int,
+        default=NUM_WORKERS,
+        help=f"number of worker processes, default={NUM_WORKERS}",
+    )
     args = parser.parse_args()
+    if len(args.cutoff) > 1 and not args.derive:
+        parser.error("several cutoffs are only supported with --derive")
+    if args.weighting and not args.derive:
+        parser.error("--weighting is only supported with --derive")
+    if args.number is None:
+        args.number = SUBSET_ITERATIONS if args.subsets else SAVE_EVERY
+    metrics.configure(
+        command=" ".join(sys.argv[1:]),
+        enabled=args.metrics,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+    )
     if args.prepare:
-        initialise(cutoff=args.cutoff, curb=args.filter)
+        initialise(
+            cutoff=args.cutoff[0],
+            curb=args.filter,
+            connected=args.connected,
+            precision=args.precision or DEFAULT_PRECISION,
+            rules=args.rules,
+        )
+    elif args.derive:
+        derived = [
+            timestamp
+            for rule in args.rules or [DEFAULT_RULE]
+            for timestamp in derive_runs(
+                timestamp=args.derive,
+                cutoffs=args.cutoff,
+                curb=args.filter,
+                connected=args.connected,
+                precision=args.precision,
+                windows=[tuple(window) for window in args.window or []],
+                rule=rule,
+                weighting=args.weighting,
+            )
+        ]
+        print("Created runs: " + " ".join(derived))
+        if args.steps:
+            fit_runs(
+                derived,
+                num_iter=args.number,
+                num_steps=args.steps,
+                num_workers=args.jobs,
+            )
     elif args.iterate:
-        iterate(timestamp=args.iterate, num_iter=args.number)
+        iterate(
+            timestamp=args.iterate,
+            num_iter=args.number,
+            telemetry=args.telemetry,
+            check=args.check,
+            log_space=args.log_space,
+            precision=args.precision,
+            kernel=args.kernel,
+            num_threads=args.jobs,
+        )
+    elif args.summary:
+        summarise_telemetry(get_run_directory(args.summary), tolerance=args.tolerance)
+    elif args.bootstrap:
+        bootstrap_run(
+            timestamp=args.bootstrap,
+            num_replicates=args.replicates,
+            num_iter=args.number,
+            num_workers=args.jobs,
+        )
+    elif args.subsets:
+        specs = [parse_subset(spec) for spec in args.subset]
+        if args.by:
+            conn = get_store_connection(ANIME_PATH)
+            specs.extend(enumerate_subsets(conn, args.by))
+            conn.close()
+        ranked = rank_subsets(
+            timestamp=args.subsets,
+            subsets=specs,
+            num_iter=args.number,
+            num_workers=args.jobs,
+        )
+        print(f"Ranked {len(ranked)} subsets")
+    elif args.head_to_head:
+        export_head_to_head(timestamp=args.head_to_head, num=args.top or H2H_TOP_K)
     elif args.list:
         if args.website:
             extract_list_for_website(timestamp=args.list)
         else:
-            extract_list(timestamp=args.list)
+            extract_list(timestamp=args.list, num_workers=args.jobs, num=args.top)
@@ -0,0 +1,140 @@
+"""Manifest of the artifacts of a run and cache of the artifacts shared by runs.
+
+Artifacts are stored in data/cache/<key>, where the key is the hash of the inputs
+they are computed from, and hard-linked into the run directories using them.
+The manifest of a run lists the inputs and the key of every artifact."""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable, TypedDict
+
+CACHE_DIR = "data/cache"
+MANIFEST_FILE = "manifest.json"
+FINGERPRINTS_FILE = "fingerprints.json"
+INFO_FILE = "info.json"
+CHUNK_SIZE = 1 << 20
+
+
+class Fingerprint(TypedDict):
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+def hash_file(path: str) -> str:
+    """Return the SHA-256 digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_files(
+    paths: Iterable[str], cache_dir: str = CACHE_DIR
+) -> dict[str, Fingerprint]:
+    """Return the fingerprints of the given files.
+
+    Files with the same size and modification time as when they were last
+    fingerprinted are not hashed again."""
+    known: dict[str, Fingerprint] = {}
+    known_path = f"{cache_dir}/{FINGERPRINTS_FILE}"
+    if os.path.exists(known_path):
+        with open(known_path, encoding="utf8") as f:
+            known = json.load(f)
+    fingerprints = {}
+    for path in paths:
+        stat = os.stat(path)
+        previous = known.get(path)
+        if (
+            previous
+            and previous["size"] == stat.st_size
+            and previous["mtime_ns"] == stat.st_mtime_ns
+        ):
+            fingerprints[path] = previous
+            continue
+        fingerprints[path] = known[path] = Fingerprint(
+            size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=hash_file(path)
+        )
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    with open(known_path, "w", encoding="utf8") as f:
+        json.dump(known, f, indent=2)
+    return fingerprints
+
+
+def input_key(**inputs: Any) -> str:
+    """Return the key of an artifact computed from the given inputs."""
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True).encode("utf8")
+    ).hexdigest()[:16]
+
+
+def get_cache_entry(
+    key: str, names: Iterable[str], cache_dir: str = CACHE_DIR
+) -> str | None:
+    """Return the cache directory of the key, if it contains all the given files."""
+    path = f"{cache_dir}/{key}"
+    if all(os.path.exists(f"{path}/{name}") for name in (*names, INFO_FILE)):
+        return path
+    return None
+
+
+def load_info(path: str) -> dict[str, Any]:
+    """Return the information stored with the artifacts of a cache entry."""
+    with open(f"{path}/{INFO_FILE}", encoding="utf8") as f:
+        return json.load(f)
+
+
+def save_info(path: str, **info: Any) -> None:
+    """Mark a cache entry as complete, storing information about its artifacts.
+
+    Call after every artifact of the entry has been written."""
+    with open(f"{path}/{INFO_FILE}", "w", encoding="utf8") as f:
+        json.dump(info, f)
+
+
+def link_artifact(source: str, target: str) -> None:
+    """Hard-link an artifact to the target path, copying it if the link fails."""
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def link_artifacts(source: str, destination: str, names: Iterable[str]) -> None:
+    """Hard-link artifacts into a run directory, copying them if links fail."""
+    for name in names:
+        link_artifact(f"{source}/{name}", f"{destination}/{name}")
+
+
+def save_manifest(
+    directory: str, inputs: dict[str, Any], artifacts: dict[str, dict[str, Any]]
+) -> None:
+    """Store the manifest of a run.
+
+    artifacts maps each file to the key of its inputs and whether it was reused."""
+    with open(f"{directory}/{MANIFEST_FILE}", "w", encoding="utf8") as f:
+        json.dump(
+            {
+                "created": datetime.now().strftime("%Y%m%d-%H%M%S"),
+                "inputs": inputs,
+                "artifacts": artifacts,
+            },
+            f,
+            indent=2,
+        )
+
+
+def load_manifest(directory: str) -> dict[str, Any] | None:
+    """Return the manifest of a run, if any."""
+    path = f"{directory}/{MANIFEST_FILE}"
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf8") as f:
+        return json.load(f)
@@ -1,5 +1,5 @@
 from enum import StrEnum, auto
-from typing import Required, TypedDict
+from typing import NotRequired, Required, TypedDict
 
 
 class Relation(StrEnum):
@@ -183,7 +183,20 @@ class ResultShort(TypedDict):
 class Result(TypedDict):
     mal_ID: int
     parameter: float
-    num_comparisons: int
+    num_comparisons: float  # Fractional for tables with weighted users.
     num_lists: int
     pct_lists: float
     rel_error_pct: float
+    parameter_low: NotRequired[float]
+    parameter_high: NotRequired[float]
+    rank_low: NotRequired[int]
+    rank_high: NotRequired[int]
+
+
+class AnimeSummary(TypedDict):
+    title: str
+    title_en: str | None
+    picture: str | None
+    mean: float | None
+    rank: int | None
+    popularity: int | None
@@ -0,0 +1,229 @@
+"""Local HTTP service answering queries on the rankings of a run.
+
+The parameters of the latest checkpoint, the anime IDs and the titles are loaded
+once and indexed in memory; the anime of each filter are selected from the anime
+database on first use and cached.
+
+Endpoints (GET, JSON responses):
+    /top?n=N&offset=K&FIELD=VALUE...  entries by decreasing parameter, optionally
+                                      filtered by the fields of subrankings.FILTERS
+    /rank?id=ID                       rank and parameter of an anime
+    /compare?a=ID&b=ID                probability that a wins against b
+    /search?q=TEXT&n=N                entries whose title contains the text
+"""
+
+import argparse
+import json
+from functools import lru_cache
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from numpy.typing import NDArray
+
+from anime_store import ANIME_STORE, get_store_connection, load_titles
+from mal_rankings import get_last_checkpoint, get_run_directory
+from ranked_view import top_k
+from subrankings import FILTERS, select_subset
+from utils import build_id_lookup, load_id_maps, translate_ids
+
+HOST = "127.0.0.1"
+PORT = 8000
+TOP_N = 50
+MAX_N = 1000
+CACHE_SIZE = 256  # Number of filtered views kept in memory.
+
+
+class QueryError(Exception):
+    """Invalid query, answered with status 400."""
+
+
+class UnknownEndpoint(Exception):
+    """Query of an endpoint that does not exist, answered with status 404."""
+
+
+class RankingIndex:
+    """In-memory indexes of the ranking of a run."""
+
+    def __init__(
+        self,
+        p: NDArray[np.floating[Any]],
+        ids: NDArray[np.integer[Any]],
+        titles: dict[int, str],
+        store_path: str = ANIME_STORE,
+    ) -> None:
+        self.p = p
+        self.ids = np.asarray(ids, dtype=np.int_)
+        self.store_path = store_path
+        self.lookup = build_id_lookup(self.ids)
+        # Entries without a title are not ranked.
+        titled = np.array([i in titles for i in self.ids.tolist()], dtype=np.bool_)
+        self.order = top_k(p, mask=titled)
+        self.rank = np.zeros(p.shape[0], dtype=np.int_)
+        self.rank[self.order] = np.arange(1, self.order.shape[0] + 1)
+        self.titles = [titles.get(i, "") for i in self.ids.tolist()]
+        self.search_titles = [title.casefold() for title in self.titles]
+        self.filtered_order = lru_cache(maxsize=CACHE_SIZE)(self._filtered_order)
+
+    @classmethod
+    def from_run(cls, timestamp: str, store_path: str = ANIME_STORE) -> "RankingIndex":
+        """Return the index of the latest checkpoint of a run."""
+        path = get_run_directory(timestamp)
+        checkpoint = get_last_checkpoint(path)
+        if checkpoint is None:
+            raise FileNotFoundError(f"No parameters computed in {path}")
+        p = np.load(checkpoint[1])
+        ids, _ = load_id_maps(path, "reduced_")
+        return cls(p, ids, load_titles(ids.tolist(), store_path), store_path)
+
+    def entry(self, index: int) -> dict[str, Any]:
+        """Return the record of the entry with the given index."""
+        return {
+            "rank": int(self.rank[index]),
+            "mal_ID": int(self.ids[index]),
+            "title": self.titles[index],
+            "parameter": float(self.p[index]),
+        }
+
+    def index_of(self, anime_id: int) -> int:
+        """Return the index of a ranked anime."""
+        index = int(translate_ids(self.lookup, np.array([anime_id]))[0])
+        if index < 0 or not self.rank[index]:
+            raise QueryError(f"Anime {anime_id} is not ranked")
+        return index
+
+    def _filtered_order(self, filters: tuple[tuple[str, str], ...]) -> NDArray[np.intp]:
+        """Return the ranked indices of the anime satisfying the filters."""
+        if not filters:
+            return self.order
+        conn = get_store_connection(self.store_path)
+        try:
+            anime_ids = select_subset(conn, dict(filters))
+        finally:
+            conn.close()
+        selected = np.zeros(self.p.shape[0], dtype=np.bool_)
+        indices = translate_ids(self.lookup, np.array(anime_ids, dtype=np.int_))
+        selected[indices[indices >= 0]] = True
+        return self.order[selected[self.order]]
+
+    def top(
+        self, n: int = TOP_N, offset: int = 0, filters: dict[str, str] | None = None
+    ) -> list[dict[str, Any]]:
+        """Return the ranked entries from offset, satisfying the filters."""
+        order = self.filtered_order(tuple(sorted((filters or {}).items())))
+        return [self.entry(i) for i in order[offset : offset + n].tolist()]
+
+    def compare(self, anime_a: int, anime_b: int) -> dict[str, Any]:
+        """Return the probability that a wins against b, p_a / (p_a + p_b)."""
+        a, b = self.index_of(anime_a), self.index_of(anime_b)
+        total = float(self.p[a]) + float(self.p[b])
+        return {
+            "a": self.entry(a),
+            "b": self.entry(b),
+            "probability": float(self.p[a]) / total if total else 0.5,
+        }
+
+    def search(self, text: str, n: int = TOP_N) -> list[dict[str, Any]]:
+        """Return the best ranked entries whose title contains the text."""
+        text = text.casefold()
+        matches = [i for i in self.order.tolist() if text in self.search_titles[i]]
+        return [self.entry(i) for i in matches[:n]]
+
+
+def get_int(
+    query: dict[str, list[str]],
+    name: str,
+    default: int | None = None,
+    minimum: int | None = None,
+) -> int:
+    """Return an integer parameter of a query, at least minimum if given."""
+    if name not in query:
+        if default is None:
+            raise QueryError(f"Missing parameter {name}")
+        return default
+    try:
+        value = int(query[name][0])
+    except ValueError as e:
+        raise QueryError(f"Parameter {name} must be an integer") from e
+    if minimum is not None and value < minimum:
+        raise QueryError(f"Parameter {name} must be at least {minimum}")
+    return value
+
+
+def answer(index: RankingIndex, path: str, query: dict[str, list[str]]) -> Any:
+    """Return the answer to a query on the index."""
+    n = min(get_int(query, "n", TOP_N, minimum=0), MAX_N)
+    if path == "/top":
+        filters = {name: query[name][0] for name in FILTERS if name in query}
+        return index.top(n, get_int(query, "offset", 0, minimum=0), filters)
+    if path == "/rank":
+        return index.entry(index.index_of(get_int(query, "id")))
+    if path == "/compare":
+        return index.compare(get_int(query, "a"), get_int(query, "b"))
+    if path == "/search":
+        return index.search(query.get("q", [""])[0], n)
+    raise UnknownEndpoint(path)
+
+
+def make_handler(index: RankingIndex) -> Callable[..., BaseHTTPRequestHandler]:
+    """Return the request handler class serving the given index."""
+
+    class Handler(BaseHTTPRequestHandler):
+        """Answer GET requests with JSON."""
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            """Answer a query."""
+            url = urlparse(self.path)
+            try:
+                status, body = HTTPStatus.OK, answer(
+                    index, url.path, parse_qs(url.query)
+                )
+            except QueryError as e:
+                status, body = HTTPStatus.BAD_REQUEST, {"error": str(e)}
+            except UnknownEndpoint:
+                status, body = HTTPStatus.NOT_FOUND, {"error": "Unknown endpoint"}
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self.log_error("Error answering %s: %r", self.path, e)
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                body = {"error": "Internal error"}
+            content = json.dumps(body).encode("utf8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+def serve(
+    timestamp: str,
+    host: str = HOST,
+    port: int = PORT,
+    store_path: str = ANIME_STORE,
+) -> None:
+    """Serve the rankings of a run until interrupted."""
+    index = RankingIndex.from_run(timestamp, store_path)
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    print(f"Serving {index.order.shape[0]} entries on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "timestamp",
+        type=str,
+        help="timestamp on the data folder of the run to serve",
+    )
+    parser.add_argument("--host", type=str, default=HOST, help=f"default={HOST}")
+    parser.add_argument("--port", type=int, default=PORT, help=f"default={PORT}")
+    args = parser.parse_args()
+    serve(args.timestamp, args.host, args.port)
@@ -0,0 +1,69 @@
+"""Views of entries ranked by decreasing value, such as the parameters of a run.
+
+Only the entries that are needed are selected and sorted, and their records are
+created when accessed, so many small views (top N per cutoff, per checkpoint) of
+tens of thousands of entries are cheap."""
+
+from typing import Any, Callable, Generic, Iterator, TypeVar, overload
+
+import numpy as np
+from numpy.typing import NDArray
+
+T = TypeVar("T")
+
+
+def top_k(
+    values: NDArray[Any], k: int | None = None, mask: NDArray[np.bool_] | None = None
+) -> NDArray[np.intp]:
+    """Return the indices of the k largest values, in decreasing order.
+
+    Only the indices in mask are considered; all of them if k is None.
+    Equal values keep the order of their indices, as in a stable sort, and NaN
+    values come last, as in np.argsort."""
+    candidates = np.arange(values.shape[0]) if mask is None else np.flatnonzero(mask)
+    selected = values[candidates]
+    if np.issubdtype(selected.dtype, np.floating):
+        nan = np.isnan(selected)
+        if np.any(nan):
+            top = top_k(selected[~nan], k)
+            return np.concatenate((candidates[~nan][top], candidates[nan]))[:k]
+    if k is not None and k < selected.shape[0]:
+        if k <= 0:
+            return candidates[:0]
+        threshold = np.partition(selected, selected.shape[0] - k)[-k]
+        above = np.flatnonzero(selected > threshold)
+        equal = np.flatnonzero(selected == threshold)[: k - above.shape[0]]
+        kept = np.sort(np.concatenate((above, equal)))
+        candidates, selected = candidates[kept], selected[kept]
+    return candidates[np.argsort(-selected, kind="stable")]
+
+
+class RankedView(Generic[T]):
+    """Sequence of the records of ranked entries, created when accessed."""
+
+    def __init__(self, order: NDArray[np.intp], record: Callable[[int], T]) -> None:
+        self.order = order
+        self.record = record
+
+    def __len__(self) -> int:
+        return self.order.shape[0]
+
+    @overload
+    def __getitem__(self, key: int) -> T:
+        ...
+
+    @overload
+    def __getitem__(self, key: slice) -> "RankedView[T]":
+        ...
+
+    def __getitem__(self, key: int | slice) -> "T | RankedView[T]":
+        if isinstance(key, slice):
+            return RankedView(self.order[key], self.record)
+        return self.record(int(self.order[key]))
+
+    def __iter__(self) -> Iterator[T]:
+        return (self.record(i) for i in self.order.tolist())
+
+    def tolist(self) -> list[T]:
+        """Return the records of all the entries of the view."""
+        return list(self)
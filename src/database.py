@@ -2,12 +2,14 @@ import csv
 import sqlite3
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Iterator
 
 from models import Anime
 
 DB_DIR_PATH = Path(__file__).resolve().parent.parent / "data"
 SCRIPT_PATH = Path(__file__).resolve().parent / "queries"
 CSV_DIR_PATH = Path(__file__).resolve().parent.parent / "outputs"
+RESUME_BATCH_SIZE = 1000  # IDs planned per query when resuming a scraper.
 
 
 def adapt_date_iso(val: datetime) -> str:
@@ -41,6 +43,103 @@ def get_connection(db_name: str) -> sqlite3.Connection:
     return conn
 
 
+def database_file(conn: sqlite3.Connection) -> str:
+    """Return the path of the main database of a connection."""
+    for row in conn.execute("PRAGMA database_list"):
+        if row[1] == "main":
+            return row[2]
+    raise ValueError("Connection without a main database")
+
+
+def iter_ids(
+    conn: sqlite3.Connection,
+    query: str,
+    params: dict[str, Any],
+    after: int,
+    batch_size: int = RESUME_BATCH_SIZE,
+) -> Iterator[int]:
+    """Yield the IDs selected by the query, one batch of increasing IDs at a time.
+
+    The query selects the IDs larger than :after, at most :limit of them."""
+    while True:
+        rows = conn.execute(
+            query, {**params, "after": after, "limit": batch_size}
+        ).fetchall()
+        if not rows:
+            return
+        yield from (row[0] for row in rows)
+        after = rows[-1][0]
+
+
+def plan_remaining_ids(
+    data_db: sqlite3.Connection,
+    api_db: sqlite3.Connection,
+    table: str,
+    column: str,
+    endpoint: str,
+    stop: int,
+    start: int = 1,
+    failed_first: bool = True,
+    batch_size: int = RESUME_BATCH_SIZE,
+) -> Iterator[int]:
+    """Yield the IDs between start and stop still to be scraped.
+
+    An ID is done if it is in the column of the table, or if the API answered 404.
+    If failed_first, the IDs whose last API call failed are yielded first.
+    The IDs are planned in batches by an indexed query on a separate connection, so
+    they can be consumed while the scraper writes to the databases."""
+    conn = sqlite3.connect(database_file(data_db))
+    conn.execute("ATTACH DATABASE ? AS api", (database_file(api_db),))
+    params = {"endpoint": endpoint, "stop": stop, "failed_first": failed_first}
+    try:
+        if failed_first:
+            yield from iter_ids(
+                conn,
+                f"""
+                SELECT c.element_id FROM api.api_call c
+                WHERE
+                    c.endpoint = :endpoint
+                AND c.response NOT IN (200, 404)
+                AND c.element_id > :after
+                AND c.element_id <= :stop
+                AND NOT EXISTS (
+                    SELECT 1 FROM {table} t WHERE t.{column} = c.element_id
+                )
+                ORDER BY c.element_id
+                LIMIT :limit
+                """,
+                params,
+                start - 1,
+                batch_size,
+            )
+        yield from iter_ids(
+            conn,
+            f"""
+            WITH RECURSIVE ids(id) AS (
+                SELECT :after + 1 WHERE :after < :stop
+                UNION ALL
+                SELECT id + 1 FROM ids WHERE id < :stop
+            )
+            SELECT id FROM ids
+            WHERE
+                NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{column} = ids.id)
+            AND NOT EXISTS (
+                SELECT 1 FROM api.api_call c
+                WHERE
+                    c.endpoint = :endpoint
+                AND c.element_id = ids.id
+                AND (c.response = 404 OR (:failed_first AND c.response != 200))
+            )
+            LIMIT :limit
+            """,
+            params,
+            start - 1,
+            batch_size,
+        )
+    finally:
+        conn.close()
+
+
 def insert_anime(anime_db: sqlite3.Connection, anime: Anime) -> None:
     alt_titles = anime.get("alternative_titles", None)
     start_season = anime.get("start_season", None)
@@ -0,0 +1,9 @@
+CREATE TABLE IF NOT EXISTS "anime_info" (
+    "anime_id" INTEGER NOT NULL PRIMARY KEY,
+    "title" TEXT NOT NULL,
+    "title_en" TEXT,
+    "picture" TEXT,
+    "mean" REAL,
+    "rank" INTEGER,
+    "popularity" INTEGER
+) WITHOUT ROWID;
@@ -1,19 +1,22 @@
 import time
 from datetime import UTC, datetime
+from pathlib import Path
 from sqlite3 import Connection
-from typing import Any
+from typing import Any, Iterator
 
 import requests
 from ratelimit import limits, sleep_and_retry
 from tqdm import tqdm
 
 from config import CALLS, HEADERS, LINK_ANIME_ID, MAL_ANIME, PERIOD, TIMEOUT
-from database import get_connection, insert_anime
+from database import DB_DIR_PATH, get_connection, insert_anime, plan_remaining_ids
 from logger import logging
 from models import Anime
 
 ANIME_DB = get_connection("anime")
 API_DB = get_connection("api")
+# Written by check_integrity.py, anime in most lists first.
+BACKFILL_QUEUE = DB_DIR_PATH / "backfill_queue.txt"
 
 
 class QueryError(Exception):
@@ -81,19 +84,6 @@ def get_anime_from_id(
         logging.info("Entry %s successfully added to the database", anime_id)
 
 
-def get_latest_valid_anime_id(anime_db: Connection = ANIME_DB) -> int:
-    q = anime_db.execute("SELECT MAX(anime_id) FROM anime").fetchone()
-    return q[0] or 0
-
-
-def get_first_failed_anime_id(api_db: Connection = API_DB) -> int | None:
-    q = api_db.execute(
-        """SELECT MIN(element_id) FROM api_call
-        WHERE endpoint = "anime" AND response != 404 AND response != 200"""
-    ).fetchone()
-    return q[0]
-
-
 def get_failed_anime_id(api_db: Connection = API_DB) -> set[int]:
     q = api_db.execute(
         """SELECT element_id FROM api_call WHERE endpoint = "anime" AND response != 404"""
@@ -101,28 +91,38 @@ def get_failed_anime_id(api_db: Connection = API_DB) -> set[int]:
     return {x[0] for x in q}
 
 
-def get_invalid_anime_id(api_db: Connection = API_DB) -> set[int]:
-    q = api_db.execute(
-        """SELECT element_id FROM api_call WHERE endpoint = "anime" AND response = 404"""
-    ).fetchall()
-    return {x[0] for x in q}
+def get_all_anime(
+    anime_db: Connection = ANIME_DB,
+    api_db: Connection = API_DB,
+    failed_first: bool = True,
+) -> None:
+    remaining = plan_remaining_ids(
+        anime_db,
+        api_db,
+        "anime",
+        "anime_id",
+        "anime",
+        MAL_ANIME,
+        failed_first=failed_first,
+    )
+    for anime_id in tqdm(remaining):
+        get_anime_from_id(anime_id, anime_db, api_db)
 
 
-def get_all_anime_id(anime_db: Connection = ANIME_DB) -> set[int]:
-    q = anime_db.execute("SELECT anime_id FROM anime ORDER BY anime_id").fetchall()
-    return {x[0] for x in q}
+def read_queue(path: Path = BACKFILL_QUEUE) -> Iterator[int]:
+    """Yield the anime IDs of a backfill queue, in order."""
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield int(line)
 
 
-def get_all_anime(anime_db: Connection = ANIME_DB, api_db: Connection = API_DB) -> None:
-    latest_valid = get_latest_valid_anime_id(anime_db)
-    first_failed = get_first_failed_anime_id(api_db)
-    start = min(first_failed, latest_valid) if first_failed else latest_valid + 1
-    done_ids = get_all_anime_id(anime_db)
-    not_anime = get_invalid_anime_id(api_db)
-    invalid_ids = done_ids | not_anime
-    for anime_id in tqdm(range(start, MAL_ANIME + 1)):
-        if anime_id in invalid_ids:
-            continue
+def get_queued_anime(
+    anime_db: Connection = ANIME_DB,
+    api_db: Connection = API_DB,
+    path: Path = BACKFILL_QUEUE,
+) -> None:
+    for anime_id in tqdm(list(read_queue(path))):
         get_anime_from_id(anime_id, anime_db, api_db)
 
 
@@ -9,7 +9,7 @@ from ratelimit import limits, sleep_and_retry
 from tqdm import tqdm
 
 from config import CALLS, HEADERS, LINK_COMPANY_ID, MAL_COMPANY, PERIOD, TIMEOUT
-from database import get_connection
+from database import get_connection, plan_remaining_ids
 from logger import logging
 
 ANIME_DB = get_connection("anime")
@@ -115,7 +115,7 @@ def get_company_from_id(
             UPDATE api_call
             SET response=1
             WHERE
-                endpoint = "company"
+                endpoint = "producer"
             AND element_id = ?
             """,
             (company_id,),
@@ -125,43 +125,21 @@ def get_company_from_id(
         logging.info("Entry %s successfully added to the database", company_id)
 
 
-def get_latest_valid_company_id(anime_db: Connection = ANIME_DB) -> int:
-    q = anime_db.execute("SELECT MAX(company_id) FROM company").fetchone()
-    return q[0] or 0
-
-
-def get_first_failed_company_id(api_db: Connection = API_DB) -> int | None:
-    q = api_db.execute(
-        """SELECT MIN(element_id) FROM api_call
-        WHERE endpoint = "company" AND response != 404 AND response != 200"""
-    ).fetchone()
-    return q[0]
-
-
-def get_all_company_id(anime_db: Connection = ANIME_DB) -> set[int]:
-    q = anime_db.execute("SELECT company_id FROM company").fetchall()
-    return {x[0] for x in q}
-
-
-def get_invalid_company_id(api_db: Connection = API_DB) -> set[int]:
-    q = api_db.execute(
-        """SELECT element_id FROM api_call WHERE endpoint = "company" AND response = 404"""
-    ).fetchall()
-    return {x[0] for x in q}
-
-
 def get_all_companies(
-    anime_db: Connection = ANIME_DB, api_db: Connection = API_DB
+    anime_db: Connection = ANIME_DB,
+    api_db: Connection = API_DB,
+    failed_first: bool = True,
 ) -> None:
-    latest_valid = get_latest_valid_company_id(anime_db)
-    first_failed = get_first_failed_company_id(api_db)
-    start = min(first_failed, latest_valid) if first_failed else latest_valid + 1
-    done_ids = get_all_company_id(anime_db)
-    not_company = get_invalid_company_id(api_db)
-    invalid_ids = done_ids | not_company
-    for company_id in tqdm(range(start, MAL_COMPANY + 1)):
-        if company_id in invalid_ids:
-            continue
+    remaining = plan_remaining_ids(
+        anime_db,
+        api_db,
+        "company",
+        "company_id",
+        "producer",
+        MAL_COMPANY,
+        failed_first=failed_first,
+    )
+    for company_id in tqdm(remaining):
         get_company_from_id(company_id, anime_db, api_db)
 
 
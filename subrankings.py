@@ -0,0 +1,165 @@
+"""Rankings restricted to subsets of anime, such as a genre, a studio or a season.
+
+The anime of a subset are selected from the anime database, and the comparisons
+between them are sliced from the table of a run, so the sample is not read again.
+The parameters of each subset are fitted starting from those of the whole run."""
+
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterable, Iterator
+
+import numpy as np
+from numpy.typing import NDArray
+
+from anime_store import ANIME_STORE, get_store_connection
+from telemetry import parameter_tolerance
+from utils import Counts, iterate_parameter
+
+SUBSET_DIR = "subsets"
+NUM_ITERATIONS = 500
+
+# Each filter selects the IDs of the anime with the given value of a field.
+FILTERS = {
+    "genre": """SELECT ag.anime_id FROM anime_genre ag
+        JOIN genre g ON ag.genre_id = g.genre_id WHERE g.name = ?""",
+    "studio": """SELECT ast.anime_id FROM anime_studio ast
+        JOIN studio s ON ast.studio_id = s.studio_id WHERE s.name = ?""",
+    "season": "SELECT anime_id FROM anime WHERE start_season = ?",
+    "year": "SELECT anime_id FROM anime WHERE start_season_year = ?",
+    "media_type": "SELECT anime_id FROM anime WHERE media_type = ?",
+}
+# Each query returns the values taken by a field, to batch one subset per value.
+FILTER_VALUES = {
+    "genre": "SELECT name FROM genre ORDER BY name",
+    "studio": "SELECT name FROM studio ORDER BY name",
+    "season": """SELECT DISTINCT start_season FROM anime
+        WHERE start_season IS NOT NULL ORDER BY start_season""",
+    "year": """SELECT DISTINCT start_season_year FROM anime
+        WHERE start_season_year IS NOT NULL ORDER BY start_season_year""",
+    "media_type": """SELECT DISTINCT media_type FROM anime
+        WHERE media_type IS NOT NULL ORDER BY media_type""",
+}
+
+
+def parse_subset(spec: str) -> dict[str, str]:
+    """Return the filters of a subset given as "field=value,field=value"."""
+    filters: dict[str, str] = {}
+    for item in spec.split(","):
+        field, sep, value = item.partition("=")
+        field = field.strip()
+        if not sep or field not in FILTERS:
+            raise ValueError(
+                f"Invalid filter {item!r}, expected field=value "
+                f"with field in {', '.join(FILTERS)}"
+            )
+        filters[field] = value.strip()
+    return filters
+
+
+def subset_name(filters: dict[str, Any]) -> str:
+    """Return a name of the subset usable as file name."""
+    return "_".join(
+        f"{field}-{re.sub(r'[^0-9A-Za-z]+', '-', str(value)).strip('-').lower()}"
+        for field, value in sorted(filters.items())
+    )
+
+
+def select_subset(conn: sqlite3.Connection, filters: dict[str, Any]) -> list[int]:
+    """Return the IDs of the anime satisfying all the filters."""
+    query = " INTERSECT ".join(FILTERS[field] for field in filters)
+    return [row[0] for row in conn.execute(query, tuple(filters.values()))]
+
+
+def enumerate_subsets(
+    conn: sqlite3.Connection, fields: Iterable[str]
+) -> list[dict[str, Any]]:
+    """Return one subset for each value taken by each of the given fields."""
+    return [
+        {field: row[0]}
+        for field in fields
+        for row in conn.execute(FILTER_VALUES[field])
+    ]
+
+
+def load_subsets(
+    subsets: Iterable[dict[str, Any]], store_path: str = ANIME_STORE
+) -> dict[str, list[int]]:
+    """Return the IDs of the anime of each subset, by name of the subset."""
+    conn = get_store_connection(store_path)
+    selected = {
+        subset_name(filters): select_subset(conn, filters) for filters in subsets
+    }
+    conn.close()
+    return selected
+
+
+def fit_subset(
+    table: Counts,
+    p: NDArray[np.floating[Any]],
+    indices: NDArray[np.intp],
+    num_iter: int = NUM_ITERATIONS,
+    tolerance: float | None = None,
+) -> tuple[NDArray[np.intp], NDArray[np.floating[Any]]]:
+    """Fit the parameters of the entries of the table with the given indices.
+
+    p holds the parameters of the whole table and is used as starting point.
+    Entries without comparisons within the subset are dropped.
+    The iteration stops once the max delta is below tolerance, which defaults to
+    telemetry.parameter_tolerance of the starting parameters of the subset.
+    Return the indices of the entries kept and their parameters."""
+    sub = table[np.ix_(indices, indices)]
+    mt = sub + sub.T
+    keep = np.any(mt, axis=1)
+    indices, sub, mt = indices[keep], sub[keep][:, keep], mt[keep][:, keep]
+    w = np.sum(sub, axis=1)
+    p_sub = p[indices]
+    total = np.sum(p_sub)
+    if total > 0:
+        p_sub = p_sub / total
+    else:
+        p_sub = (np.ones(indices.shape) / max(indices.shape[0], 1)).astype(p.dtype)
+    if tolerance is None:
+        tolerance = parameter_tolerance(p_sub)
+    for _ in range(num_iter):
+        p_new = iterate_parameter(p=p_sub, mt=mt, w=w)
+        converged = np.amax(np.abs(p_new - p_sub), initial=0) < tolerance
+        p_sub = p_new
+        if converged:
+            break
+    return indices, p_sub
+
+
+_shared: tuple[Counts, NDArray[np.floating[Any]], int]
+
+
+def _init_worker(table: Counts, p: NDArray[np.floating[Any]], num_iter: int) -> None:
+    """Share the table and the starting parameters with a worker."""
+    global _shared  # pylint: disable=global-statement
+    _shared = (table, p, num_iter)
+
+
+def _fit_job(
+    indices: NDArray[np.intp],
+) -> tuple[NDArray[np.intp], NDArray[np.floating[Any]]]:
+    """Fit a single subset in a worker."""
+    table, p, num_iter = _shared
+    return fit_subset(table, p, indices, num_iter)
+
+
+def fit_subsets(
+    table: Counts,
+    p: NDArray[np.floating[Any]],
+    subsets: list[NDArray[np.intp]],
+    num_iter: int = NUM_ITERATIONS,
+    num_workers: int = 1,
+) -> Iterator[tuple[NDArray[np.intp], NDArray[np.floating[Any]]]]:
+    """Fit the given subsets of indices of the table in a pool of processes.
+
+    Yield the results of fit_subset in the order of the subsets."""
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(table, p, num_iter),
+    ) as executor:
+        yield from executor.map(_fit_job, subsets)
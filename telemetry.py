@@ -0,0 +1,201 @@
+"""Convergence telemetry of the iteration of the parameters.
+
+Every iteration appends one JSON line to telemetry.jsonl in the run directory.
+The log can be summarised at any time, also while the iteration is running,
+to estimate how long it will take to reach a given tolerance."""
+
+import json
+import math
+import os
+from typing import Any, TextIO, TypedDict
+
+import numpy as np
+from numpy.typing import NDArray
+
+from utils import Counts, get_last_checkpoint, log_likelihood
+
+TELEMETRY_FILE = "telemetry.jsonl"
+TOP_N = 100
+FIT_WINDOW = 200  # Number of latest records used to estimate the convergence rate.
+
+
+class IterationRecord(TypedDict):
+    iteration: int
+    seconds: float
+    max_delta: float
+    mean_delta: float
+    log_likelihood: float
+    kendall_tau: float
+
+
+def kendall_tau(x: NDArray[Any], y: NDArray[Any]) -> float:
+    """Return the Kendall rank correlation (tau-a) of two arrays of equal length."""
+    n = x.shape[0]
+    if n < 2:
+        return 1.0
+    concordance = np.sign(x[:, np.newaxis] - x) * np.sign(y[:, np.newaxis] - y)
+    return float(np.sum(concordance)) / (n * (n - 1))
+
+
+class Telemetry:
+    """Append per-iteration metrics to the telemetry log of a run."""
+
+    def __init__(
+        self,
+        directory: str,
+        mt: Counts,
+        w: Counts,
+        top_n: int = TOP_N,
+    ) -> None:
+        self.path = f"{directory}/{TELEMETRY_FILE}"
+        self.mt = mt
+        self.w = w
+        self.top_n = top_n
+        self.reference: NDArray[np.intp] = np.arange(0)
+        self.reference_values: NDArray[Any] = np.zeros(0)
+        self.file: TextIO | None = None
+
+    def checkpoint(self, p: NDArray[np.floating[Any]]) -> None:
+        """Use the top entries of the given parameters as reference for Kendall tau."""
+        top_n = min(self.top_n, p.shape[0])
+        self.reference = np.argpartition(-p, top_n - 1)[:top_n]
+        self.reference_values = p[self.reference]
+
+    def record(
+        self,
+        iteration: int,
+        seconds: float,
+        p_old: NDArray[np.floating[Any]],
+        p_new: NDArray[np.floating[Any]],
+        likelihood: float | None = None,
+    ) -> IterationRecord:
+        """Compute the metrics of an iteration and append them to the log.
+
+        The log-likelihood of p_new is computed unless given."""
+        delta = np.abs(p_new - p_old)
+        record = IterationRecord(
+            iteration=iteration,
+            seconds=seconds,
+            max_delta=float(np.amax(delta)),
+            mean_delta=float(np.mean(delta)),
+            log_likelihood=(
+                log_likelihood(p_new, self.mt, self.w)
+                if likelihood is None
+                else likelihood
+            ),
+            kendall_tau=kendall_tau(self.reference_values, p_new[self.reference]),
+        )
+        if self.file is None:
+            # Kept open across iterations, closed by close().
+            self.file = open(  # pylint: disable=consider-using-with
+                self.path, "a", encoding="utf8"
+            )
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        return record
+
+    def close(self) -> None:
+        """Close the log."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def load_telemetry(directory: str) -> list[IterationRecord]:
+    """Return the records of the telemetry log of a run."""
+    path = f"{directory}/{TELEMETRY_FILE}"
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parameter_tolerance(p: NDArray[np.floating[Any]]) -> float:
+    """Return the target max delta of the iteration of the parameters p.
+
+    It is the square root of the machine epsilon of the parameters times the
+    largest parameter: about 1e-8 of it in double precision and 3e-4 in single
+    precision, well above the rounding noise of the iteration."""
+    return math.sqrt(np.finfo(p.dtype).eps) * float(np.amax(p, initial=0))
+
+
+def default_tolerance(directory: str) -> float:
+    """Return the default target max delta of the iteration of a run.
+
+    It is the parameter_tolerance of the latest checkpoint. Without checkpoints,
+    double precision and a largest parameter of 1 are assumed."""
+    checkpoint = get_last_checkpoint(directory)
+    if checkpoint is None:
+        return math.sqrt(np.finfo(np.float64).eps)
+    return parameter_tolerance(np.load(checkpoint[1]))
+
+
+def estimate_convergence(
+    records: list[IterationRecord],
+    tolerance: float,
+    window: int = FIT_WINDOW,
+) -> dict[str, float | None]:
+    """Estimate the iterations and time left until max_delta is below tolerance.
+
+    The iteration converges linearly, so log(max_delta) is fitted as a linear
+    function of the iteration over the latest records with a positive max_delta.
+    A run whose last max_delta is already below tolerance has 0 iterations left."""
+    latest = records[-window:]
+    seconds = sum(r["seconds"] for r in latest)
+    speed = len(latest) / seconds if seconds > 0 else None
+    estimate: dict[str, float | None] = {
+        "iterations_per_second": speed,
+        "rate": None,
+        "iterations_left": None,
+        "seconds_left": None,
+    }
+    converged = bool(records) and records[-1]["max_delta"] <= tolerance
+    if converged:
+        estimate["iterations_left"] = estimate["seconds_left"] = 0
+    recent = [r for r in latest if r["max_delta"] > 0]
+    if len(recent) < 2:
+        return estimate
+    x = np.array([r["iteration"] for r in recent], dtype=float)
+    y = np.log([r["max_delta"] for r in recent])
+    slope, intercept = np.polyfit(x, y, 1)
+    estimate["rate"] = math.exp(slope)
+    if not converged and slope < 0:
+        target = (math.log(tolerance) - intercept) / slope
+        estimate["iterations_left"] = max(0.0, target - x[-1])
+        if speed:
+            estimate["seconds_left"] = estimate["iterations_left"] / speed
+    return estimate
+
+
+def summarise_telemetry(directory: str, tolerance: float | None = None) -> None:
+    """Display a summary of the telemetry log of a run.
+
+    The tolerance defaults to default_tolerance of the run."""
+    records = load_telemetry(directory)
+    if not records:
+        print("No telemetry available")
+        return
+    if tolerance is None:
+        tolerance = default_tolerance(directory)
+    last = records[-1]
+    estimate = estimate_convergence(records, tolerance)
+    print(
+        f"""Iterations logged: {len(records)} (last: {last['iteration']})
+Last max delta: {last['max_delta']:.3e}, mean delta: {last['mean_delta']:.3e}
+Log-likelihood: {last['log_likelihood']:.6f}
+Kendall tau of the top entries vs previous checkpoint: {last['kendall_tau']:.4f}"""
+    )
+    if estimate["iterations_per_second"]:
+        print(f"Speed: {estimate['iterations_per_second']:.3f} iterations/s")
+    if estimate["rate"] is not None:
+        print(f"Convergence rate per iteration: {estimate['rate']:.6f}")
+    if estimate["iterations_left"] is None:
+        print(f"Not converging towards tolerance {tolerance:.1e}")
+    elif estimate["iterations_left"] == 0:
+        print(f"Converged to tolerance {tolerance:.1e}")
+    elif estimate["seconds_left"] is not None:
+        print(
+            f"Estimated to reach tolerance {tolerance:.1e} in "
+            f"{estimate['iterations_left']:.0f} iterations "
+            f"({estimate['seconds_left'] / 3600:.2f} hours)"
+        )
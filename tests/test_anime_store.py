@@ -0,0 +1,53 @@
+"""Tests for the anime metadata store."""
+
+from pathlib import Path
+
+from anime_store import load_anime_ids, load_anime_info, load_titles, save_anime_store
+from models import Anime
+
+
+def make_anime(anime_id: int, title: str, **kwargs: object) -> Anime:
+    """Return a minimal anime entry."""
+    return Anime(id=anime_id, title=title, **kwargs)  # type: ignore[typeddict-item]
+
+
+def test_store_round_trip(tmp_path: Path) -> None:
+    """Stored fields are read back, missing optional fields as None."""
+    store = str(tmp_path / "anime.sqlite")
+    save_anime_store(
+        {
+            1: make_anime(
+                1,
+                "Cowboy Bebop",
+                main_picture={"medium": "m.jpg"},
+                alternative_titles={"en": "Cowboy Bebop"},
+                mean=8.75,
+                rank=40,
+                popularity=42,
+            ),
+            5: make_anime(5, "Cowboy Bebop: Tengoku no Tobira"),
+        },
+        store_path=store,
+    )
+    info = load_anime_info(store_path=store)
+    assert info[1] == {
+        "title": "Cowboy Bebop",
+        "title_en": "Cowboy Bebop",
+        "picture": "m.jpg",
+        "mean": 8.75,
+        "rank": 40,
+        "popularity": 42,
+    }
+    assert info[5]["picture"] is None and info[5]["rank"] is None
+    assert load_titles([5, 7], store_path=store) == {
+        5: "Cowboy Bebop: Tengoku no Tobira"
+    }
+    assert load_anime_ids(store_path=store) == {1, 5}
+
+
+def test_store_is_replaced(tmp_path: Path) -> None:
+    """Saving again replaces the previous content."""
+    store = str(tmp_path / "anime.sqlite")
+    save_anime_store({1: make_anime(1, "A")}, store_path=store)
+    save_anime_store({2: make_anime(2, "B")}, store_path=store)
+    assert load_anime_ids(store_path=store) == {2}
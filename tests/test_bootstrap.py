@@ -0,0 +1,166 @@
+"""Tests for the bootstrap of the rankings."""
+
+import glob
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+from pytest import MonkeyPatch
+
+from benchmarks.synthetic import generate_sample
+from bootstrap import (
+    BOOTSTRAP_DIR,
+    bootstrap_intervals,
+    build_table,
+    compact_sample,
+    compact_users,
+    compute_ranks,
+    get_compact_sample,
+    restrict_sample,
+    select_users,
+    user_periods,
+)
+from mal_rankings import (
+    bootstrap_run,
+    derive_runs,
+    get_last_checkpoint,
+    get_run_directory,
+    initialise,
+    iterate,
+)
+from models import ListNode, ListStatus, UserList, UserListEntry
+from utils import (
+    build_id_lookup,
+    create_table,
+    get_anime_ids_from_sample,
+    iterate_parameter,
+)
+
+
+def make_entry(anime_id: int, status: str, score: int) -> UserListEntry:
+    """Return a list entry with the given status and score."""
+    return UserListEntry(
+        node=ListNode(id=anime_id, title="", main_picture={"medium": ""}),
+        list_status=ListStatus(
+            status=status,
+            score=score,
+            num_watched_episodes=0,
+            is_rewatching=False,
+            updated_at="",
+        ),
+    )
+
+
+def test_build_table_matches_create_table() -> None:
+    """The table assembled from the compact sample is the usual one."""
+    sample: dict[int, UserList] = {
+        1: [
+            make_entry(0, "completed", 9),
+            make_entry(1, "dropped", 3),
+            make_entry(2, "completed", 0),
+            make_entry(3, "watching", 8),
+        ],
+        2: [
+            make_entry(1, "completed", 7),
+            make_entry(2, "dropped", 0),
+            make_entry(3, "completed", 7),
+        ],
+    }
+    id_to_order = {i: i for i in range(4)}
+    expected = create_table(size=4, id_to_order=id_to_order, sample=sample, save=False)
+    compact = compact_sample(sample, id_to_order)
+    assert np.array_equal(build_table(compact, 4), expected)
+    counts = np.array([0, 2], dtype=np.uint32)
+    expected_second = create_table(
+        size=4, id_to_order=id_to_order, sample={2: sample[2]}, save=False
+    )
+    assert np.array_equal(build_table(compact, 4, counts), 2 * expected_second)
+
+
+def test_compact_users() -> None:
+    """The compact sample of streamed users gives the table of the full sample."""
+    sample = generate_sample(40, 60, seed=2)
+    anime_ids = sorted(get_anime_ids_from_sample(sample))
+    id_to_order = {j: i for i, j in enumerate(anime_ids)}
+    compact = compact_users(sample.items())
+    assert compact.anime.dtype == np.int32 and compact.score.dtype == np.int8
+    assert np.unique(compact.anime).tolist() == anime_ids
+    expected = create_table(
+        size=len(anime_ids), id_to_order=id_to_order, sample=sample, save=False
+    )
+    lookup = build_id_lookup(np.array(anime_ids))
+    table = build_table(restrict_sample(compact, lookup), len(anime_ids))
+    assert np.array_equal(table, expected)
+
+
+def test_compact_users_duplicates() -> None:
+    """Only the last list of a repeated user is kept."""
+    users = [
+        (1, [make_entry(0, "completed", 9), make_entry(1, "dropped", 3)]),
+        (2, [make_entry(1, "completed", 7)]),
+        (1, [make_entry(2, "completed", 5)]),
+    ]
+    compact = compact_users(users)
+    assert compact.offsets.tolist() == [0, 1, 2]
+    assert compact.anime.tolist() == [1, 2]
+
+
+def test_compute_ranks() -> None:
+    """Ranks start from 1 for the largest parameter of each replicate."""
+    parameters = np.array([[0.5, 0.2, 0.3], [0.1, 0.6, 0.3]])
+    assert compute_ranks(parameters).tolist() == [[1, 3, 2], [3, 1, 2]]
+
+
+def test_bootstrap_intervals_mask() -> None:
+    """Entries outside the mask do not take rank positions."""
+    parameters = np.array([[0.5, 0.2, 0.3], [0.1, 0.6, 0.3], [0.4, 0.1, 0.5]])
+    intervals = bootstrap_intervals(
+        parameters, confidence=1, mask=np.array([0, 1, 1]) > 0
+    )
+    assert intervals["rank_low"].tolist() == [0, 1, 1]
+    assert intervals["rank_high"].tolist() == [0, 2, 2]
+    assert bootstrap_intervals(parameters, confidence=1)["rank_high"].tolist() == [
+        3,
+        3,
+        2,
+    ]
+
+
+def test_bootstrap_window(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Replicates of a run with a window of years resample only its users."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    sample = generate_sample(80, 30, seed=0)
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(sample, f)
+    stop = int(np.median(user_periods(compact_users(sample.items())))) - 1
+    initialise(sample_path="samples/*.json", timestamp="a")
+    (derived,) = derive_runs("a", cutoffs=[0], windows=[(0, stop)])
+    iterate(derived, num_iter=2, num_steps=1)
+    bootstrap_run(derived, "samples/*.json", num_replicates=1, num_iter=1)
+    path = get_run_directory(derived)
+    compact = get_compact_sample(path, "samples/*.json")
+    compact = select_users(compact, user_periods(compact) <= stop)
+    num_users = compact.offsets.shape[0] - 1
+    assert 0 < num_users == int(path.rsplit("_", 1)[1]) < 80
+    counts = np.bincount(
+        np.random.default_rng(0).integers(0, num_users, num_users),
+        minlength=num_users,
+    ).astype(np.uint32)
+    p = np.load(get_last_checkpoint(path)[1])
+    table = build_table(compact, p.shape[0], counts)
+    expected = iterate_parameter(p=p, mt=table + table.T, w=np.sum(table, axis=1))
+    (replicate,) = glob.glob(f"{path}/{BOOTSTRAP_DIR}/replicate_*.npy")
+    assert np.allclose(np.load(replicate), expected)
+
+
+def test_bootstrap_no_checkpoint(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Runs are bootstrapped from their latest checkpoint, which must exist."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    with pytest.raises(FileNotFoundError, match="no checkpoints"):
+        bootstrap_run("a", "samples/*.json", num_replicates=1, num_iter=1)
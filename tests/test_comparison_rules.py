@@ -0,0 +1,194 @@
+"""Tests for the comparison rules."""
+
+import glob
+import json
+from pathlib import Path
+
+import numpy as np
+from pytest import MonkeyPatch
+
+from benchmarks.synthetic import generate_sample
+from bootstrap import (
+    BOOTSTRAP_DIR,
+    CompactSample,
+    build_table,
+    compact_users,
+    get_compact_sample,
+    restrict_sample,
+)
+from comparison_rules import RULES, build_tables
+from mal_rankings import (
+    bootstrap_run,
+    derive_runs,
+    get_last_checkpoint,
+    get_run_directory,
+    initialise,
+    iterate,
+)
+from manifest import load_manifest
+from utils import build_id_lookup, get_anime_ids_from_sample, iterate_parameter
+
+SCORE = np.array([8, 6, 6, 0], dtype=np.int8)
+STATUS = np.array([1, 1, 2, 1], dtype=np.int8)
+
+
+def test_rules() -> None:
+    """Each rule weights the wins of the entries of a user."""
+    assert RULES["default"].compare(SCORE, STATUS).astype(int).tolist() == [
+        [0, 1, 1, 0],
+        [0, 0, 1, 0],
+        [0, 0, 0, 0],
+        [0, 0, 1, 0],
+    ]
+    assert RULES["no_dropped"].compare(SCORE, STATUS).astype(int).tolist() == [
+        [0, 1, 0, 0],
+        [0, 0, 0, 0],
+        [0, 0, 0, 0],
+        [0, 0, 0, 0],
+    ]
+    assert RULES["score_gap"].compare(SCORE, STATUS).tolist() == [
+        [0, 2, 2, 0],
+        [0, 0, 1, 0],
+        [0, 0, 0, 0],
+        [0, 0, 1, 0],
+    ]
+    assert RULES["ties"].compare(SCORE, STATUS).tolist() == [
+        [0, 2, 2, 0],
+        [0, 0, 2, 0],
+        [0, 0, 0, 0],
+        [0, 0, 2, 0],
+    ]
+    ties = RULES["ties"].compare(SCORE, np.ones(4, dtype=np.int8))
+    assert ties[1, 2] == ties[2, 1] == 1
+
+
+def test_build_tables() -> None:
+    """All the rules are evaluated in one pass, the default one as build_table."""
+    sample = generate_sample(30, 40, seed=3)
+    anime_ids = np.array(sorted(get_anime_ids_from_sample(sample)))
+    compact = restrict_sample(compact_users(sample.items()), build_id_lookup(anime_ids))
+    size = anime_ids.shape[0]
+    tables = build_tables(compact, size, RULES)
+    assert np.array_equal(tables["default"], build_table(compact, size))
+    assert np.all(tables["no_dropped"] <= tables["default"])
+    ties = tables["ties"].astype(np.int64) - 2 * tables["default"]
+    assert np.all(ties >= 0) and np.array_equal(ties, ties.T)
+
+
+def test_rule_runs(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Tables of other rules are stored with the run and can be fitted."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a", rules=["ties"])
+    ties = np.load("data/a_20/table_ties.npy")
+    assert not load_manifest("data/a_20")["artifacts"]["table_ties.npy"]["reused"]
+    derived = derive_runs("a", cutoffs=[0], rule="score_gap")
+    assert derived == ["a-c0-f0-score_gap"]
+    path = get_run_directory(derived[0])
+    assert load_manifest(path)["inputs"]["rule"] == "score_gap"
+    assert np.amax(np.load(f"{path}/table.npy")) > np.amax(
+        np.load("data/a_20/table.npy")
+    )
+    initialise(sample_path="samples/*.json", timestamp="b", rules=["ties"])
+    assert np.array_equal(np.load("data/b_20/table_ties.npy"), ties)
+    assert load_manifest("data/b_20")["artifacts"]["table_ties.npy"]["reused"]
+
+
+def test_weighting() -> None:
+    """With unit weighting, every user contributes a total weight of 1."""
+    sample = generate_sample(30, 40, seed=4)
+    anime_ids = np.array(sorted(get_anime_ids_from_sample(sample)))
+    compact = restrict_sample(compact_users(sample.items()), build_id_lookup(anime_ids))
+    size = anime_ids.shape[0]
+    default = build_table(compact, size)
+    tables = build_tables(compact, size, ["default"], weighting="unit")
+    assert tables["default"].dtype == np.float64
+    num_users = sum(
+        np.any(build_table(compact, size, np.eye(30, dtype=np.uint32)[u]))
+        for u in range(30)
+    )
+    assert np.isclose(np.sum(tables["default"]), num_users)
+    assert np.array_equal(tables["default"] > 0, default > 0)
+    sqrt = build_tables(compact, size, ["default"], weighting="sqrt")["default"]
+    assert np.sum(tables["default"]) < np.sum(sqrt) < np.sum(default)
+
+
+def test_weighting_ties() -> None:
+    """With unit weighting, a user with mostly ties and a user with only wins
+    contribute the same total; with sqrt, the square root of their total weight."""
+    compact = CompactSample(
+        offsets=np.array([0, 4, 6]),
+        anime=np.array([0, 1, 2, 3, 0, 3], dtype=np.int32),
+        score=np.array([8, 8, 8, 5, 9, 7], dtype=np.int8),
+        status=np.ones(6, dtype=np.int8),
+        updated=np.zeros(2, dtype=np.int64),
+    )
+    users = np.eye(2, dtype=np.uint32)
+    for rule in ("ties", "score_gap"):
+        totals = {
+            weighting: [
+                np.sum(build_tables(compact, 4, [rule], counts, weighting)[rule])
+                for counts in users
+            ]
+            for weighting in (None, "unit", "sqrt")
+        }
+        assert np.allclose(totals["unit"], 1)
+        assert np.allclose(totals["sqrt"], np.sqrt(totals[None]))
+
+
+def test_weighted_runs(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Runs with weighted users are fitted on fractional counts."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    derived = derive_runs("a", cutoffs=[0], weighting="sqrt")
+    assert derived == ["a-c0-f0-sqrt"]
+    path = get_run_directory(derived[0])
+    assert np.load(f"{path}/table.npy").dtype == np.float64
+    assert load_manifest(path)["inputs"]["weighting"] == "sqrt"
+    assert np.load(f"{path}/w.npy").dtype == np.float64
+    iterate(derived[0], num_iter=3, num_steps=1)
+    p = np.load(f"{path}/parameter_3.npy")
+    assert np.all(np.isfinite(p)) and np.isclose(np.sum(p), 1)
+
+
+def replicate_by_hand(path: str, rule: str, weighting: str | None = None) -> np.ndarray:
+    """Return replicate 0 of a run refitted for one iteration with the given rule."""
+    compact = get_compact_sample(path, "samples/*.json")
+    num_users = compact.offsets.shape[0] - 1
+    counts = np.bincount(
+        np.random.default_rng(0).integers(0, num_users, num_users),
+        minlength=num_users,
+    ).astype(np.uint32)
+    p = np.load(get_last_checkpoint(path)[1])
+    table = build_tables(compact, p.shape[0], [rule], counts, weighting)[rule]
+    return iterate_parameter(p=p, mt=table + table.T, w=np.sum(table, axis=1))
+
+
+def test_rule_bootstrap(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Replicates of a run with another rule or a weighting of users are fitted on
+    the tables of the run."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    (derived,) = derive_runs("a", cutoffs=[0], rule="score_gap")
+    iterate(derived, num_iter=2, num_steps=1)
+    bootstrap_run(derived, "samples/*.json", num_replicates=1, num_iter=1)
+    path = get_run_directory(derived)
+    (replicate,) = glob.glob(f"{path}/{BOOTSTRAP_DIR}/replicate_*.npy")
+    assert np.allclose(np.load(replicate), replicate_by_hand(path, "score_gap"))
+    assert not np.allclose(np.load(replicate), replicate_by_hand(path, "default"))
+    (weighted,) = derive_runs("a", cutoffs=[0], weighting="unit")
+    iterate(weighted, num_iter=2, num_steps=1)
+    bootstrap_run(weighted, "samples/*.json", num_replicates=1, num_iter=1)
+    path = get_run_directory(weighted)
+    (replicate,) = glob.glob(f"{path}/{BOOTSTRAP_DIR}/replicate_*.npy")
+    expected = replicate_by_hand(path, "default", "unit")
+    assert np.allclose(np.load(replicate), expected)
+    assert not np.allclose(np.load(replicate), replicate_by_hand(path, "default"))
@@ -0,0 +1,94 @@
+"""Tests for the resume planning of the scrapers."""
+
+import importlib.util
+import sqlite3
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+
+def load_database() -> ModuleType:
+    """Import src/database.py, which is not on the path of the ranking scripts."""
+    spec = importlib.util.spec_from_file_location("database", SRC / "database.py")
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+database = load_database()
+
+
+def create_database(path: Path, schema: str) -> sqlite3.Connection:
+    """Return a connection to a new database with a schema of src/queries."""
+    conn = sqlite3.connect(path)
+    with (SRC / "queries" / f"{schema}_schema.sql").open(encoding="utf-8") as f:
+        conn.executescript(f.read())
+    return conn
+
+
+@pytest.fixture(name="connections")
+def fixture_connections(
+    tmp_path: Path,
+) -> tuple[sqlite3.Connection, sqlite3.Connection]:
+    """Databases where companies 1, 2 and 5 are done, 3 does not exist, 4 and 6
+    failed, and 7 was retrieved but not stored."""
+    anime_db = create_database(tmp_path / "anime.sqlite", "anime")
+    api_db = create_database(tmp_path / "api.sqlite", "api")
+    with anime_db:
+        anime_db.executemany(
+            "INSERT INTO company (company_id, name) VALUES (?, '')", [(1,), (2,), (5,)]
+        )
+    with api_db:
+        api_db.executemany(
+            "INSERT INTO api_call VALUES ('producer', ?, ?, '')",
+            [(1, 200), (2, 200), (3, 404), (4, 500), (5, 200), (6, 1), (7, 200)],
+        )
+    return anime_db, api_db
+
+
+def plan(
+    connections: tuple[sqlite3.Connection, sqlite3.Connection], **kwargs: object
+) -> list[int]:
+    """Return the planned company IDs up to 12."""
+    return list(
+        database.plan_remaining_ids(
+            *connections, "company", "company_id", "producer", 12, **kwargs
+        )
+    )
+
+
+def test_plan_failed_first(
+    connections: tuple[sqlite3.Connection, sqlite3.Connection]
+) -> None:
+    """Failed IDs come first, done and non-existent IDs are skipped."""
+    assert plan(connections) == [4, 6, 7, 8, 9, 10, 11, 12]
+    assert plan(connections, start=5) == [6, 7, 8, 9, 10, 11, 12]
+
+
+def test_plan_in_order(
+    connections: tuple[sqlite3.Connection, sqlite3.Connection]
+) -> None:
+    """Without failed_first, the remaining IDs are planned in increasing order."""
+    assert plan(connections, failed_first=False) == [4, 6, 7, 8, 9, 10, 11, 12]
+    assert plan(connections, failed_first=False, start=8) == [8, 9, 10, 11, 12]
+
+
+def test_plan_batches(
+    connections: tuple[sqlite3.Connection, sqlite3.Connection]
+) -> None:
+    """Batches smaller than the plan give the same IDs, and IDs done while the plan
+    is consumed are skipped."""
+    for batch_size in (1, 2, 3):
+        assert plan(connections, batch_size=batch_size) == plan(connections)
+    anime_db, api_db = connections
+    remaining = database.plan_remaining_ids(
+        anime_db, api_db, "company", "company_id", "producer", 12, batch_size=2
+    )
+    assert [next(remaining), next(remaining), next(remaining)] == [4, 6, 7]
+    with anime_db:
+        anime_db.execute("INSERT INTO company (company_id, name) VALUES (9, '')")
+    assert list(remaining) == [8, 10, 11, 12]
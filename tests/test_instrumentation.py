@@ -0,0 +1,39 @@
+"""Tests for the instrumentation of the computation."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import METRICS_FILE, Instrumentation
+
+
+def test_disabled_records_nothing(tmp_path: Path) -> None:
+    """Disabled instrumentation neither measures nor writes."""
+    metrics = Instrumentation()
+    with metrics.stage("stage"):
+        pass
+    metrics.save(str(tmp_path))
+    assert not metrics.stages
+    assert not (tmp_path / METRICS_FILE).exists()
+
+
+def test_stages_are_aggregated(tmp_path: Path) -> None:
+    """Repeated stages are aggregated, and saving twice updates the record."""
+    metrics = Instrumentation()
+    metrics.configure(command="test")
+    for _ in range(3):
+        with metrics.stage("iteration"):
+            pass
+    metrics.array("p", np.ones(10))
+    metrics.save(str(tmp_path))
+    metrics.save(str(tmp_path))
+    with open(tmp_path / METRICS_FILE, encoding="utf8") as f:
+        records = json.load(f)
+    assert len(records) == 1
+    assert records[0]["stages"]["iteration"]["count"] == 3
+    assert records[0]["arrays"]["p"] == {
+        "shape": [10],
+        "dtype": "float64",
+        "nbytes": 80,
+    }
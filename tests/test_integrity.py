@@ -0,0 +1,70 @@
+"""Tests for the integrity checker."""
+
+import json
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from anime_store import SCHEMA as INFO_SCHEMA
+from benchmarks.synthetic import generate_sample
+from check_integrity import get_sample_anime, main
+
+QUERIES = Path(__file__).resolve().parent.parent / "src" / "queries"
+
+
+def create_database(path: str, *schemas: Path) -> sqlite3.Connection:
+    """Return a connection to a new database with the given schemas."""
+    conn = sqlite3.connect(path)
+    for schema in schemas:
+        with schema.open(encoding="utf-8") as f:
+            conn.executescript(f.read())
+    return conn
+
+
+def test_check_integrity(tmp_path: Path) -> None:
+    """Anime are categorised, stale ones refreshed and the others queued."""
+    sample_path = tmp_path / "sample_0.json"
+    with sample_path.open("w", encoding="utf8") as f:
+        json.dump(generate_sample(40, 20, seed=1), f)
+    sample = get_sample_anime(str(sample_path))
+    ids = sample.anime_ids.tolist()
+    assert len(ids) >= 8 and np.all(sample.num_lists > 0)
+    ok, stale, deleted, failed = ids[:2], ids[2:4], ids[4:5], ids[5:6]
+    store = str(tmp_path / "anime.sqlite")
+    conn = create_database(store, QUERIES / "anime_schema.sql", INFO_SCHEMA)
+    with conn:
+        conn.executemany(
+            """INSERT INTO anime (anime_id, title, created_at, updated_at, status)
+            VALUES (?, ?, '', '', '')""",
+            [(i, f"Anime {i}") for i in ok + stale],
+        )
+        conn.executemany(
+            "INSERT INTO anime_info (anime_id, title) VALUES (?, ?)",
+            [(i, f"Anime {i}") for i in ok],
+        )
+    conn.close()
+    api = str(tmp_path / "api.sqlite")
+    conn = create_database(api, QUERIES / "api_schema.sql")
+    with conn:
+        conn.executemany(
+            "INSERT INTO api_call VALUES ('anime', ?, ?, '')",
+            [(deleted[0], 404), (failed[0], 1), (ok[0], 200)],
+        )
+    conn.close()
+    queue = str(tmp_path / "queue.txt")
+    report = main(str(sample_path), store, api, queue)
+    assert report.counts() == {
+        "ok": 4,
+        "stale": 0,
+        "deleted": 1,
+        "failed": 1,
+        "missing": len(ids) - 6,
+    }
+    assert sorted(report.queue) == sorted(ids[5:])
+    counts = dict(zip(ids, sample.num_lists.tolist()))
+    assert [counts[i] for i in report.queue] == sorted(
+        (counts[i] for i in report.queue), reverse=True
+    )
+    with open(queue, encoding="utf8") as f:
+        assert [int(line) for line in f] == report.queue
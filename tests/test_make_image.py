@@ -0,0 +1,75 @@
+"""Tests for the infographic renderer."""
+
+from pathlib import Path
+
+import pytest
+from PIL import Image
+from pytest import MonkeyPatch
+
+import make_image
+from make_image import get_title_lines, parse_grid, select_results, thumbnail_path
+from models import Result
+
+
+def save_picture(path: Path, anime_id: int, colour: tuple[int, int, int]) -> None:
+    """Save a 60x90 source picture of an anime."""
+    path.mkdir(exist_ok=True)
+    Image.new("RGB", (60, 90), colour).save(path / f"{anime_id}.jpg")
+
+
+def test_thumbnail_cache(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Thumbnails are keyed by the source picture and the box, and reused."""
+    source, cache = tmp_path / "pictures", str(tmp_path / "cache")
+    save_picture(source, 1, (255, 0, 0))
+    path = thumbnail_path(1, (30, 45), str(source), cache)
+    with Image.open(path) as image:
+        assert image.size == (30, 45)
+    assert thumbnail_path(1, (20, 30), str(source), cache) != path
+    save_picture(source, 1, (0, 0, 255))
+    replaced = thumbnail_path(1, (30, 45), str(source), cache)
+    assert replaced != path
+
+    def fail(*_: object, **__: object) -> None:
+        raise AssertionError("The picture was resized again")
+
+    monkeypatch.setattr(make_image.Image, "open", fail)
+    assert thumbnail_path(1, (30, 45), str(source), cache) == replaced
+
+
+def test_title_lines() -> None:
+    """Titles are wrapped at 30 characters, unless broken by hand."""
+    assert get_title_lines("Monster") == ["Monster"]
+    assert get_title_lines("Kaguya-sama wa Kokurasetai: Ultra Romantic") == [
+        "Kaguya-sama wa Kokurasetai:",
+        "Ultra Romantic",
+    ]
+    assert get_title_lines("Monogatari Series: Second Season") == [
+        "Monogatari Series:",
+        "Second Season",
+    ]
+
+
+def test_parse_grid() -> None:
+    """Grids are given as COLUMNSxROWS."""
+    assert parse_grid("10x5") == (10, 5)
+    assert parse_grid("4X3") == (4, 3)
+    with pytest.raises(ValueError):
+        parse_grid("10")
+
+
+def test_select_results() -> None:
+    """The top results are chosen among those in at least min_lists lists."""
+    results = [
+        Result(
+            mal_ID=i,
+            parameter=p,
+            num_comparisons=0,
+            num_lists=n,
+            pct_lists=0,
+            rel_error_pct=0,
+        )
+        for i, (p, n) in enumerate([(0.4, 20), (0.3, 5), (0.2, 10), (0.1, 30)])
+    ]
+    assert [x["mal_ID"] for x in select_results(results, 2)] == [0, 2]
+    assert [x["mal_ID"] for x in select_results(results, 2, min_lists=1)] == [0, 1]
+    assert [x["mal_ID"] for x in select_results(results, 5, min_lists=25)] == [3]
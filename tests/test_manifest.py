@@ -0,0 +1,111 @@
+"""Tests for the manifest and the cache of run artifacts."""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from pytest import MonkeyPatch
+
+from benchmarks.synthetic import generate_sample
+from mal_rankings import (
+    derive_runs,
+    fit_runs,
+    get_last_checkpoint,
+    get_run_directory,
+    initialise,
+)
+from manifest import fingerprint_files, input_key, load_manifest
+
+
+def test_fingerprint_files(tmp_path: Path) -> None:
+    """Files are hashed again only when their size or modification time change."""
+    path = tmp_path / "sample.json"
+    path.write_text("{}", encoding="utf8")
+    cache = str(tmp_path / "cache")
+    first = fingerprint_files([str(path)], cache)[str(path)]
+    assert first == fingerprint_files([str(path)], cache)[str(path)]
+    path.write_text('{"1": []}', encoding="utf8")
+    assert fingerprint_files([str(path)], cache)[str(path)]["sha256"] != first["sha256"]
+
+
+def test_input_key() -> None:
+    """Keys depend on the values of the inputs, not on their order."""
+    assert input_key(cutoff=0, curb=1) == input_key(curb=1, cutoff=0)
+    assert input_key(cutoff=0, curb=1) != input_key(cutoff=1, curb=1)
+
+
+def test_initialise_reuses_cache(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Preparing again only recomputes the artifacts whose inputs changed."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    initialise(sample_path="samples/*.json", timestamp="b")
+    initialise(sample_path="samples/*.json", timestamp="c", cutoff=5)
+    manifests = {t: load_manifest(f"data/{t}_20") for t in "abc"}
+    assert not any(x["reused"] for x in manifests["a"]["artifacts"].values())
+    assert all(x["reused"] for x in manifests["b"]["artifacts"].values())
+    assert manifests["c"]["artifacts"]["table.npy"]["reused"]
+    assert not manifests["c"]["artifacts"]["mt.npy"]["reused"]
+    assert np.array_equal(np.load("data/a_20/mt.npy"), np.load("data/b_20/mt.npy"))
+    assert os.path.samefile("data/a_20/table.npy", "data/c_20/table.npy")
+
+
+def test_derive_runs(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Derived runs match runs prepared with the same filters."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(generate_sample(20, 30, seed=0), f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    initialise(sample_path="samples/*.json", timestamp="b", cutoff=20, curb=2)
+    derived = derive_runs("a", cutoffs=[0, 20], curb=2)
+    assert derived == ["a-c0-f2", "a-c20-f2"]
+    manifest = load_manifest("data/a-c20-f2_20")
+    assert manifest["artifacts"]["mt.npy"]["reused"]
+    assert manifest["inputs"]["cutoff"] == 20
+    assert np.array_equal(
+        np.load("data/a-c20-f2_20/mt.npy"), np.load("data/b_20/mt.npy")
+    )
+    fit_runs(derived, num_iter=2, num_steps=1, num_workers=2)
+    for timestamp in derived:
+        assert get_last_checkpoint(f"data/{timestamp}_20")[0] == 2
+
+
+def test_get_last_checkpoint(tmp_path: Path) -> None:
+    """Checkpoints are compared by number of iterations."""
+    for name in ("parameter_50.npy", "parameter_100.npy", "parameters_150.npz"):
+        (tmp_path / name).touch()
+    assert get_last_checkpoint(str(tmp_path)) == (
+        100,
+        f"{tmp_path}/parameter_100.npy",
+    )
+    assert get_last_checkpoint(str(tmp_path), "error_pct") is None
+
+
+def test_derive_windows(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """The tables of windows of years sum to the table of the whole sample."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    sample = generate_sample(40, 30, seed=0)
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(sample, f)
+    initialise(sample_path="samples/*.json", timestamp="a")
+    derived = derive_runs("a", cutoffs=[0], windows=[(0, 2015), (2016, 2030)])
+    assert [t.rsplit("-y", 1)[1] for t in derived] == ["0-2015", "2016-2030"]
+    paths = [get_run_directory(t) for t in derived]
+    assert load_manifest(paths[0])["inputs"]["window"] == [0, 2015]
+    assert sum(int(path.rsplit("_", 1)[1]) for path in paths) == 40
+    tables = [np.load(f"{path}/table.npy") for path in paths]
+    assert np.array_equal(
+        tables[0].astype(np.int64) + tables[1], np.load("data/a_40/table.npy")
+    )
+    # The first window has the users whose latest update is before 2016.
+    early = {
+        user: user_list
+        for user, user_list in sample.items()
+        if max(e["list_status"]["updated_at"] for e in user_list) < "2016"
+    }
+    assert int(paths[0].rsplit("_", 1)[1]) == len(early)
@@ -1,5 +1,6 @@
 """Tests"""
 
+from pathlib import Path
 from typing import Iterator
 
 import numpy as np
@@ -7,7 +8,27 @@ from numpy.typing import NDArray
 from pytest import fixture
 
 from models import ListNode, ListStatus, UserList, UserListEntry
-from utils import create_table, iterate_parameter, setup_bradley_terry
+from telemetry import kendall_tau
+from utils import (
+    build_id_lookup,
+    compute_denominator,
+    count_dtype,
+    create_table,
+    get_kernel,
+    is_improving,
+    iterate_log_parameter,
+    iterate_parameter,
+    load_id_maps,
+    load_symmetric,
+    log_likelihood,
+    log_likelihood_gradient,
+    log_likelihood_log,
+    main_component,
+    save_id_maps,
+    save_symmetric,
+    setup_bradley_terry,
+    translate_ids,
+)
 
 
 @fixture(name="table_one_user_three_anime")
@@ -37,6 +58,19 @@ def fixture_wikipedia_table() -> Iterator[NDArray[np.uint]]:
     yield table
 
 
+@fixture(name="random_table")
+def fixture_random_table() -> Iterator[NDArray[np.uint]]:
+    """Table of random comparisons among 300 entries with log-normal strengths."""
+    rng = np.random.default_rng(0)
+    strength = rng.lognormal(sigma=2, size=300)
+    games = np.triu(rng.poisson(20, size=(300, 300)), 1)
+    wins = rng.binomial(
+        games, strength[:, np.newaxis] / (strength[:, np.newaxis] + strength)
+    )
+    table = wins + (games - wins).T
+    yield table.astype(np.uint)
+
+
 @fixture(name="sample_one_user")
 def fixture_sample_one_user() -> Iterator[dict[int, UserList]]:
     """Sample containing one user."""
@@ -101,3 +135,154 @@ def test_create_table_one_user(
     )
     expected = table_one_user_three_anime
     assert np.array_equal(table, expected)
+
+
+def test_main_component(wikipedia_table: NDArray[np.uint]) -> None:
+    """Entries that never win or never lose are outside the main component."""
+    table = np.zeros((6, 6), dtype=np.uint)
+    table[:4, :4] = wikipedia_table
+    table[4, 0] = 1  # never loses
+    table[1, 5] = 2  # never wins
+    assert main_component(table).tolist() == [True] * 4 + [False] * 2
+
+
+def test_setup_connected(table_one_user_three_anime: NDArray[np.uint]) -> None:
+    """A strict order has no strongly connected component larger than one entry."""
+    p, mt, w, _, new_to_old = setup_bradley_terry(
+        table_one_user_three_anime, sample={}, io_map={}, connected=True
+    )
+    assert p.shape == w.shape == (1,)
+    assert mt.shape == (1, 1)
+    assert len(new_to_old) == 1
+
+
+def test_log_likelihood(wikipedia_table: NDArray[np.uint]) -> None:
+    """The log-likelihood matches its definition and increases at each iteration."""
+    p, mt, w, *_ = setup_bradley_terry(wikipedia_table, sample={}, io_map={})
+    expected = sum(
+        wikipedia_table[i, j] * np.log(p[i] / (p[i] + p[j]))
+        for i in range(4)
+        for j in range(4)
+        if i != j
+    )
+    assert np.isclose(log_likelihood(p, mt, w), expected)
+    previous = log_likelihood(p, mt, w)
+    for _ in range(10):
+        p = iterate_parameter(p=p, mt=mt, w=w)
+        current = log_likelihood(p, mt, w)
+        assert current >= previous
+        previous = current
+
+
+def test_log_likelihood_gradient(wikipedia_table: NDArray[np.uint]) -> None:
+    """The gradient matches finite differences and vanishes at the fixed point."""
+    p, mt, w, *_ = setup_bradley_terry(wikipedia_table, sample={}, io_map={})
+    p = np.array([0.1, 0.3, 0.2, 0.4])
+    gradient = log_likelihood_gradient(p, mt, w)
+    h = 1e-6
+    for i in range(4):
+        step = np.zeros(4)
+        step[i] = h
+        difference = log_likelihood(p + step, mt, w) - log_likelihood(p - step, mt, w)
+        assert np.isclose(gradient[i], difference / (2 * h), rtol=1e-4)
+    assert np.allclose(log_likelihood_gradient(p, mt, w, log_space=True), p * gradient)
+    for _ in range(100):
+        p = iterate_parameter(p=p, mt=mt, w=w)
+    assert np.allclose(log_likelihood_gradient(p, mt, w, log_space=True), 0, atol=1e-4)
+
+
+def test_iterate_log_parameter(wikipedia_table: NDArray[np.uint]) -> None:
+    """The iteration in log-space gives the same parameters and likelihood."""
+    p, mt, w, *_ = setup_bradley_terry(wikipedia_table, sample={}, io_map={})
+    theta = np.log(p)
+    for _ in range(20):
+        p = iterate_parameter(p=p, mt=mt, w=w)
+        theta = iterate_log_parameter(theta=theta, mt=mt, w=w)
+    assert np.allclose(np.exp(theta), p, rtol=1e-5)
+    assert np.isclose(log_likelihood_log(theta, mt, w), log_likelihood(p, mt, w))
+
+
+def test_iterate_log_parameter_no_wins(
+    table_one_user_three_anime: NDArray[np.uint],
+) -> None:
+    """Entries with no wins have null parameters in both parameterisations."""
+    p, mt, w, *_ = setup_bradley_terry(table_one_user_three_anime, sample={}, io_map={})
+    theta = iterate_log_parameter(theta=np.log(p), mt=mt, w=w)
+    p = iterate_parameter(p=p, mt=mt, w=w)
+    assert np.allclose(np.exp(theta), p)
+    assert theta[2] == -np.inf
+
+
+def test_is_improving() -> None:
+    """Decreases of the log-likelihood are only tolerated within rounding."""
+    assert is_improving(-100.0, -99.0)
+    assert is_improving(-100.0, -100.0 - 1e-11)
+    assert not is_improving(-100.0, -100.1)
+
+
+def test_precision(random_table: NDArray[np.uint]) -> None:
+    """Single and double precision give the same ranking, up to close entries."""
+    p = {}
+    for precision in ("single", "double"):
+        p[precision], mt, w, *_ = setup_bradley_terry(
+            random_table, sample={}, io_map={}, precision=precision
+        )
+        for _ in range(200):
+            p[precision] = iterate_parameter(p=p[precision], mt=mt, w=w)
+    assert p["single"].dtype == np.float32
+    assert p["double"].dtype == np.float64
+    assert np.allclose(p["single"], p["double"], rtol=1e-5, atol=0)
+    assert kendall_tau(p["single"], p["double"]) > 0.999
+    ranks = {k: np.argsort(np.argsort(-v)) for k, v in p.items()}
+    assert np.amax(np.abs(ranks["single"] - ranks["double"])) <= 1
+
+
+def test_count_dtype() -> None:
+    """Counts are stored in the smallest unsigned type holding them."""
+    assert count_dtype(0) == np.uint8
+    assert count_dtype(255) == np.uint8
+    assert count_dtype(256) == np.uint16
+    assert count_dtype(50000) == np.uint16
+    assert count_dtype(70000) == np.uint32
+
+
+def test_symmetric_storage(random_table: NDArray[np.uint], tmp_path: Path) -> None:
+    """The packed upper triangle of mt restores the full matrix."""
+    _, mt, *_ = setup_bradley_terry(random_table, sample={}, io_map={})
+    assert mt.dtype == np.uint8
+    filename = str(tmp_path / "mt.npy")
+    save_symmetric(filename, mt)
+    assert np.load(filename).shape == (300 * 299 // 2,)
+    restored = load_symmetric(filename)
+    assert restored.dtype == mt.dtype
+    assert np.array_equal(restored, mt)
+    np.save(filename, mt)
+    assert np.array_equal(load_symmetric(filename), mt)
+
+
+def test_kernels(random_table: NDArray[np.uint]) -> None:
+    """Every kernel gives the same iteration as the single-threaded one."""
+    p, mt, w, *_ = setup_bradley_terry(random_table, sample={}, io_map={})
+    expected = iterate_parameter(p=p, mt=mt, w=w)
+    for name in ("numpy", "threads", "numba"):
+        kernel = get_kernel(name, num_threads=4)
+        assert np.allclose(kernel(p, mt), compute_denominator(p, mt))
+        assert np.allclose(iterate_parameter(p=p, mt=mt, w=w, kernel=kernel), expected)
+
+
+def test_id_maps(tmp_path: Path) -> None:
+    """Anime IDs are translated to indices with the dense lookup array."""
+    anime_ids = np.array([1, 5, 57847, 70000])
+    lookup = build_id_lookup(anime_ids)
+    assert lookup.shape[0] == 70001
+    assert translate_ids(lookup, np.array([5, 2, 70000, 80000, -1])).tolist() == [
+        1,
+        -1,
+        3,
+        -1,
+        -1,
+    ]
+    save_id_maps(str(tmp_path), anime_ids, prefix="reduced_")
+    order_to_id, id_to_order = load_id_maps(str(tmp_path), "reduced_")
+    assert order_to_id.tolist() == anime_ids.tolist()
+    assert np.array_equal(id_to_order, lookup)
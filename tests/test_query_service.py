@@ -0,0 +1,87 @@
+"""Tests for the ranking query service."""
+
+import json
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import numpy as np
+import pytest
+
+from query_service import QueryError, RankingIndex, make_handler
+
+SCHEMA = Path(__file__).resolve().parent.parent / "src" / "queries" / "anime_schema.sql"
+TITLES = {10: "Cowboy Bebop", 20: "Trigun", 30: "Cowboy Bebop: Movie", 40: "Monster"}
+
+
+@pytest.fixture(name="index")
+def fixture_index(tmp_path: Path) -> RankingIndex:
+    """Index of five anime, one without a title, with a database of their years."""
+    store = str(tmp_path / "anime.sqlite")
+    conn = sqlite3.connect(store)
+    with SCHEMA.open(encoding="utf-8") as f:
+        conn.executescript(f.read())
+    with conn:
+        conn.executemany(
+            """INSERT INTO anime (anime_id, title, created_at, updated_at, status,
+            start_season_year) VALUES (?, ?, '', '', '', ?)""",
+            [(10, "", 1998), (20, "", 1998), (30, "", 2001), (40, "", 2004)],
+        )
+    conn.close()
+    p = np.array([0.3, 0.1, 0.25, 0.15, 0.2])
+    return RankingIndex(p, np.array([10, 20, 30, 40, 50]), TITLES, store)
+
+
+def test_top(index: RankingIndex) -> None:
+    """Entries without a title are skipped, filters select from the database."""
+    assert [x["mal_ID"] for x in index.top()] == [10, 30, 40, 20]
+    assert [x["rank"] for x in index.top(2, offset=1)] == [2, 3]
+    assert [x["mal_ID"] for x in index.top(filters={"year": "1998"})] == [10, 20]
+    assert index.filtered_order.cache_info().currsize == 2
+
+
+def test_rank_compare_search(index: RankingIndex) -> None:
+    """Queries about single anime use the same ranking."""
+    assert index.entry(index.index_of(40))["rank"] == 3
+    with pytest.raises(QueryError):
+        index.index_of(50)
+    assert index.compare(10, 20)["probability"] == pytest.approx(0.75)
+    assert [x["mal_ID"] for x in index.search("bebop")] == [10, 30]
+
+
+def test_server(index: RankingIndex) -> None:
+    """The service answers with JSON, and with errors for invalid queries."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(index))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urlopen(f"{url}/compare?a=30&b=10") as response:
+            assert json.load(response)["probability"] == pytest.approx(0.25 / 0.55)
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/rank?id=x")  # pylint: disable=consider-using-with
+        assert error.value.code == 400
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/top?n=-1")  # pylint: disable=consider-using-with
+        assert error.value.code == 400
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/top?offset=-5")  # pylint: disable=consider-using-with
+        assert error.value.code == 400
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/unknown")  # pylint: disable=consider-using-with
+        assert error.value.code == 404
+        index.store_path = "missing/anime.sqlite"
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/top?year=1998")  # pylint: disable=consider-using-with
+        assert error.value.code == 500
+        assert json.load(error.value) == {"error": "Internal error"}
+        index.titles = []
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/rank?id=10")  # pylint: disable=consider-using-with
+        assert error.value.code == 500
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,43 @@
+"""Tests for the ranked views."""
+
+import numpy as np
+
+from ranked_view import RankedView, top_k
+
+VALUES = np.array([0.2, 0.5, 0.1, 0.5, 0.3, 0.2])
+
+
+def test_top_k() -> None:
+    """The top entries are those of a stable sort by decreasing value."""
+    full = np.argsort(-VALUES, kind="stable")
+    assert np.array_equal(top_k(VALUES), full)
+    for k in range(VALUES.shape[0] + 2):
+        assert np.array_equal(top_k(VALUES, k), full[:k])
+    mask = np.array([True, False, True, True, True, True])
+    assert top_k(VALUES, 3, mask).tolist() == [3, 4, 0]
+    assert top_k(VALUES, 2, mask=np.zeros(6, dtype=np.bool_)).tolist() == []
+
+
+def test_top_k_nan() -> None:
+    """NaN values come last, as in a full sort."""
+    values = np.array([0.5, np.nan, 0.2, 0.1, np.nan])
+    full = np.argsort(-values, kind="stable")
+    assert full.tolist() == [0, 2, 3, 1, 4]
+    for k in (None, 0, 1, 2, 3, 4, 5, 6):
+        assert np.array_equal(top_k(values, k), full[:k])
+    assert top_k(values, 2, values > 0.15).tolist() == [0, 2]
+
+
+def test_ranked_view() -> None:
+    """Records are created only for the entries accessed."""
+    created: list[int] = []
+
+    def record(i: int) -> float:
+        created.append(i)
+        return float(VALUES[i])
+
+    view = RankedView(top_k(VALUES, 4), record)
+    assert len(view) == 4 and len(view[1:3]) == 2
+    assert view[0] == 0.5 and created == [1]
+    assert view[1:].tolist() == [0.5, 0.3, 0.2]
+    assert created == [1, 3, 4, 0]
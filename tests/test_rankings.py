@@ -0,0 +1,99 @@
+"""Tests for the export of the computed parameters."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+from pytest import MonkeyPatch
+
+from anime_store import save_anime_store
+from benchmarks.synthetic import generate_sample
+from mal_rankings import (
+    compress_blocks,
+    export_head_to_head,
+    extract_list_from_parameter,
+    head_to_head,
+    initialise,
+    iterate,
+    step_iteration,
+)
+from models import Anime
+from utils import get_anime_ids_from_sample, setup_bradley_terry
+
+
+def test_extract_list_from_parameter() -> None:
+    """Entries are sorted by decreasing parameter, skipping unknown anime."""
+    p = np.array([0.1, 0.4, 0.2, 0.3])
+    f = {0: 10, 1: 11, 2: 12, 3: 13}
+    mal = {10: "A", 11: "B", 13: "D"}
+    result = extract_list_from_parameter(p, f, mal)
+    assert [x["mal_ID"] for x in result] == [11, 13, 10]
+    assert [x["title"] for x in result] == ["B", "D", "A"]
+    assert result[0]["parameter"] == 0.4
+
+
+def test_extract_list_from_parameter_ties() -> None:
+    """Ties keep the original order."""
+    p = np.array([0.25, 0.25, 0.25, 0.25])
+    f = {i: i for i in range(4)}
+    mal = {i: str(i) for i in range(4)}
+    result = extract_list_from_parameter(p, f, mal)
+    assert [x["mal_ID"] for x in result] == [0, 1, 2, 3]
+
+
+def test_check_single_precision() -> None:
+    """Rounding of single precision near convergence does not stop the check."""
+    rng = np.random.default_rng(0)
+    strength = rng.lognormal(size=400)
+    games = rng.poisson(30, size=(400, 400))
+    table = rng.binomial(games, strength[:, None] / np.add.outer(strength, strength))
+    np.fill_diagonal(table, 0)
+    p, mt, w, *_ = setup_bradley_terry(
+        table.astype(np.uint32), sample={}, io_map={}, precision="single"
+    )
+    p, *_ = step_iteration(p, mt, w, num_iter=60)
+    _, p_list, *_ = step_iteration(p, mt, w, num_iter=50, check=True)
+    assert len(p_list) == 51
+
+
+def test_head_to_head() -> None:
+    """Blocks above the diagonal determine the head-to-head matrices."""
+    rng = np.random.default_rng(0)
+    table = rng.integers(0, 4, (8, 8)).astype(np.uint8)
+    np.fill_diagonal(table, 0)
+    table[np.ix_([0, 1, 2], [5, 6, 7])] = table[np.ix_([5, 6, 7], [0, 1, 2])] = 0
+    indices = np.array([1, 0, 2, 7, 6, 5])
+    p = np.array([0.3, 0.25, 0.2, 0.1, 0.1, 0.05])
+    data = head_to_head(table, indices, p)
+    assert data.wins[0, 1] == table[1, 0]
+    assert np.array_equal(data.total, data.total.T)
+    assert np.allclose(data.predicted + data.predicted.T, 1)
+    assert np.isclose(data.predicted[0, 3], 0.75)
+    blocks = compress_blocks(data, block_size=3)
+    assert [(b["row"], b["col"]) for b in blocks] == [(0, 0), (3, 3)]
+    assert blocks[1]["wins"] == data.wins[3:, 3:].tolist()
+
+
+def test_export_head_to_head(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Only the requested number of top entries is exported."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    Path("docs/data").mkdir(parents=True)
+    Path("data").mkdir()
+    sample = generate_sample(20, 30, seed=0)
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(sample, f)
+    save_anime_store(
+        {
+            i: Anime(id=i, title=str(i))  # type: ignore[typeddict-item]
+            for i in get_anime_ids_from_sample(sample)
+        },
+        store_path="data/anime.sqlite",
+    )
+    initialise(sample_path="samples/*.json", timestamp="a")
+    iterate("a", num_iter=2, num_steps=1)
+    export_head_to_head("a", num=5, block_size=2)
+    with open("docs/data/h2h_20_0.json", encoding="utf8") as f:
+        data = json.load(f)
+    assert len(data["ids"]) == 5
+    assert data["parameters"] == sorted(data["parameters"], reverse=True)
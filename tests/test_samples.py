@@ -0,0 +1,39 @@
+"""Tests for the streaming of the sample files."""
+
+import io
+import json
+from pathlib import Path
+
+from pytest import raises
+
+from benchmarks.synthetic import generate_sample
+from utils import iter_json_object, load_samples, yield_samples
+
+
+def test_iter_json_object() -> None:
+    """Items are decoded across chunk boundaries, whatever the whitespace."""
+    data = {"1": [{"a": 1, "b": [1.5, "x y"]}], "22": [], "333": 12345, "4": "}"}
+    for text in (json.dumps(data), json.dumps(data, indent=4), " { } "):
+        for chunk_size in (1, 3, 7, 1024):
+            items = iter_json_object(io.StringIO(text), chunk_size=chunk_size)
+            assert dict(items) == json.loads(text)
+
+
+def test_iter_json_object_malformed() -> None:
+    """Truncated or malformed objects raise an error."""
+    for text in ('{"1": [1, 2', '{"1": [] "2": []}', "[]"):
+        with raises(ValueError):
+            list(iter_json_object(io.StringIO(text), chunk_size=4))
+
+
+def test_yield_samples(tmp_path: Path) -> None:
+    """The streamed users are those of the loaded samples."""
+    sample = generate_sample(30, 50, seed=1)
+    filenames = []
+    for i, users in enumerate((list(sample)[:10], list(sample)[10:])):
+        filenames.append(str(tmp_path / f"sample_{i}.json"))
+        with open(filenames[-1], "w", encoding="utf8") as f:
+            json.dump({u: sample[u] for u in users}, f)
+    streamed = dict(yield_samples(*filenames))
+    loaded = load_samples(*filenames)
+    assert streamed == {int(u): v for u, v in loaded.items()}
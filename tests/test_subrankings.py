@@ -0,0 +1,128 @@
+"""Tests for the rankings of subsets of anime."""
+
+import json
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+from numpy.typing import NDArray
+from pytest import MonkeyPatch
+
+import subrankings
+from anime_store import save_anime_store
+from benchmarks.synthetic import generate_sample
+from mal_rankings import initialise, iterate, rank_subsets
+from models import Anime
+from subrankings import fit_subset, parse_subset, select_subset, subset_name
+from utils import get_anime_ids_from_sample, iterate_parameter
+
+SCHEMA = Path(__file__).resolve().parent.parent / "src" / "queries" / "anime_schema.sql"
+
+
+def make_anime_db(path: str, anime_ids: list[int]) -> None:
+    """Store the anime with alternating media types, half of them from MAPPA."""
+    save_anime_store(
+        {i: Anime(id=i, title=f"Anime {i}") for i in anime_ids},  # type: ignore[typeddict-item]
+        store_path=path,
+    )
+    conn = sqlite3.connect(path)
+    with SCHEMA.open(encoding="utf-8") as f:
+        conn.executescript(f.read())
+    with conn:
+        conn.executemany(
+            """INSERT INTO anime (anime_id, title, created_at, updated_at, status,
+            media_type, start_season_year) VALUES (?, ?, '', '', '', ?, ?)""",
+            (
+                (i, f"Anime {i}", ("tv", "movie")[k % 2], 2019 + k % 3)
+                for k, i in enumerate(anime_ids)
+            ),
+        )
+        conn.execute("INSERT INTO studio VALUES (1, 'MAPPA')")
+        conn.executemany(
+            "INSERT INTO anime_studio VALUES (?, 1)", ((i,) for i in anime_ids[::2])
+        )
+    conn.close()
+
+
+def test_parse_subset() -> None:
+    """Subsets are given as comma-separated filters."""
+    filters = parse_subset("year=2019, media_type=tv")
+    assert filters == {"year": "2019", "media_type": "tv"}
+    assert subset_name(filters) == "media_type-tv_year-2019"
+    with pytest.raises(ValueError):
+        parse_subset("rating=pg")
+
+
+def test_select_subset(tmp_path: Path) -> None:
+    """Filters are intersected."""
+    path = str(tmp_path / "anime.sqlite")
+    make_anime_db(path, list(range(1, 13)))
+    conn = sqlite3.connect(path)
+    assert select_subset(conn, {"year": 2019, "media_type": "tv"}) == [1, 7]
+    assert select_subset(conn, {"studio": "MAPPA", "year": 2020}) == [5, 11]
+    conn.close()
+
+
+def test_fit_subset() -> None:
+    """The parameters of a subset are those fitted on its table alone."""
+    rng = np.random.default_rng(0)
+    table = rng.integers(0, 5, (8, 8)).astype(np.uint8)
+    np.fill_diagonal(table, 0)
+    table[6, :] = table[:, 6] = 0
+    indices = np.array([0, 2, 3, 5, 6])
+    kept, p = fit_subset(table, np.full(8, 1 / 8), indices, num_iter=2000)
+    assert np.array_equal(kept, [0, 2, 3, 5])
+    sub = table[np.ix_(kept, kept)]
+    expected = np.full(4, 1 / 4)
+    for _ in range(2000):
+        expected = iterate_parameter(p=expected, mt=sub + sub.T, w=sub.sum(axis=1))
+    assert np.allclose(p, expected)
+
+
+def test_fit_subset_single(monkeypatch: MonkeyPatch) -> None:
+    """In single precision, the fit stops once the max delta is near its rounding,
+    earlier than with a tolerance meant for double precision."""
+    rng = np.random.default_rng(0)
+    strength = rng.lognormal(size=400)
+    games = rng.poisson(30, size=(400, 400))
+    table = rng.binomial(games, strength[:, None] / np.add.outer(strength, strength))
+    np.fill_diagonal(table, 0)
+    steps = []
+
+    def counted(**kwargs: Any) -> NDArray[np.floating[Any]]:
+        steps.append(1)
+        return iterate_parameter(**kwargs)
+
+    monkeypatch.setattr(subrankings, "iterate_parameter", counted)
+    p = np.full(400, 1 / 400, dtype=np.float32)
+    _, tight = fit_subset(table, p, np.arange(400), num_iter=2000, tolerance=1e-12)
+    num_tight = len(steps)
+    _, fitted = fit_subset(table, p, np.arange(400), num_iter=2000)
+    assert fitted.dtype == np.float32
+    assert len(steps) - num_tight < num_tight
+    assert np.allclose(fitted, tight, rtol=1e-3)
+
+
+def test_rank_subsets(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Each subset is ranked among the anime of the run."""
+    monkeypatch.chdir(tmp_path)
+    Path("samples").mkdir()
+    sample = generate_sample(30, 20, seed=1)
+    with open("samples/sample_0.json", "w", encoding="utf8") as f:
+        json.dump(sample, f)
+    anime_ids = sorted(get_anime_ids_from_sample(sample))
+    initialise(sample_path="samples/*.json", timestamp="a")
+    iterate("a", num_iter=5, num_steps=1)
+    make_anime_db("data/anime.sqlite", anime_ids)
+    names = rank_subsets(
+        "a", [{"media_type": "tv"}, {"studio": "MAPPA"}], num_iter=5, num_workers=1
+    )
+    assert names == ["media_type-tv", "studio-mappa"]
+    with open("data/a_30/subsets/media_type-tv_5.json", encoding="utf8") as f:
+        ranked = json.load(f)
+    assert ranked
+    assert {x["mal_ID"] for x in ranked} <= set(anime_ids[::2])
+    parameters = [x["parameter"] for x in ranked]
+    assert parameters == sorted(parameters, reverse=True)
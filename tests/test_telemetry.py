@@ -0,0 +1,86 @@
+"""Tests for the convergence telemetry."""
+
+from pathlib import Path
+
+import numpy as np
+
+from telemetry import (
+    IterationRecord,
+    Telemetry,
+    default_tolerance,
+    estimate_convergence,
+    kendall_tau,
+    load_telemetry,
+)
+
+
+def test_kendall_tau() -> None:
+    """Identical orders have tau 1, reversed orders have tau -1."""
+    x = np.array([0.4, 0.3, 0.2, 0.1])
+    assert kendall_tau(x, x * 2) == 1
+    assert kendall_tau(x, -x) == -1
+
+
+def test_estimate_convergence() -> None:
+    """A geometric decrease is extrapolated to the tolerance."""
+    records = [
+        IterationRecord(
+            iteration=i,
+            seconds=0.5,
+            max_delta=10.0 ** (-i),
+            mean_delta=0,
+            log_likelihood=0,
+            kendall_tau=1,
+        )
+        for i in range(1, 11)
+    ]
+    estimate = estimate_convergence(records, tolerance=1e-15)
+    assert estimate["iterations_per_second"] == 2
+    assert np.isclose(estimate["rate"], 0.1)
+    assert np.isclose(estimate["iterations_left"], 5)
+    assert np.isclose(estimate["seconds_left"], 2.5)
+
+
+def test_estimate_converged() -> None:
+    """A run whose max delta reached 0 has no iterations left."""
+    records = [
+        IterationRecord(
+            iteration=i,
+            seconds=0.5,
+            max_delta=10.0 ** (-i) if i <= 30 else 0,
+            mean_delta=0,
+            log_likelihood=0,
+            kendall_tau=1,
+        )
+        for i in range(1, 301)
+    ]
+    estimate = estimate_convergence(records, tolerance=1e-8)
+    assert estimate["iterations_per_second"] == 2
+    assert estimate["iterations_left"] == estimate["seconds_left"] == 0
+
+
+def test_telemetry_log(tmp_path: Path) -> None:
+    """Records are appended to the log."""
+    mt = np.array([[0, 2], [2, 0]])
+    w = np.array([1, 1])
+    telemetry = Telemetry(str(tmp_path), mt, w)
+    p = np.array([0.5, 0.5])
+    telemetry.checkpoint(p)
+    telemetry.record(iteration=1, seconds=0.1, p_old=p, p_new=p)
+    telemetry.record(iteration=2, seconds=0.1, p_old=p, p_new=p)
+    telemetry.close()
+    records = load_telemetry(str(tmp_path))
+    assert [r["iteration"] for r in records] == [1, 2]
+    assert records[0]["max_delta"] == 0
+    assert np.isclose(records[0]["log_likelihood"], 2 * np.log(0.5))
+
+
+def test_default_tolerance(tmp_path: Path) -> None:
+    """The default tolerance depends on the precision of the latest parameters."""
+    assert np.isclose(default_tolerance(str(tmp_path)), np.sqrt(2.0**-52))
+    p = np.array([0.25, 0.75])
+    np.save(tmp_path / "parameter_10.npy", p / 2)
+    np.save(tmp_path / "parameter_100.npy", p)
+    assert np.isclose(default_tolerance(str(tmp_path)), 0.75 * np.sqrt(2.0**-52))
+    np.save(tmp_path / "parameter_200.npy", p.astype(np.float32))
+    assert np.isclose(default_tolerance(str(tmp_path)), 0.75 * np.sqrt(2.0**-23))
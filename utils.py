@@ -1,5 +1,6 @@
 """Functions used for the calculation of comparative MAL rankings."""
 
+import glob
 import json
 import logging
 import os
@@ -7,9 +8,11 @@ import pickle
 import random
 import re
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache, partial
 from itertools import combinations
-from typing import Any, Callable, Iterator
+from typing import Any, Callable, Iterator, TextIO
 
 import numpy as np
 import requests
@@ -19,8 +22,15 @@ from numpy.typing import NDArray
 from ratelimit import limits, sleep_and_retry
 from tqdm import tqdm
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from anime_store import ANIME_STORE, save_anime_store
 from models import Anime, UserList, UserListEntry
 
+os.makedirs("logs", exist_ok=True)
 logging.basicConfig(
     filename="logs/logs.log",
     format="%(asctime)s | %(levelname)-8s | %(name)s:%(lineno)d | %(message)s",
@@ -43,6 +53,15 @@ LEN_USERS = 8  # Number of digits
 MAL_ANIME = 60000  # As of January 2024
 # https://myanimelist.net/forum/?goto=post&topicid=140439&id=70370969 has highest entry 57847
 MIN_LIST_SIZE = 5  # Minimum number of anime watched/dropped to consider a user.
+BLOCK_SIZE = 256  # Rows of the table processed at once when iterating.
+STREAM_CHUNK_SIZE = 1 << 20  # Characters read at once when streaming samples.
+# Dtype of the parameters; single precision halves the memory traffic of an iteration.
+PRECISIONS = {"single": np.float32, "double": np.float64}
+DEFAULT_PRECISION = "double"
+KERNELS = ("numpy", "threads", "numba")  # Implementations of the MM denominator.
+# Comparison counts, fractional in tables with weighted users.
+Counts = NDArray[np.uint] | NDArray[np.float64]
+Kernel = Callable[[NDArray[np.floating[Any]], Counts], NDArray[np.float64]]
 LINK_USER_ID = "https://myanimelist.net/comments.php?id={}"
 LINK_ANIME_ID = (
     "https://api.myanimelist.net/v2/anime/{}?fields="
@@ -130,10 +149,11 @@ def get_all_anime(
     range_max: int = MAL_ANIME,
     valid_id_file: str = FILE_VALID_ANIME_ID,
     db_file: str = FILE_ANIME_DB,
+    store_path: str = ANIME_STORE,
 ) -> tuple[dict[str, dict[int, int]], dict[int, Anime]]:
     """Scrape all anime information.
 
-    Store list of valid IDs and anime data."""
+    Store list of valid IDs and anime data, and its projection in store_path."""
     id_list: list[int] = []
     anime_info: dict[int, Anime] = {}
     for anime_id in tqdm(range(range_min, range_max)):
@@ -154,6 +174,7 @@ def get_all_anime(
         pickle.dump(anime_list, f)
     with open(db_file, "wb") as f:
         pickle.dump(anime_info, f)
+    save_anime_store(anime_info, store_path=store_path)
     return anime_list, anime_info
 
 
@@ -287,24 +308,230 @@ def collect_sample(
     return sample
 
 
+def fill_denominator(
+    p: NDArray[np.floating[Any]],
+    mt: Counts,
+    s: NDArray[np.float64],
+    start: int,
+    stop: int,
+) -> None:
+    """Write sum_j{ mt_ij / (p_i + p_j) } into s[i] for the rows start <= i < stop.
+
+    The terms are computed in the precision of p and summed in double precision.
+    Rows are processed in blocks to bound the size of temporary arrays.
+    The rows of null parameters are nan when other parameters are null."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for begin in range(start, stop, BLOCK_SIZE):
+            block = slice(begin, min(begin + BLOCK_SIZE, stop))
+            terms = mt[block].astype(p.dtype) / (p[block, np.newaxis] + p)
+            s[block] = np.sum(terms, axis=1, dtype=np.float64)
+
+
+def compute_denominator(
+    p: NDArray[np.floating[Any]], mt: Counts
+) -> NDArray[np.float64]:
+    """Return the array of sum_j{ mt_ij / (p_i + p_j) }, see fill_denominator."""
+    s = np.empty(p.shape[0], dtype=np.float64)
+    fill_denominator(p, mt, s, 0, p.shape[0])
+    return s
+
+
+@lru_cache
+def get_thread_pool(num_threads: int) -> ThreadPoolExecutor:
+    """Return a thread pool kept alive across iterations."""
+    return ThreadPoolExecutor(max_workers=num_threads)
+
+
+def compute_denominator_threaded(
+    p: NDArray[np.floating[Any]], mt: Counts, num_threads: int
+) -> NDArray[np.float64]:
+    """Same as compute_denominator, with blocks of rows spread over threads.
+
+    NumPy releases the GIL while operating on a block."""
+    size = p.shape[0]
+    s = np.empty(size, dtype=np.float64)
+    list(
+        get_thread_pool(num_threads).map(
+            lambda start: fill_denominator(
+                p, mt, s, start, min(start + BLOCK_SIZE, size)
+            ),
+            range(0, size, BLOCK_SIZE),
+        )
+    )
+    return s
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _fill_denominator_jit(p, mt, s):  # type: ignore[no-untyped-def]
+        """Compiled loop of fill_denominator over all rows."""
+        size = p.shape[0]
+        for i in numba.prange(size):  # pylint: disable=not-an-iterable
+            total = 0.0
+            for j in range(size):
+                if mt[i, j]:
+                    total += mt[i, j] / (p[i] + p[j])
+            s[i] = total
+
+
+def compute_denominator_jit(
+    p: NDArray[np.floating[Any]], mt: Counts
+) -> NDArray[np.float64]:
+    """Same as compute_denominator, compiled with numba.
+
+    Pairs without comparisons are skipped, so no row is nan."""
+    s = np.empty(p.shape[0], dtype=np.float64)
+    _fill_denominator_jit(p, mt, s)
+    return s
+
+
+def get_kernel(name: str = "numpy", num_threads: int = 1) -> Kernel:
+    """Return the function computing the denominator of iterate_parameter.
+
+    name is one of KERNELS. If numba is not installed, threads are used instead."""
+    if name == "numba" and numba is None:
+        logging.warning("numba is not available, using threads")
+        print("numba is not available, using threads")
+        name = "threads"
+    if name == "numba":
+        numba.set_num_threads(min(num_threads, numba.config.NUMBA_NUM_THREADS))
+        return compute_denominator_jit
+    if name == "threads" and num_threads > 1:
+        return partial(compute_denominator_threaded, num_threads=num_threads)
+    return compute_denominator
+
+
 def iterate_parameter(
-    p: NDArray[np.single], mt: NDArray[np.uint], w: NDArray[np.uint]
-) -> NDArray[np.single]:
+    p: NDArray[np.floating[Any]],
+    mt: Counts,
+    w: Counts,
+    kernel: Kernel = compute_denominator,
+) -> NDArray[np.floating[Any]]:
     """Return the next approximation of the parameters of the Bradley-Terry model.
 
     Arguments:
-        p: Array of parameters.
+        p: Array of parameters, whose dtype sets the precision (see PRECISIONS).
         mt: Sum of the matrix of results and its transpose.
         w: Array of weights, i.e. sum of each row of the original table.
+            Counts may be fractional, as in tables with weighted users.
+        kernel: Function computing the denominator, see get_kernel.
 
     p'_i = w_i / sum_j{ mt_ij / (p_i + p_j) }
     """
-    s = np.fromiter(
-        iter=(1 if w[i] == 0 else sum(mt[i] / (p[i] + p)) for i in range(p.shape[0])),
-        dtype=np.single,
-    )
+    s = kernel(p, mt)
+    # Rows with no wins have a null parameter.
+    s[w == 0] = 1
     p_new = w / s
-    return p_new / sum(p_new)
+    return (p_new / np.sum(p_new)).astype(p.dtype)
+
+
+def log_sum_exp(x: NDArray[np.floating[Any]], axis: int = -1) -> NDArray[np.float64]:
+    """Return log(sum(exp(x))) along the given axis without overflow or underflow.
+
+    Slices where every value is -inf give -inf."""
+    m = np.amax(x, axis=axis, keepdims=True)
+    m[~np.isfinite(m)] = 0
+    with np.errstate(divide="ignore"):
+        return np.squeeze(m, axis=axis) + np.log(np.sum(np.exp(x - m), axis=axis))
+
+
+def log_pair_terms(
+    theta: NDArray[np.floating[Any]], mt: Counts, block: slice
+) -> NDArray[np.float64]:
+    """Return log(mt_ij / (p_i + p_j)) for the rows in block, with theta = log(p).
+
+    Pairs without comparisons are -inf."""
+    rows = mt[block]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            rows > 0,
+            np.log(rows, dtype=np.float64)
+            - np.logaddexp(theta[block, np.newaxis], theta),
+            -np.inf,
+        )
+
+
+def iterate_log_parameter(
+    theta: NDArray[np.float64], mt: Counts, w: Counts
+) -> NDArray[np.float64]:
+    """Return the next approximation of the log-parameters of the Bradley-Terry model.
+
+    Same as iterate_parameter, with theta = log(p), normalised so that the
+    parameters sum to 1. Tiny parameters keep their precision.
+    Rows with no wins are -inf."""
+    log_s = np.zeros(theta.shape[0])
+    for start in range(0, theta.shape[0], BLOCK_SIZE):
+        block = slice(start, start + BLOCK_SIZE)
+        log_s[block] = log_sum_exp(log_pair_terms(theta, mt, block), axis=1)
+    log_s[w == 0] = 0
+    with np.errstate(divide="ignore"):
+        theta_new = np.log(w, dtype=np.float64) - log_s
+    return theta_new - log_sum_exp(theta_new)
+
+
+def log_likelihood(p: NDArray[np.floating[Any]], mt: Counts, w: Counts) -> float:
+    """Return the log-likelihood of the parameters of the Bradley-Terry model.
+
+    Arguments are as in iterate_parameter.
+
+    L(p) = sum_i{ w_i log(p_i) } - sum_{i<j}{ mt_ij log(p_i + p_j) }
+    """
+    # Null parameters only appear in terms masked out by the counts.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        total = float(np.sum(w * np.log(p), where=w > 0))
+        for start in range(0, p.shape[0], BLOCK_SIZE):
+            block = slice(start, start + BLOCK_SIZE)
+            rows = mt[block]
+            pairs = np.sum(rows * np.log(p[block, np.newaxis] + p), where=rows > 0)
+            # Each pair appears twice in the symmetric matrix.
+            total -= float(pairs) / 2
+    return total
+
+
+def log_likelihood_log(
+    theta: NDArray[np.floating[Any]], mt: Counts, w: Counts
+) -> float:
+    """Return the log-likelihood of the Bradley-Terry model with theta = log(p)."""
+    with np.errstate(invalid="ignore"):
+        total = float(np.sum(w * theta, where=w > 0))
+        for start in range(0, theta.shape[0], BLOCK_SIZE):
+            block = slice(start, start + BLOCK_SIZE)
+            rows = mt[block]
+            pairs = np.sum(
+                rows * np.logaddexp(theta[block, np.newaxis], theta), where=rows > 0
+            )
+            total -= float(pairs) / 2
+    return total
+
+
+def log_likelihood_gradient(
+    p: NDArray[np.floating[Any]],
+    mt: Counts,
+    w: Counts,
+    log_space: bool = False,
+) -> NDArray[np.float64]:
+    """Return the gradient of the log-likelihood of the Bradley-Terry model.
+
+    dL/dp_i = w_i / p_i - sum_j{ mt_ij / (p_i + p_j) }
+
+    If log_space is True, return the gradient with respect to theta = log(p),
+    i.e. w_i - p_i * sum_j{ mt_ij / (p_i + p_j) }, which is bounded for tiny p_i.
+    The fixed points of iterate_parameter are the zeros of the gradient.
+    Rows with no wins are at their optimum p_i = 0 and have null gradient."""
+    s = compute_denominator(p, mt)
+    s[w == 0] = 0
+    if log_space:
+        return w - p * s
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(w > 0, w / p, 0) - s
+
+
+def is_improving(previous: float, current: float, rtol: float = 1e-12) -> bool:
+    """Return whether a step did not decrease the log-likelihood.
+
+    Decreases within the relative tolerance are attributed to rounding."""
+    return current >= previous - rtol * abs(previous)
 
 
 def load_id_to_order_map() -> dict[int, int]:
@@ -314,6 +541,66 @@ def load_id_to_order_map() -> dict[int, int]:
     return id_to_order
 
 
+def build_id_lookup(anime_ids: NDArray[np.integer[Any]]) -> NDArray[np.int32]:
+    """Return the dense array mapping each anime ID to its position in anime_ids.
+
+    IDs not in anime_ids map to -1. The array covers at least IDs up to MAL_ANIME."""
+    size = max(MAL_ANIME, int(np.amax(anime_ids, initial=0))) + 1
+    lookup = np.full(size, -1, dtype=np.int32)
+    lookup[anime_ids] = np.arange(anime_ids.shape[0], dtype=np.int32)
+    return lookup
+
+
+def translate_ids(
+    lookup: NDArray[np.int32], anime_ids: NDArray[np.integer[Any]]
+) -> NDArray[np.int32]:
+    """Return the indices of the given anime IDs in a lookup, -1 for missing ones."""
+    inside = (anime_ids >= 0) & (anime_ids < lookup.shape[0])
+    return np.where(inside, lookup[np.where(inside, anime_ids, 0)], -1)
+
+
+def save_id_maps(
+    path: str, anime_ids: NDArray[np.integer[Any]], prefix: str = ""
+) -> None:
+    """Save the anime IDs of the indices of a run, and their inverse lookup.
+
+    They are stored in <prefix>map_order_id.npy and <prefix>map_id_order.npy."""
+    with open(f"{path}/{prefix}map_order_id.npy", "wb") as f:
+        np.save(f, np.asarray(anime_ids, dtype=np.int32))
+    with open(f"{path}/{prefix}map_id_order.npy", "wb") as f:
+        np.save(f, build_id_lookup(anime_ids))
+
+
+def get_last_checkpoint(path: str, prefix: str = "parameter") -> tuple[int, str] | None:
+    """Return the number of iterations and the file of the latest checkpoint."""
+    checkpoints = []
+    for filename in glob.glob(f"{path}/{prefix}_*.npy"):
+        match = re.fullmatch(rf"{prefix}_(\d+)\.npy", os.path.basename(filename))
+        if match:
+            checkpoints.append((int(match[1]), filename))
+    return max(checkpoints, default=None)
+
+
+def load_id_maps(
+    path: str, prefix: str = ""
+) -> tuple[NDArray[np.int32], NDArray[np.int32]]:
+    """Return the anime IDs of the indices of a run and their inverse lookup.
+
+    Runs prepared before the arrays were introduced have pickled dicts instead."""
+    if not os.path.exists(f"{path}/{prefix}map_order_id.npy"):
+        with open(f"{path}/{prefix}map_order_id", "rb") as f:
+            order_to_id = pickle.load(f)
+        anime_ids = np.array(
+            [order_to_id[i] for i in range(len(order_to_id))], dtype=np.int32
+        )
+        return anime_ids, build_id_lookup(anime_ids)
+    with open(f"{path}/{prefix}map_order_id.npy", "rb") as f:
+        anime_ids = np.load(f)
+    with open(f"{path}/{prefix}map_id_order.npy", "rb") as f:
+        lookup = np.load(f)
+    return anime_ids, lookup
+
+
 def filter_entry(
     id_to_order: dict[int, int], entry: UserListEntry
 ) -> tuple[int, str, int]:
@@ -351,7 +638,8 @@ def create_table(
 ) -> NDArray[np.uint]:
     """Return the table used for the Bradley-Terry model for the given sample."""
     print("Initialising table")
-    matrix = np.zeros((size, size), dtype=np.uint)
+    # Each user compares a pair at most once, so matrix + matrix.T fits too.
+    matrix = np.zeros((size, size), dtype=count_dtype(len(sample)))
     with tqdm(total=len(sample)) as progress_bar:
         for num, mal in sample.items():
             progress_bar.set_description(f"Processing user {num:{LEN_USERS}}")
@@ -375,6 +663,61 @@ def create_table(
     return matrix
 
 
+def count_dtype(max_count: int) -> np.dtype[Any]:
+    """Return the smallest unsigned integer dtype holding counts up to max_count."""
+    return np.min_scalar_type(max_count)
+
+
+def shrink_counts(counts: Counts) -> Counts:
+    """Return integer counts in the smallest dtype holding them.
+
+    Fractional counts are returned as they are."""
+    if not np.issubdtype(counts.dtype, np.integer):
+        return counts
+    return counts.astype(count_dtype(int(np.amax(counts, initial=0))), copy=False)
+
+
+def pack_symmetric(matrix: NDArray[Any]) -> NDArray[Any]:
+    """Return the entries above the diagonal of a square matrix, row by row.
+
+    Rows are copied one at a time to avoid large index arrays."""
+    size = matrix.shape[0]
+    packed = np.empty(size * (size - 1) // 2, dtype=matrix.dtype)
+    start = 0
+    for i in range(size - 1):
+        packed[start : start + size - i - 1] = matrix[i, i + 1 :]
+        start += size - i - 1
+    return packed
+
+
+def unpack_symmetric(packed: NDArray[Any]) -> NDArray[Any]:
+    """Return the symmetric matrix with null diagonal from its packed upper triangle."""
+    size = round((1 + np.sqrt(1 + 8 * packed.shape[0])) / 2)
+    matrix = np.zeros((size, size), dtype=packed.dtype)
+    start = 0
+    for i in range(size - 1):
+        row = packed[start : start + size - i - 1]
+        matrix[i, i + 1 :] = row
+        matrix[i + 1 :, i] = row
+        start += size - i - 1
+    return matrix
+
+
+def save_symmetric(filename: str, matrix: NDArray[Any]) -> None:
+    """Save a symmetric matrix with null diagonal as its packed upper triangle."""
+    with open(filename, "wb") as f:
+        np.save(f, pack_symmetric(matrix))
+
+
+def load_symmetric(filename: str) -> NDArray[Any]:
+    """Load a symmetric matrix saved by save_symmetric.
+
+    Matrices saved in full are returned as they are."""
+    with open(filename, "rb") as f:
+        array = np.load(f)
+    return unpack_symmetric(array) if array.ndim == 1 else array
+
+
 def delete_row_cols(matrix: NDArray[np.uint], indices: list[int]) -> NDArray[np.uint]:
     """Return the given matrix reduced by removing a given set of indices."""
     ans = np.take(matrix, indices, 0)
@@ -382,36 +725,87 @@ def delete_row_cols(matrix: NDArray[np.uint], indices: list[int]) -> NDArray[np.
     return ans
 
 
+def reachable(
+    adjacency: NDArray[np.bool_], start: int, reverse: bool = False
+) -> NDArray[np.bool_]:
+    """Return the mask of the nodes reachable from start in a directed graph.
+
+    If reverse is True, return the nodes from which start can be reached instead."""
+    visited = np.zeros(adjacency.shape[0], dtype=bool)
+    visited[start] = True
+    frontier = visited.copy()
+    while frontier.any():
+        if reverse:
+            frontier = adjacency[:, frontier].any(axis=1) & ~visited
+        else:
+            frontier = adjacency[frontier].any(axis=0) & ~visited
+        visited |= frontier
+    return visited
+
+
+def main_component(matrix: NDArray[np.uint]) -> NDArray[np.bool_]:
+    """Return the mask of the main strongly connected component of the win graph.
+
+    Entry i has an edge towards entry j if i won against j at least once.
+    The main component is the one containing the entry with the most comparisons;
+    outside a strongly connected component the maximum likelihood estimate
+    does not exist, and the iteration drifts towards zero."""
+    adjacency = matrix > 0
+    start = int(np.argmax(np.sum(matrix, axis=0) + np.sum(matrix, axis=1)))
+    return reachable(adjacency, start) & reachable(adjacency, start, reverse=True)
+
+
+def count_lists(
+    sample: dict[int, UserList], io_map: dict[int, int], size: int
+) -> NDArray[np.int_]:
+    """Return the number of lists where each anime is completed or dropped."""
+    counter = Counter[int]()
+    for _, user_list in sample.items():
+        for entry in user_list:
+            if entry["list_status"]["status"] in {"completed", "dropped"}:
+                counter[io_map[entry["node"]["id"]]] += 1
+    list_counts = np.zeros(size, dtype=np.int_)
+    for i, num in counter.items():
+        list_counts[i] = num
+    return list_counts
+
+
 def setup_bradley_terry(
-    matrix: NDArray[np.uint],
+    matrix: Counts,
     sample: dict[int, UserList],
     io_map: dict[int, int],
     cutoff: int = 0,
     curb: int = 0,
-) -> tuple[
-    NDArray[np.single],
-    NDArray[np.uint],
-    NDArray[np.uint],
-    dict[int, int],
-    dict[int, int],
-]:
-    """Return the arrays needed to compute the parameters from the given table."""
+    connected: bool = False,
+    precision: str = DEFAULT_PRECISION,
+    list_counts: NDArray[np.int_] | None = None,
+) -> tuple[NDArray[np.floating[Any]], Counts, Counts, dict[int, int], dict[int, int]]:
+    """Return the arrays needed to compute the parameters from the given table.
+
+    If connected is True, only keep the main strongly connected component
+    of the entries left after applying cutoff and curb.
+    The parameters have the dtype of the given precision (see PRECISIONS).
+    If list_counts (see count_lists) is given, sample and io_map are not used.
+    Integer counts are stored in the smallest dtype holding them."""
     print("Constructing arrays")
     mt = matrix + matrix.transpose()
-    counter = Counter[int]()
-    for _, user_list in sample.items():
-        for entry in user_list:
-            if entry["list_status"]["status"] in {"completed", "dropped"}:
-                counter[io_map[entry["node"]["id"]]] += 1
+    if list_counts is None:
+        list_counts = count_lists(sample, io_map, matrix.shape[0])
     sums = np.sum(mt, axis=0)
-    indices = [i for i, x in enumerate(sums) if x > cutoff and counter[i] >= curb]
+    indices = np.flatnonzero((sums > cutoff) & (list_counts >= curb)).tolist()
+    if connected and indices:
+        component = main_component(delete_row_cols(matrix, indices))
+        print(
+            f"Dropped {len(indices) - np.sum(component)} entries outside the main component"
+        )
+        indices = [indices[i] for i in np.flatnonzero(component)]
     new_to_old = dict(enumerate(indices))
     old_to_new = {j: i for i, j in enumerate(indices)}
     matrix = delete_row_cols(matrix, indices)
     mt = delete_row_cols(mt, indices)
-
-    w: NDArray[np.uint] = np.sum(matrix, axis=1)
-    p: NDArray[np.single] = np.ones(w.shape, dtype=float) / w.shape[0]
+    mt = shrink_counts(mt)
+    w = shrink_counts(np.sum(matrix, axis=1))
+    p = (np.ones(w.shape) / w.shape[0]).astype(PRECISIONS[precision])
     print("Setup completed")
     return p, mt, w, old_to_new, new_to_old
 
@@ -428,13 +822,80 @@ def load_samples(*filenames: str) -> dict[int, UserList]:
     return sample
 
 
-def yield_samples(*filenames: str) -> Iterator[dict[int, UserList]]:
-    """Yield samples from JSON files.
+def iter_json_object(
+    f: TextIO, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[tuple[str, Any]]:
+    """Yield the items of the JSON object in a file one at a time.
 
-    This assumes that all samples are disjoint."""
-    for filename in tqdm(filenames):
+    The file is read in chunks, so only the item being decoded is kept in memory."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+
+    def read_more() -> bool:
+        nonlocal buffer, position
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def peek() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                raise ValueError("Unexpected end of the JSON object")
+
+    def expect(*tokens: str) -> str:
+        nonlocal position
+        token = peek()
+        if token not in tokens:
+            raise ValueError(f"Expected {' or '.join(tokens)} at {token!r}")
+        position += 1
+        return token
+
+    def decode() -> Any:
+        nonlocal position
+        peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The value continues in the next chunk.
+                if read_more():
+                    continue
+                raise
+            # A number could also continue in the next chunk.
+            if end == len(buffer) and read_more():
+                continue
+            position = end
+            return value
+
+    expect("{")
+    if peek() == "}":
+        return
+    while True:
+        key = decode()
+        expect(":")
+        yield key, decode()
+        if expect(",", "}") == "}":
+            return
+
+
+def yield_samples(*filenames: str) -> Iterator[tuple[int, UserList]]:
+    """Yield the users of the samples in JSON files one at a time, with their lists.
+
+    Files are parsed incrementally, so memory does not grow with their size.
+    File names are sorted as in load_samples; users are not deduplicated."""
+    for filename in tqdm(sorted(filenames)):
         with open(file=filename, encoding="utf8") as f:
-            yield json.load(f)
+            for user_id, user_list in iter_json_object(f):
+                yield int(user_id), user_list
 
 
 def get_anime_ids_from_sample(sample: dict[int, UserList]) -> set[int]: